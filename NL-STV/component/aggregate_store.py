@@ -0,0 +1,441 @@
+"""
+行程数据预聚合存储 (Aggregate Store)
+
+流式扫描一次 parquet, 构建稠密的 NumPy 立方体并保存在数据文件旁边:
+    pu_count         (day, hour, PU)      上车订单数
+    pu_fare_sum      (day, hour, PU)      fare_amount 之和
+    pu_distance_sum  (day, hour, PU)      trip_distance 之和
+    od_count         (hour, PU, DO)       起终点订单数 (OD 不再带 day 维, 否则约 52M 个格子)
+    pu_slot_count    (slot, PU)           每 15 分钟时段的上车订单数 (全月汇总, 96 个时段)
+
+区域维度直接用 LocationID 作下标 (0 空置, 1-265 有效)。
+源 parquet 的 mtime 或哈希变化时, load_aggregates() 会自动重建。
+立方体基于读取层清洗后的数据 (见 cleaning.py), meta 中记录原始行数、丢弃行数与各规则的命中数。
+
+对于不断追加文件的数据目录 (每月新文件或每日增量), update_dataset_aggregates()
+只扫描新文件并把计数与加和累加到对应月份的立方体上, 已应用的文件记录在 manifest 中;
+每次更新生成一个新版本目录, 未变化的月份以硬链接复用, 最后原子替换 manifest:
+    <root>/_aggregates/manifest.json
+    <root>/_aggregates/v<版本>/<YYYY-MM>/*.npy
+"""
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from functools import partial
+
+import numpy as np
+
+# pandas / pyarrow 只在重建立方体时需要, 延迟到构建函数中导入, 只读取产物的页面不必加载它们
+
+FORMAT_VERSION = 3  # 3: 立方体基于清洗后的数据
+
+N_ZONES = 266  # LocationID 1-265, 下标即 ID
+N_HOURS = 24
+N_DAYS = 31
+N_SLOTS = 96  # 一天中的 15 分钟时段
+
+CUBE_NAMES = ('pu_count', 'pu_fare_sum', 'pu_distance_sum', 'od_count', 'pu_slot_count')
+META_FILE = 'meta.json'
+DATASET_STORE_DIR = '_aggregates'
+MANIFEST_FILE = 'manifest.json'
+KEEP_VERSIONS = 2  # 旧版本保留一份, 正在读取旧版本的进程不受影响
+
+
+def _infer_month(parquet_path):
+    """从文件名 (如 yellow_tripdata_2025-01.parquet) 或分区目录 (year=2025/month=01) 推断数据所属年月"""
+    from .data_loader import parse_data_file
+    data_file = parse_data_file(parquet_path)
+    if data_file.year is not None and data_file.month is not None:
+        return data_file.year, data_file.month
+    return None
+
+
+class TripAggregator:
+    """增量聚合器: 逐块调用 update(df), 最后用 result() 取出立方体"""
+
+    columns = ['tpep_pickup_datetime', 'PULocationID', 'DOLocationID', 'fare_amount', 'trip_distance']
+
+    def __init__(self, year=None, month=None):
+        self.year = year
+        self.month = month
+        self.rows_seen = 0
+        self.rows_dropped = 0
+        self._pu_size = N_DAYS * N_HOURS * N_ZONES
+        self._od_size = N_HOURS * N_ZONES * N_ZONES
+        self.pu_count = np.zeros(self._pu_size, dtype=np.int64)
+        self.pu_fare_sum = np.zeros(self._pu_size, dtype=np.float64)
+        self.pu_distance_sum = np.zeros(self._pu_size, dtype=np.float64)
+        self.od_count = np.zeros(self._od_size, dtype=np.int64)
+        self.pu_slot_count = np.zeros(N_SLOTS * N_ZONES, dtype=np.int64)
+
+    def update(self, df):
+        if df.empty:
+            return
+        import pandas as pd
+        ts = pd.to_datetime(df['tpep_pickup_datetime'])
+        if self.year is None:
+            # 文件名中没有年月时, 以第一块数据的众数月份为准
+            mode = ts.dt.to_period('M').mode()[0]
+            self.year, self.month = mode.year, mode.month
+
+        pu = df['PULocationID'].to_numpy(dtype=np.int64, na_value=0)
+        do = df['DOLocationID'].to_numpy(dtype=np.int64, na_value=0)
+        keep = ((ts.dt.year == self.year) & (ts.dt.month == self.month)).to_numpy()
+        keep = keep & (pu > 0) & (pu < N_ZONES) & (do > 0) & (do < N_ZONES)
+
+        self.rows_seen += len(df)
+        self.rows_dropped += int(len(df) - keep.sum())
+
+        day = ts.dt.day.to_numpy()[keep] - 1
+        hour = ts.dt.hour.to_numpy()[keep]
+        minute = ts.dt.minute.to_numpy()[keep]
+        pu, do = pu[keep], do[keep]
+        fare = df['fare_amount'].to_numpy(dtype=np.float64, na_value=0.0)[keep]
+        distance = df['trip_distance'].to_numpy(dtype=np.float64, na_value=0.0)[keep]
+
+        # 打包成一维下标后用 bincount 聚合, 比 groupby 快得多
+        pu_key = (day * N_HOURS + hour) * N_ZONES + pu
+        self.pu_count += np.bincount(pu_key, minlength=self._pu_size)
+        self.pu_fare_sum += np.bincount(pu_key, weights=fare, minlength=self._pu_size)
+        self.pu_distance_sum += np.bincount(pu_key, weights=distance, minlength=self._pu_size)
+
+        od_key = (hour * N_ZONES + pu) * N_ZONES + do
+        self.od_count += np.bincount(od_key, minlength=self._od_size)
+
+        slot_key = (hour * 4 + minute // 15) * N_ZONES + pu
+        self.pu_slot_count += np.bincount(slot_key, minlength=N_SLOTS * N_ZONES)
+
+    def merge(self, other):
+        """合并另一个聚合器 (如并行进程中的部分结果)"""
+        if self.year is None:
+            self.year, self.month = other.year, other.month
+        self.rows_seen += other.rows_seen
+        self.rows_dropped += other.rows_dropped
+        for name in CUBE_NAMES:
+            np.add(getattr(self, name), getattr(other, name), out=getattr(self, name))
+        return self
+
+    def result(self):
+        pu_shape = (N_DAYS, N_HOURS, N_ZONES)
+        return {
+            'pu_count': self.pu_count.astype(np.uint32).reshape(pu_shape),
+            'pu_fare_sum': self.pu_fare_sum.reshape(pu_shape),
+            'pu_distance_sum': self.pu_distance_sum.reshape(pu_shape),
+            'od_count': self.od_count.astype(np.uint32).reshape(N_HOURS, N_ZONES, N_ZONES),
+            'pu_slot_count': self.pu_slot_count.astype(np.uint32).reshape(N_SLOTS, N_ZONES),
+        }
+
+
+@dataclass
+class AggregateStore:
+    year: int
+    month: int
+    pu_count: np.ndarray
+    pu_fare_sum: np.ndarray
+    pu_distance_sum: np.ndarray
+    od_count: np.ndarray
+    pu_slot_count: np.ndarray
+    meta: dict = field(default_factory=dict)
+
+    def zone_totals(self):
+        """每个区域全月上车总数, 形状 (N_ZONES,)"""
+        return self.pu_count.sum(axis=(0, 1), dtype=np.int64)
+
+    def hourly_pickups(self):
+        """小时 × 区域 上车数, 形状 (24, N_ZONES)"""
+        return self.pu_count.sum(axis=0, dtype=np.int64)
+
+    def zone_hourly(self, zone_id):
+        """单个区域的 24 小时上车数"""
+        return self.pu_count[:, :, zone_id].sum(axis=0, dtype=np.int64)
+
+    def od_matrix(self, hours=None):
+        """起终点矩阵 (PU, DO), hours 为空时汇总全天"""
+        cube = self.od_count if hours is None else self.od_count[list(hours)]
+        return cube.sum(axis=0, dtype=np.int64)
+
+
+def store_path(parquet_path):
+    """聚合结果保存在数据文件旁边: yellow_tripdata_2025-01.agg/"""
+    root, _ = os.path.splitext(os.path.abspath(parquet_path))
+    return root + '.agg'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _read_meta(out_dir):
+    meta_path = os.path.join(out_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(out_dir, meta):
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+def is_fresh(parquet_path, meta):
+    """mtime/大小未变视为有效; mtime 变了再比较哈希, 内容一致则只刷新 mtime"""
+    if meta is None or meta.get('format_version') != FORMAT_VERSION:
+        return False
+    stat = os.stat(parquet_path)
+    if meta['source_mtime'] == stat.st_mtime and meta['source_size'] == stat.st_size:
+        return True
+    if meta['source_size'] != stat.st_size:
+        return False
+    if file_digest(parquet_path) != meta['source_sha256']:
+        return False
+    meta['source_mtime'] = stat.st_mtime
+    _write_meta(store_path(parquet_path), meta)
+    return True
+
+
+def _aggregate_file(path, year, month, workers=1):
+    """
+    扫描一个文件 (经过默认清洗规则) 得到 TripAggregator 与 CleaningReport;
+    workers > 1 且年月已知时按 row group 多进程并行。
+    """
+    from .cleaning import CleaningReport
+    from .data_loader import aggregate_files
+    report = CleaningReport()
+    if workers != 1 and year is not None:
+        from .parallel_agg import parallel_aggregate  # parallel_agg 依赖本模块的常量
+        agg = parallel_aggregate(path, partial(TripAggregator, year, month), workers=workers, report=report)
+        return agg, report
+    agg = TripAggregator(year, month)
+    aggregate_files(path, agg, report=report)
+    return agg, report
+
+
+def _row_stats(agg, report):
+    """原始行数、丢弃行数 (清洗 + 聚合器自身的检查) 与各清洗规则的命中数"""
+    return {'rows_seen': report.rows_in, 'rows_dropped': report.dropped + agg.rows_dropped,
+            'dropped_by_rule': dict(report.by_rule)}
+
+
+def _add_row_stats(total, stats):
+    total['rows_seen'] += stats['rows_seen']
+    total['rows_dropped'] += stats['rows_dropped']
+    by_rule = total.setdefault('dropped_by_rule', {})
+    for rule, count in stats['dropped_by_rule'].items():
+        by_rule[rule] = by_rule.get(rule, 0) + count
+
+
+def build_aggregates(parquet_path, workers=1):
+    """按 row group 流式扫描一次 parquet, 构建所有立方体并写入磁盘"""
+    month = _infer_month(parquet_path) or (None, None)
+    agg, report = _aggregate_file(parquet_path, *month, workers=workers)
+
+    stat = os.stat(parquet_path)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'source': os.path.basename(parquet_path),
+        'source_mtime': stat.st_mtime,
+        'source_size': stat.st_size,
+        'source_sha256': file_digest(parquet_path),
+        'year': agg.year,
+        'month': agg.month,
+        **_row_stats(agg, report),
+    }
+    cubes = agg.result()
+
+    # 先写临时目录再替换, 避免读到写了一半的结果
+    out_dir = store_path(parquet_path)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in CUBE_NAMES:
+        np.save(os.path.join(tmp_dir, name + '.npy'), cubes[name])
+    _write_meta(tmp_dir, meta)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return AggregateStore(year=agg.year, month=agg.month, meta=meta, **cubes)
+
+
+def load_aggregates(parquet_path, mmap=False):
+    """读取预聚合结果, 不存在或已过期时自动重建; 传入目录时读取数据集的最新版本"""
+    if os.path.isdir(parquet_path):
+        return load_dataset_aggregates(parquet_path, mmap=mmap)
+    out_dir = store_path(parquet_path)
+    meta = _read_meta(out_dir)
+    if not is_fresh(parquet_path, meta):
+        return build_aggregates(parquet_path)
+
+    mmap_mode = 'r' if mmap else None
+    cubes = {name: np.load(os.path.join(out_dir, name + '.npy'), mmap_mode=mmap_mode) for name in CUBE_NAMES}
+    return AggregateStore(year=meta['year'], month=meta['month'], meta=meta, **cubes)
+
+
+def artifact_dir(parquet_path, meta):
+    """派生产物 (如 OD 索引) 的存放目录: 与立方体放在同一目录, 立方体重建或发布新版本时随之失效"""
+    if os.path.isdir(parquet_path):
+        return _version_dir(parquet_path, meta['version'])
+    return store_path(parquet_path)
+
+
+# --- 数据目录的增量维护 ---
+
+def dataset_store_path(root):
+    return os.path.join(root, DATASET_STORE_DIR)
+
+
+def read_manifest(root):
+    path = os.path.join(dataset_store_path(root), MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') == FORMAT_VERSION:
+            return manifest
+    return {'format_version': FORMAT_VERSION, 'version': 0, 'files': {}, 'months': {}}
+
+
+def dataset_version(root):
+    """当前已发布的版本号, 0 表示尚未构建"""
+    return read_manifest(root)['version']
+
+
+def _version_dir(root, version):
+    return os.path.join(dataset_store_path(root), f'v{version}')
+
+
+def _zero_cubes():
+    return {name: np.zeros_like(cube, dtype=np.float64 if cube.dtype.kind == 'f' else np.int64)
+            for name, cube in TripAggregator().result().items()}
+
+
+def _month_key(year, month):
+    return f"{year}-{month:02d}"
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def update_dataset_aggregates(root, paths=None, workers=1):
+    """
+    把新增的 parquet 文件合并进数据目录的预聚合结果, 返回新的 manifest。
+
+    新文件只扫描一次, 结果直接累加到所属月份上; 已应用的文件被修改或删除时,
+    无法从累加结果中减掉, 只重建受影响的月份。没有变化时不生成新版本。
+    """
+    from .data_loader import discover_files, parse_data_file
+    manifest = read_manifest(root)
+    if paths is None:
+        paths = [f.path for f in discover_files(root)]
+    current = {os.path.relpath(p, root): p for p in paths}
+    applied = manifest['files']
+
+    def changed(rel):
+        stat = os.stat(current[rel])
+        return applied[rel]['size'] != stat.st_size or applied[rel]['mtime'] != stat.st_mtime
+
+    new = [rel for rel in current if rel not in applied]
+    modified = [rel for rel in current if rel in applied and changed(rel)]
+    removed = [rel for rel in applied if rel not in current]
+    if not (new or modified or removed):
+        return manifest
+
+    # 受影响的月份从头重建: 该月所有仍存在的文件都要重新扫描
+    dirty = {applied[rel]['month'] for rel in modified + removed}
+    rescan = [rel for rel in current if rel in applied and applied[rel]['month'] in dirty and rel not in modified]
+    files = {rel: entry for rel, entry in applied.items() if rel in current and entry['month'] not in dirty}
+    months = {key: dict(info) for key, info in manifest['months'].items() if key not in dirty}
+
+    old_dir = _version_dir(root, manifest['version'])
+    touched = {}
+    for rel in sorted(new + modified + rescan):
+        data_file = parse_data_file(current[rel], root)
+        agg, report = _aggregate_file(current[rel], data_file.year, data_file.month, workers)
+        if agg.year is None:
+            continue  # 空文件
+        key = _month_key(agg.year, agg.month)
+        if key not in touched:
+            touched[key] = _zero_cubes()
+            if key in months:
+                # 在上一版本的基础上累加
+                for name in CUBE_NAMES:
+                    touched[key][name] += np.load(os.path.join(old_dir, key, name + '.npy'))
+            months.setdefault(key, {'year': agg.year, 'month': agg.month, 'rows_seen': 0, 'rows_dropped': 0})
+        for name, cube in agg.result().items():
+            touched[key][name] += cube
+        stats = _row_stats(agg, report)
+        _add_row_stats(months[key], stats)
+        stat = os.stat(current[rel])
+        files[rel] = {'month': key, 'size': stat.st_size, 'mtime': stat.st_mtime, **stats}
+
+    # 写新版本: 变化的月份写新文件, 其余月份硬链接上一版本
+    version = manifest['version'] + 1
+    new_dir = _version_dir(root, version)
+    tmp_dir = new_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for key, info in months.items():
+        month_dir = os.path.join(tmp_dir, key)
+        os.makedirs(month_dir)
+        for name in CUBE_NAMES:
+            target = os.path.join(month_dir, name + '.npy')
+            if key in touched:
+                cube = touched[key][name]
+                np.save(target, cube if cube.dtype.kind == 'f' else cube.astype(np.uint32))
+            else:
+                _link_or_copy(os.path.join(old_dir, key, name + '.npy'), target)
+        _write_meta(month_dir, {'format_version': FORMAT_VERSION, **info})
+    os.makedirs(tmp_dir, exist_ok=True)
+    shutil.rmtree(new_dir, ignore_errors=True)  # 上次中断留下的未发布版本
+    os.replace(tmp_dir, new_dir)
+
+    manifest = {'format_version': FORMAT_VERSION, 'version': version, 'files': files,
+                'months': dict(sorted(months.items()))}
+    manifest_path = os.path.join(dataset_store_path(root), MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    for name in os.listdir(dataset_store_path(root)):
+        if name.startswith('v') and name[1:].isdigit() and int(name[1:]) <= version - KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(dataset_store_path(root), name), ignore_errors=True)
+    return manifest
+
+
+def load_dataset_aggregates(root, month=None, mmap=False):
+    """
+    读取数据目录最新版本的预聚合结果 (尚未构建时先构建一次)。
+    month 为 'YYYY-MM' 时返回单月; 否则返回所有月份之和 (day 维按日期号合并)。
+    """
+    manifest = read_manifest(root)
+    if manifest['version'] == 0:
+        manifest = update_dataset_aggregates(root)
+    version_dir = _version_dir(root, manifest['version'])
+    keys = [month] if month is not None else list(manifest['months'])
+    if month is not None and month not in manifest['months']:
+        raise KeyError(f"数据集中没有月份 {month}, 可选: {list(manifest['months'])}")
+
+    mmap_mode = 'r' if mmap else None
+    stores = [{name: np.load(os.path.join(version_dir, key, name + '.npy'), mmap_mode=mmap_mode)
+               for name in CUBE_NAMES} for key in keys]
+    meta = {'version': manifest['version'], 'months': keys, 'rows_seen': 0, 'rows_dropped': 0}
+    for key in keys:
+        _add_row_stats(meta, {'dropped_by_rule': {}, **manifest['months'][key]})
+    if len(stores) == 1:
+        info = manifest['months'][keys[0]]
+        return AggregateStore(year=info['year'], month=info['month'], meta=meta, **stores[0])
+    if not stores:
+        return AggregateStore(year=None, month=None, meta=meta, **TripAggregator().result())
+
+    cubes = _zero_cubes()
+    for store in stores:
+        for name in CUBE_NAMES:
+            cubes[name] += store[name]
+    return AggregateStore(year=None, month=None, meta=meta, **cubes)
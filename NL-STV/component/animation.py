@@ -0,0 +1,117 @@
+"""
+紧凑的动画热力图 (Animation)
+
+px.choropleth_map(animation_frame=...) 会在每一帧里重复 GeoJSON 引用和全部悬停列,
+导出的 HTML 随帧数线性膨胀。这里改为:
+    - 几何、区域名称、色轴只放在基础 trace 中发送一次
+    - 每一帧只携带一个 float32 的 z 数组 (对数缩放后的数值)
+time_bin_frames() 从预聚合立方体中切出不同的时间粒度。
+"""
+import calendar
+
+import numpy as np
+import plotly.graph_objects as go
+
+from .aggregate_store import N_SLOTS
+
+WEEKDAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+TIME_BINS = ('hour', '15min', 'dow_hour', 'day')
+
+
+def time_bin_frames(store, binning='hour'):
+    """
+    从 AggregateStore 中按时间粒度取出 (帧数, 区域数) 的计数矩阵及帧标签。
+
+    hour      24 帧, 全月按小时汇总
+    15min     96 帧, 全月按 15 分钟时段汇总
+    dow_hour  168 帧, 星期几 × 小时
+    day       当月每天一帧
+    dow_hour 与 day 需要按日历排列, 只支持单月的数据; 多月数据集的 year / month 为 None, 此时抛出 ValueError
+    """
+    if binning == 'hour':
+        return store.hourly_pickups(), [f"{h:02d}:00" for h in range(24)]
+    if binning == '15min':
+        labels = [f"{s // 4:02d}:{s % 4 * 15:02d}" for s in range(N_SLOTS)]
+        return store.pu_slot_count.astype(np.int64), labels
+    if binning not in TIME_BINS:
+        raise ValueError(f"未知的时间粒度: {binning}, 可选: {TIME_BINS}")
+    if store.year is None or store.month is None:
+        raise ValueError(f"时间粒度 {binning} 只支持单月数据; 多月数据集请使用 hour 或 15min")
+    n_days = calendar.monthrange(store.year, store.month)[1]
+    if binning == 'day':
+        counts = store.pu_count[:n_days].sum(axis=1, dtype=np.int64)
+        return counts, [f"{store.year}-{store.month:02d}-{d + 1:02d}" for d in range(n_days)]
+    # dow_hour
+    first_weekday = calendar.weekday(store.year, store.month, 1)
+    weekdays = (first_weekday + np.arange(n_days)) % 7
+    counts = np.zeros((7,) + store.pu_count.shape[1:], dtype=np.int64)
+    np.add.at(counts, weekdays, store.pu_count[:n_days])
+    labels = [f"{WEEKDAY_NAMES[d]} {h:02d}:00" for d in range(7) for h in range(24)]
+    return counts.reshape(7 * 24, -1), labels
+
+
+def log_colorbar_ticks(max_raw):
+    """在对数色轴上标注原始数值刻度"""
+    candidate_ticks = [0, 1, 10, 100, 1000, 10000, 100000, 1000000]
+    raw_ticks = [t for t in candidate_ticks if t < max_raw] + [int(max_raw)]
+    return [float(np.log10(x + 1)) for x in raw_ticks], [f"{x:,}" for x in raw_ticks]
+
+
+def build_frame_animation(geojson, locations, counts, labels, hover_names=None,
+                          colorscale="Viridis", title=None, colorbar_title="订单量",
+                          featureidkey="properties.LocationID",
+                          frame_duration=800, transition_duration=400):
+    """
+    构建逐帧动画热力图。
+
+    counts 为 (帧数, len(locations)) 的原始计数, 着色使用 log10(count + 1),
+    所有帧共用同一色轴范围。
+    """
+    z = np.log10(np.asarray(counts, dtype=np.float64) + 1).astype(np.float32)
+    zmax = float(z.max()) if z.size else 1.0
+    tick_vals, tick_text = log_colorbar_ticks(np.asarray(counts).max() if z.size else 0)
+
+    fig = go.Figure(go.Choroplethmap(
+        geojson=geojson,
+        locations=np.asarray(locations),
+        z=z[0],
+        featureidkey=featureidkey,
+        colorscale=colorscale,
+        zmin=0,
+        zmax=zmax,
+        marker_opacity=0.7,
+        marker_line_width=0.5,
+        colorbar=dict(title=colorbar_title, tickvals=tick_vals, ticktext=tick_text),
+        text=hover_names,
+        hovertemplate="%{text}<br>热度指数: %{z:.2f}<extra></extra>" if hover_names is not None else None,
+    ))
+
+    # 每一帧只更新第 0 个 trace 的 z
+    fig.frames = [
+        go.Frame(name=label, data=[go.Choroplethmap(z=z[i])], traces=[0])
+        for i, label in enumerate(labels)
+    ]
+
+    play_args = dict(frame=dict(duration=frame_duration, redraw=True),
+                     transition=dict(duration=transition_duration), fromcurrent=True, mode='immediate')
+    pause_args = dict(frame=dict(duration=0, redraw=False), transition=dict(duration=0), mode='immediate')
+    fig.update_layout(
+        title=title,
+        map=dict(style="carto-positron", center={"lat": 40.7128, "lon": -74.0060}, zoom=10),
+        margin={"r": 0, "t": 40, "l": 0, "b": 0},
+        updatemenus=[dict(
+            type='buttons', direction='left', showactive=False, x=0.1, y=0, xanchor='right', yanchor='top',
+            pad=dict(r=10, t=70),
+            buttons=[dict(label='▶', method='animate', args=[None, play_args]),
+                     dict(label='◼', method='animate', args=[[None], pause_args])],
+        )],
+        sliders=[dict(
+            active=0, x=0.1, len=0.9, y=0, xanchor='left', yanchor='top', pad=dict(b=10, t=50),
+            currentvalue=dict(prefix="时段: "),
+            steps=[dict(label=label, method='animate',
+                        args=[[label], dict(frame=dict(duration=0, redraw=True), mode='immediate',
+                                            transition=dict(duration=0))])
+                   for label in labels],
+        )],
+    )
+    return fig
@@ -0,0 +1,145 @@
+"""
+基准测试工具 (Benchmark)
+
+按阶段计时并记录内存:
+    - wall / cpu 时间取多次重复的中位数 (计时时不开 tracemalloc, 避免额外开销)
+    - 峰值内存单独再跑一次: tracemalloc 统计 Python/NumPy 分配的峰值; tracemalloc 看不到
+      Arrow/parquet 的缓冲区, 因此同时把 pyarrow 的默认内存池换成一个代理池, 取其峰值。
+      peak_mb 为两者之和 (两个峰值未必同时出现, 是上界)
+结果写成 JSON, 可与基线文件比较, 耗时或峰值内存超出容差的阶段视为回退。
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_TOLERANCE = 0.2  # 比基线慢 20% (或峰值内存多 20%) 以上视为回退
+MIN_DELTA_SECONDS = 0.05  # 绝对差值太小的阶段不判定回退, 避免计时噪声
+MIN_DELTA_MB = 8.0
+
+# 代理内存池必须比从它分配的 Arrow 缓冲区活得久 (阶段结束后缓冲区可能还留在 context 中), 因此不释放
+_ARROW_POOLS = []
+
+
+class SkipStage(Exception):
+    """阶段依赖的可选库不可用等情况下跳过该阶段"""
+
+
+def environment_info():
+    import numpy as np
+    import pandas as pd
+    info = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+    }
+    try:
+        import plotly
+        info['plotly'] = plotly.__version__
+    except ImportError:
+        pass
+    return info
+
+
+@contextmanager
+def _arrow_peak():
+    """统计期间 pyarrow 分配的峰值 (MB); 没有安装 pyarrow 时为 None"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        yield lambda: None
+        return
+    previous = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(previous)
+    _ARROW_POOLS.append(pool)
+    pa.set_memory_pool(pool)
+    try:
+        yield lambda: pool.max_memory() / 2 ** 20
+    finally:
+        pa.set_memory_pool(previous)
+
+
+def run_stages(stages, context=None, repeat=3, profile_memory=True):
+    """
+    依次执行各阶段。stages 为 [(名称, 函数)] 列表, 函数接收共享的 context 字典,
+    返回的 dict 会合并进 context 供后续阶段使用; 抛出 SkipStage 表示跳过。
+    """
+    context = {} if context is None else context
+    results = {}
+    for name, fn in stages:
+        walls, cpus = [], []
+        try:
+            for _ in range(repeat):
+                wall0, cpu0 = time.perf_counter(), time.process_time()
+                output = fn(context)
+                walls.append(time.perf_counter() - wall0)
+                cpus.append(time.process_time() - cpu0)
+            peak = py_peak = arrow_peak = None
+            if profile_memory:
+                with _arrow_peak() as arrow_peak_mb:
+                    tracemalloc.start()
+                    try:
+                        output = fn(context)
+                        py_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    finally:
+                        tracemalloc.stop()
+                    arrow_peak = arrow_peak_mb()
+                peak = py_peak + (arrow_peak or 0.0)
+        except SkipStage as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        if output:
+            context.update(output)
+        results[name] = {
+            'wall_s': statistics.median(walls),
+            'cpu_s': statistics.median(cpus),
+            'peak_mb': peak,
+            'py_peak_mb': py_peak,
+            'arrow_peak_mb': arrow_peak,
+        }
+    return results
+
+
+def save_results(path, runs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'runs': runs}, f, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_to_baseline(runs, baseline, tolerance=DEFAULT_TOLERANCE, min_delta=MIN_DELTA_SECONDS,
+                        min_delta_mb=MIN_DELTA_MB):
+    """
+    逐阶段比较 wall 时间与峰值内存 (双方都有 peak_mb 时)。runs / baseline['runs'] 都以数据规模 (行数) 为 key,
+    返回 (对比表, 回退列表)。
+    """
+    rows, regressions = [], []
+    for size, stages in runs.items():
+        base_stages = baseline.get('runs', {}).get(size, {})
+        for name, result in stages.items():
+            base = base_stages.get(name)
+            if 'wall_s' not in result or not base or 'wall_s' not in base:
+                continue
+            ratio = result['wall_s'] / base['wall_s'] if base['wall_s'] > 0 else float('inf')
+            slower = ratio > 1 + tolerance and result['wall_s'] - base['wall_s'] > min_delta
+            base_mb, current_mb = base.get('peak_mb'), result.get('peak_mb')
+            bigger = (base_mb is not None and current_mb is not None
+                      and current_mb > base_mb * (1 + tolerance) and current_mb - base_mb > min_delta_mb)
+            rows.append({'rows': size, 'stage': name, 'baseline_s': base['wall_s'],
+                         'current_s': result['wall_s'], 'ratio': ratio,
+                         'baseline_mb': base_mb, 'current_mb': current_mb,
+                         'slower': slower, 'bigger': bigger, 'regressed': slower or bigger})
+            if slower or bigger:
+                regressions.append(rows[-1])
+    return rows, regressions
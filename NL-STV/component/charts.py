@@ -0,0 +1,55 @@
+"""
+常用图表 (Charts)
+
+仪表盘与接口服务共用的图表构建函数, 直接使用 plotly.graph_objects:
+    - plotly.express 首次导入约 0.1 s, 每次建图还要整理 DataFrame, 比同样的 go 图慢 5-10 倍
+    - 不按名称指定模板 (template="plotly_white" 会重新校验整个模板, 每张图多约 20 ms),
+      只设置需要的几项外观
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+MAP_CENTER = {"lat": 40.7128, "lon": -74.0060}
+MAP_STYLE = "carto-positron"
+GRID_COLOR = '#EBF0F8'
+
+
+def pickup_choropleth(location_ids, counts, zone_names, boroughs, geojson, zoom=10):
+    """
+    区域上车热力图: 对数着色, 悬停显示原始数值。
+    location_ids / counts / zone_names / boroughs 为等长数组, 计数为 0 的区域不着色。
+    """
+    location_ids = np.asarray(location_ids)
+    counts = np.asarray(counts)
+    keep = counts > 0
+    log_counts = np.log10(counts[keep] + 1)
+    fig = go.Figure(go.Choroplethmap(
+        geojson=geojson,
+        locations=location_ids[keep],
+        z=log_counts,
+        featureidkey="properties.LocationID",
+        colorscale="Viridis",
+        zmin=0,
+        zmax=max(float(log_counts.max()), 1.0) if keep.any() else 1.0,
+        marker_opacity=0.7,
+        marker_line_width=0.5,
+        colorbar=dict(title="热度指数"),
+        text=np.asarray(zone_names)[keep],
+        customdata=np.column_stack([counts[keep], np.asarray(boroughs)[keep]]),
+        hovertemplate="<b>%{text}</b><br>total_pickups=%{customdata[0]:,d}<br>Borough=%{customdata[1]}"
+                      "<br>LocationID=%{location}<extra></extra>",
+    ))
+    fig.update_layout(map=dict(style=MAP_STYLE, center=MAP_CENTER, zoom=zoom),
+                      margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
+
+
+def hourly_trend(counts, title=None):
+    """24 小时趋势折线"""
+    fig = go.Figure(go.Scatter(x=np.arange(24), y=np.asarray(counts), mode='lines+markers',
+                               line=dict(color='#FF4B4B', width=3),
+                               hovertemplate="小时 (0-23)=%{x}<br>接单量=%{y:,d}<extra></extra>"))
+    fig.update_layout(title=title, plot_bgcolor='white',
+                      xaxis=dict(title='小时 (0-23)', tickmode='linear', tick0=0, dtick=4, gridcolor=GRID_COLOR),
+                      yaxis=dict(title='接单量', gridcolor=GRID_COLOR))
+    return fig
@@ -0,0 +1,147 @@
+"""
+行程数据清洗 (Cleaning)
+
+读取层在转换成 pandas 之前, 对每个 pyarrow 批次计算一次融合的布尔掩码, 异常行直接丢弃,
+不会被物化, 所有下游聚合 (预聚合立方体、密度图、查询引擎) 看到的都是同一份清洗后的数据:
+    negative_fare           fare_amount < 0
+    zero_distance           trip_distance <= 0
+    huge_distance           trip_distance > max_distance (默认 100 英里)
+    dropoff_before_pickup   下车时间早于上车时间
+    invalid_zone            上/下车区域不在 1..max_zone (默认 263, 即去掉 264/265 未知区域)
+    outside_month           上车时间不在文件所属月份 (由文件名/分区目录得到, 未知时不检查)
+    zero_passengers         passenger_count == 0 (默认关闭, README 中提到的异常)
+文件缺少某条规则用到的列时跳过该规则。CleaningReport 记录每条规则命中的行数
+(一行可能同时违反多条规则) 与实际丢弃的行数。
+"""
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import pyarrow as pa
+
+RULES = ('negative_fare', 'zero_distance', 'huge_distance', 'dropoff_before_pickup',
+         'invalid_zone', 'outside_month', 'zero_passengers')
+DEFAULT_RULES = RULES[:-1]
+RULE_LABELS = {
+    'negative_fare': '负车费',
+    'zero_distance': '零距离',
+    'huge_distance': '距离过大',
+    'dropoff_before_pickup': '下车早于上车',
+    'invalid_zone': '区域 ID 越界',
+    'outside_month': '不在所属月份',
+    'zero_passengers': '乘客数为 0',
+}
+RULE_COLUMNS = {
+    'negative_fare': ('fare_amount',),
+    'zero_distance': ('trip_distance',),
+    'huge_distance': ('trip_distance',),
+    'dropoff_before_pickup': ('tpep_pickup_datetime', 'tpep_dropoff_datetime'),
+    'invalid_zone': ('PULocationID', 'DOLocationID'),
+    'outside_month': ('tpep_pickup_datetime',),
+    'zero_passengers': ('passenger_count',),
+}
+
+
+def _numpy(table, name, dtype):
+    """取一列为 numpy 数组, 缺失值为 NaN / NaT (与它比较的结果都为 False)"""
+    column = table[name]
+    if dtype == 'time':
+        return column.cast(pa.timestamp('us')).to_numpy()
+    return column.to_numpy().astype(dtype, copy=False)
+
+
+@dataclass
+class CleaningReport:
+    rows_in: int = 0
+    rows_out: int = 0
+    by_rule: dict = field(default_factory=dict)
+
+    @property
+    def dropped(self):
+        return self.rows_in - self.rows_out
+
+    def merge(self, other):
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        for rule, count in other.by_rule.items():
+            self.by_rule[rule] = self.by_rule.get(rule, 0) + count
+        return self
+
+    def to_dict(self):
+        return {'rows_in': self.rows_in, 'rows_out': self.rows_out, 'dropped': self.dropped,
+                'by_rule': dict(self.by_rule)}
+
+    def format(self):
+        """一行摘要, 如 "清洗丢弃 1,234 / 1,000,000 行 (负车费 120, 零距离 800)" """
+        hits = ", ".join(f"{RULE_LABELS[r]} {c:,}" for r, c in self.by_rule.items() if c)
+        return f"清洗丢弃 {self.dropped:,} / {self.rows_in:,} 行" + (f" ({hits})" if hits else "")
+
+
+@dataclass(frozen=True)
+class CleaningRules:
+    rules: tuple = DEFAULT_RULES
+    max_distance: float = 100.0
+    max_zone: int = 263
+
+    def __post_init__(self):
+        unknown = set(self.rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"未知的清洗规则: {sorted(unknown)}, 可选: {list(RULES)}")
+
+    def to_dict(self):
+        return {**asdict(self), 'rules': list(self.rules)}
+
+    def columns(self, available=None):
+        """规则需要读取的列 (只保留文件中存在的列)"""
+        needed = {c for rule in self.rules for c in RULE_COLUMNS[rule]}
+        if available is not None:
+            needed &= set(available)
+        return sorted(needed)
+
+    def _violations(self, table, month):
+        names = set(table.column_names)
+        cache = {}
+
+        def col(name, dtype=np.float64):
+            if name not in cache:
+                cache[name] = _numpy(table, name, dtype)
+            return cache[name]
+
+        for rule in self.rules:
+            if not set(RULE_COLUMNS[rule]) <= names:
+                continue
+            if rule == 'negative_fare':
+                yield rule, col('fare_amount') < 0
+            elif rule == 'zero_distance':
+                yield rule, col('trip_distance') <= 0
+            elif rule == 'huge_distance':
+                yield rule, col('trip_distance') > self.max_distance
+            elif rule == 'dropoff_before_pickup':
+                yield rule, col('tpep_dropoff_datetime', 'time') < col('tpep_pickup_datetime', 'time')
+            elif rule == 'invalid_zone':
+                pu, do = col('PULocationID'), col('DOLocationID')
+                yield rule, ~((pu >= 1) & (pu <= self.max_zone) & (do >= 1) & (do <= self.max_zone))
+            elif rule == 'outside_month' and month is not None:
+                lo = np.datetime64(f"{month[0]:04d}-{month[1]:02d}", 'M')
+                ts = col('tpep_pickup_datetime', 'time')
+                yield rule, ~((ts >= lo.astype('datetime64[us]')) & (ts < (lo + 1).astype('datetime64[us]')))
+            elif rule == 'zero_passengers':
+                yield rule, col('passenger_count') == 0
+
+    def apply(self, table, month=None, report=None):
+        """
+        过滤一个 pyarrow.Table: 所有规则合成一个掩码后只 filter 一次。
+        month 为 (年, 月), 用于 outside_month; report 不为 None 时累加统计。
+        """
+        bad = np.zeros(table.num_rows, dtype=bool)
+        for rule, violated in self._violations(table, month):
+            bad |= violated
+            if report is not None:
+                report.by_rule[rule] = report.by_rule.get(rule, 0) + int(violated.sum())
+        kept = table.filter(pa.array(~bad)) if bad.any() else table
+        if report is not None:
+            report.rows_in += table.num_rows
+            report.rows_out += kept.num_rows
+        return kept
+
+
+DEFAULT_CLEANING = CleaningRules()
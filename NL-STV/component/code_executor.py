@@ -0,0 +1,343 @@
+"""
+沙箱代码执行器 (Code Executor)
+
+执行模型生成的绘图代码。每次请求都新起一个 Python 进程的话, 光是导入
+pandas/plotly 和重新读取数据就要好几秒, 因此这里维护一组预先启动的工作进程:
+    - 启动时导入好常用库, 以只读内存映射方式加载预聚合立方体、区域 GeoJSON 和对照表
+    - 每个任务受 CPU 时间 (RLIMIT_CPU)、内存 (RLIMIT_AS) 与墙钟超时三重限制,
+      超时的进程直接杀掉并补充新进程
+    - 数据加载完成后、执行任何任务之前, 工作进程由操作系统隔离:
+      独立的网络命名空间 (没有任何网卡, 无法联网), 以 root 启动时切换到 sandbox_user
+      (默认 nobody, 不能写属于其他用户的文件), RLIMIT_FSIZE=0 (不能向任何文件写入内容),
+      RLIMIT_NPROC=0 (不能再创建进程)。任何一层无法建立时工作进程拒绝启动
+    - 另有审计钩子 (sys.addaudithook) 作为纵深防御: 拒绝写文件、联网、启动子进程和遍历 gc 对象,
+      读文件仅限数据目录与 Python 安装目录。钩子一旦安装就一直生效, 没有可关闭的开关;
+      但它运行在同一解释器中, 不是安全边界, 真正的限制来自上面的操作系统隔离
+生成的代码需要把图表赋值给变量 fig, 返回 fig.to_json(); 出错时返回结构化错误。
+"""
+import ctypes
+import json
+import multiprocessing as mp
+import os
+import pwd
+import queue
+import resource
+import signal
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+
+DEFAULT_CPU_SECONDS = 10
+DEFAULT_MEMORY_MB = 2048
+DEFAULT_WALL_SECONDS = 20
+DEFAULT_SANDBOX_USER = 'nobody'
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+PR_SET_NO_NEW_PRIVS = 38
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+
+# 执行用户代码期间禁止的审计事件 (前缀匹配)
+BLOCKED_EVENTS = (
+    'socket.', 'subprocess.', 'os.system', 'os.exec', 'os.posix_spawn', 'os.spawn', 'os.fork',
+    'os.kill', 'os.remove', 'os.unlink', 'os.rename', 'os.rmdir', 'os.mkdir', 'os.chmod', 'os.chown',
+    'os.truncate', 'os.symlink', 'os.link', 'shutil.', 'ctypes.', 'urllib.', 'http.', 'ftplib.',
+    'smtplib.', 'webbrowser.', 'pty.', 'gc.', 'sys.addaudithook',
+)
+
+
+class SandboxError(Exception):
+    pass
+
+
+class CPUTimeExceeded(SandboxError):
+    pass
+
+
+def _error(kind, message, tb=None):
+    return {'ok': False, 'error': {'type': kind, 'message': message, 'traceback': tb}}
+
+
+def _make_guard(read_roots):
+    """
+    审计钩子: 安装后始终生效, 状态只存在于闭包中, 没有可以从生成代码中修改的开关。
+    钩子本身出错时异常照常抛出, 对应的操作被拒绝 (失败即拒绝)。
+    """
+    read_roots = tuple(os.path.realpath(p) + os.sep for p in read_roots)
+
+    def guard(event, args):
+        if event == 'open':
+            path, mode, flags = args
+            if isinstance(path, int):
+                return
+            writing = (mode is not None and any(c in str(mode) for c in 'wax+')) or bool(flags & WRITE_FLAGS)
+            real = os.path.realpath(os.fsdecode(path))
+            if writing or not real.startswith(read_roots):
+                raise PermissionError(f"沙箱禁止访问文件: {path}")
+        elif event.startswith(BLOCKED_EVENTS):
+            raise PermissionError(f"沙箱禁止的操作: {event}")
+
+    return guard
+
+
+def _warm_up(pd, px, go):
+    """
+    隔离之后沙箱用户未必能读取 Python 安装目录, plotly 按需导入的子模块会失败;
+    先把常用图表完整走一遍, 相关模块都留在 sys.modules 中 (同时降低首个任务的延迟)
+    """
+    import encodings.idna  # noqa: F401  (socket 等按需加载的编码)
+    df = pd.DataFrame({'x': [0, 1], 'y': [1, 2], 'c': ['a', 'b']})
+    figures = [px.line(df, x='x', y='y', color='c', markers=True, template='plotly_white'),
+               px.bar(df, x='x', y='y', color='c'), px.scatter(df, x='x', y='y', size='y'),
+               px.histogram(df, x='y'), px.pie(df, names='c', values='y'), px.imshow([[1, 2], [3, 4]]),
+               px.choropleth_map(df, geojson={'type': 'FeatureCollection', 'features': []}, locations='x',
+                                 color='y', map_style='carto-positron'),
+               go.Figure(go.Scattermap(lat=[0], lon=[0])), go.Figure(go.Heatmap(z=[[1]]))]
+    for fig in figures:
+        fig.update_layout(title='t', xaxis_title='x', legend_title='c')
+        fig.to_json()
+
+
+def _isolate(sandbox_user):
+    """
+    在工作进程内建立操作系统级隔离, 返回已生效的各层; 无法建立时抛出 SandboxError。
+    必须在加载完数据之后调用: 之后进程不能再联网, 以 root 启动时也不再有 root 权限。
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    is_root = os.geteuid() == 0
+    # root 直接创建网络命名空间; 普通用户需要同时创建用户命名空间才有权限
+    if libc.unshare(CLONE_NEWNET if is_root else CLONE_NEWUSER | CLONE_NEWNET) != 0:
+        raise SandboxError(f"无法创建独立的网络命名空间: {os.strerror(ctypes.get_errno())}")
+    layers = ['netns']
+    if libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0:
+        raise SandboxError(f"无法设置 no_new_privs: {os.strerror(ctypes.get_errno())}")
+    if is_root:
+        try:
+            user = pwd.getpwnam(sandbox_user)
+        except KeyError:
+            raise SandboxError(f"沙箱用户不存在: {sandbox_user}") from None
+        if user.pw_uid == 0:
+            raise SandboxError("沙箱用户不能是 root")
+        os.setgroups([])
+        os.setgid(user.pw_gid)
+        os.setuid(user.pw_uid)
+        layers.append(f'uid={user.pw_uid}')
+    # 写文件时内核返回 EFBIG, 而不是用 SIGXFSZ 杀掉进程
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    for limit in (resource.RLIMIT_FSIZE, resource.RLIMIT_NPROC, resource.RLIMIT_CORE):
+        resource.setrlimit(limit, (0, 0))
+    layers += ['fsize=0', 'nproc=0']
+    sys.dont_write_bytecode = True
+    return layers
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPUTimeExceeded("超出 CPU 时间限制")
+
+
+def _worker_main(conn, data_paths, cpu_seconds, memory_mb, sandbox_user):
+    # A. 预先导入常用库并加载只读数据
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    from .aggregate_store import load_aggregates
+    from .spatial_utils import load_zone_geojson
+
+    base_namespace = {'np': np, 'pd': pd, 'px': px, 'go': go, 'json': json}
+    parquet_path = data_paths.get('parquet_path')
+    if parquet_path:
+        base_namespace['store'] = load_aggregates(parquet_path, mmap=True)
+    if data_paths.get('shp_path'):
+        base_namespace['geojson'] = load_zone_geojson(data_paths['shp_path'])
+    if data_paths.get('lookup_path'):
+        base_namespace['lookup'] = pd.read_csv(data_paths['lookup_path'])
+
+    # B. 操作系统隔离、资源限制与审计钩子; 隔离失败时不接受任何任务
+    _warm_up(pd, px, go)
+    if sandbox_user is not None:
+        try:
+            layers = _isolate(sandbox_user)
+        except (SandboxError, OSError) as e:
+            conn.send({'ready': False, 'error': str(e)})
+            return
+    else:
+        layers = []
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if memory_mb:
+        with open('/proc/self/status', 'r') as f:
+            vm_kb = next(int(line.split()[1]) for line in f if line.startswith('VmSize'))
+        limit = vm_kb * 1024 + memory_mb * 2 ** 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    read_roots = set(sysconfig.get_paths().values()) | {sys.prefix, sys.base_prefix}
+    read_roots |= {os.path.dirname(os.path.abspath(p)) for p in data_paths.values() if p}
+    sys.addaudithook(_make_guard(read_roots))
+
+    conn.send({'ready': True, 'isolation': layers})
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        # 每个任务重新设置 CPU 软限制: 当前已用时间 + 本次配额 (硬限制不能再调高, 保持不变)
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        spent = int(used.ru_utime + used.ru_stime)
+        resource.setrlimit(resource.RLIMIT_CPU, (spent + cpu_seconds, cpu_hard))
+
+        namespace = dict(base_namespace)
+        start = time.perf_counter()
+        try:
+            exec(compile(task['code'], '<generated>', 'exec'), namespace)
+            fig = namespace.get('fig')
+            if fig is None:
+                result = _error('no_figure', "代码没有生成变量 fig")
+            else:
+                figure_json = fig if isinstance(fig, str) else (
+                    fig.to_json() if hasattr(fig, 'to_json') else json.dumps(fig))
+                result = {'ok': True, 'figure': figure_json}
+        except CPUTimeExceeded as e:
+            result = _error('cpu_limit', str(e))
+        except MemoryError:
+            result = _error('memory_limit', "超出内存限制")
+        except PermissionError as e:
+            result = _error('forbidden', str(e))
+        except SyntaxError as e:
+            result = _error('syntax', str(e), traceback.format_exc(limit=0))
+        except Exception as e:
+            result = _error(type(e).__name__, str(e), traceback.format_exc(limit=-3))
+        finally:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard, cpu_hard))
+        result['elapsed'] = time.perf_counter() - start
+        try:
+            conn.send(result)
+        except (MemoryError, ValueError) as e:
+            conn.send(_error('result_too_large', str(e)))
+
+
+class _Worker:
+    def __init__(self, ctx, data_paths, cpu_seconds, memory_mb, sandbox_user):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child, data_paths, cpu_seconds, memory_mb, sandbox_user), daemon=True)
+        self.process.start()
+        child.close()
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise SandboxError("工作进程启动超时")
+        try:
+            status = self.conn.recv()
+        except EOFError:
+            raise SandboxError("工作进程启动失败") from None
+        if not status['ready']:
+            self.process.join()
+            raise SandboxError(f"工作进程无法建立隔离: {status['error']}")
+        self.isolation = status['isolation']
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    预启动的沙箱进程池, run() 线程安全, 可在线程池中并发调用。
+
+    data_paths 可包含 parquet_path / shp_path / lookup_path, 对应的数据在
+    生成代码中分别以 store / geojson / lookup 变量提供。
+    sandbox_user 为以 root 启动时切换到的用户; 传 None 会关闭操作系统隔离, 只剩审计钩子,
+    仅用于不能创建命名空间的本地开发环境, 不得用于执行不可信代码。
+    """
+
+    def __init__(self, n_workers=None, data_paths=None, cpu_seconds=DEFAULT_CPU_SECONDS,
+                 memory_mb=DEFAULT_MEMORY_MB, wall_seconds=DEFAULT_WALL_SECONDS, startup_timeout=120,
+                 sandbox_user=DEFAULT_SANDBOX_USER):
+        self._ctx = mp.get_context('fork' if sys.platform.startswith('linux') else 'spawn')
+        self._args = (dict(data_paths or {}), cpu_seconds, memory_mb, sandbox_user)
+        self.wall_seconds = wall_seconds
+        self.startup_timeout = startup_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        workers = [_Worker(self._ctx, *self._args) for _ in range(n_workers or os.cpu_count() or 1)]
+        try:
+            for worker in workers:
+                worker.wait_ready(startup_timeout)
+        except SandboxError:
+            for worker in workers:
+                worker.kill()
+            raise
+        for worker in workers:
+            self._idle.put(worker)
+        self.isolation = workers[0].isolation
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, *self._args)
+        try:
+            worker.wait_ready(self.startup_timeout)
+        except SandboxError:
+            worker.kill()
+            raise
+        return worker
+
+    def run(self, code, wall_seconds=None):
+        """
+        执行一段代码, 返回 {'ok': True, 'figure': ...} 或 {'ok': False, 'error': {...}}。
+        超时或崩溃的工作进程会被杀掉并替换; 替换失败时在池中留下空位 (None),
+        下一次取到空位的 run() 再尝试启动, 不会把已经杀掉的进程放回池中
+        """
+        if self._closed:
+            raise SandboxError("沙箱进程池已关闭")
+        wall_seconds = wall_seconds or self.wall_seconds
+        worker = self._idle.get()
+        try:
+            if worker is None:
+                worker = self._spawn()
+            try:
+                worker.conn.send({'code': code})
+                if worker.conn.poll(wall_seconds):
+                    return worker.conn.recv()
+                failure = _error('timeout', f"超出墙钟时间限制 ({wall_seconds}s)")
+            except (BrokenPipeError, EOFError, OSError):
+                failure = _error('crashed', "工作进程异常退出")
+            worker.kill()
+            worker = None
+            try:
+                worker = self._spawn()
+            except (SandboxError, OSError):
+                pass
+            return failure
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is None:
+                continue
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout=2)
+            if worker.process.is_alive():
+                worker.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
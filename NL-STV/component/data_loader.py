@@ -0,0 +1,376 @@
+"""
+行程数据流式读取 (Data Loader)
+
+按 parquet row group 逐批读取, 列选择与时间/区域过滤都下推到读取层:
+    - 只解码需要的列
+    - 利用 row group 的 min/max 统计信息整块跳过不相关的数据
+    - 剩余行用 pyarrow.compute 过滤后再转成 pandas
+
+任意时刻内存中只有一个批次, 因此加载多少个月的数据峰值内存都是有界的。
+
+paths 既可以是单个文件, 也可以是按 Hive 风格分区的数据目录:
+    <root>/year=2025/month=03/[borough=Queens/]part-00000.parquet
+或直接放着 yellow_tripdata_YYYY-MM.parquet 的目录。读取前先按时间范围和区域
+(经由区域 -> 行政区映射) 剪掉整个分区/文件, 再用 row group 统计信息剪枝。
+repartition_trips() 把按月的原始文件重写成上述分区结构 (应写到原始数据目录之外;
+discover_files() 不会进入嵌套的数据集目录, 同一份数据不会被读两遍)。
+
+读取时默认先经过 cleaning 模块的清洗规则 (在 pyarrow 批次上一次性算出掩码),
+异常行在转换成 pandas 之前就被丢弃; 需要原始数据的场合传 clean=None。
+"""
+import json
+import os
+import re
+from dataclasses import dataclass
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .cleaning import DEFAULT_CLEANING, CleaningReport
+from .schema import normalize_trips
+
+TIME_COLUMN = 'tpep_pickup_datetime'
+DEFAULT_BATCH_ROWS = 1 << 20
+DEFAULT_ROW_GROUP_ROWS = 1 << 20
+DATASET_META_FILE = '_dataset.json'
+PARTITION_ZONE_COLUMN = 'PULocationID'  # borough 分区依据上车区域
+UNKNOWN_BOROUGH = 'Unknown'
+_MONTH_IN_NAME = re.compile(r'(\d{4})-(\d{2})')
+
+
+def _as_list(paths):
+    if isinstance(paths, (str, os.PathLike)):
+        return [paths]
+    return list(paths)
+
+
+@dataclass(frozen=True)
+class DataFile:
+    """数据集中的一个 parquet 文件及其分区取值 (未知为 None)"""
+    path: str
+    year: int = None
+    month: int = None
+    borough: str = None
+
+    def may_match(self, start=None, end=None, boroughs=None):
+        if self.year is not None and self.month is not None:
+            lo = pd.Timestamp(self.year, self.month, 1)
+            hi = lo + pd.offsets.MonthBegin(1)
+            if start is not None and hi <= start:
+                return False
+            if end is not None and lo >= end:
+                return False
+        if boroughs is not None and self.borough is not None and self.borough not in boroughs:
+            return False
+        return True
+
+
+def parse_data_file(path, root=None):
+    """从 Hive 分区目录 (key=value) 或 TLC 文件名 (YYYY-MM) 解析分区取值"""
+    rel = os.path.relpath(path, root) if root else os.fspath(path)
+    values = {}
+    for part in rel.split(os.sep)[:-1]:
+        if '=' in part:
+            key, value = part.split('=', 1)
+            values[key] = unquote(value)
+    year, month = values.get('year'), values.get('month')
+    if year is None or month is None:
+        match = _MONTH_IN_NAME.search(os.path.basename(path))
+        if match:
+            year, month = match.groups()
+    return DataFile(path=path,
+                    year=int(year) if year is not None else None,
+                    month=int(month) if month is not None else None,
+                    borough=values.get('borough'))
+
+
+def read_dataset_meta(root):
+    path = os.path.join(root, DATASET_META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _is_nested_dataset(dirpath, name):
+    """repartition_trips() 写出的数据集 (带 _dataset.json), 与所在目录的原始文件是同一份数据"""
+    return os.path.exists(os.path.join(dirpath, name, DATASET_META_FILE))
+
+
+def discover_files(root):
+    """
+    列出目录下所有 parquet 文件 (递归, 跳过 . 和 _ 开头的隐藏文件/目录)。
+    嵌套的分区数据集不会被展开, 需要时直接把它作为 root 传入。
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(('.', '_')) and not d.endswith('.agg')
+                             and not _is_nested_dataset(dirpath, d))
+        for name in sorted(filenames):
+            if name.endswith('.parquet') and not name.startswith(('.', '_')):
+                files.append(parse_data_file(os.path.join(dirpath, name), root))
+    return files
+
+
+def resolve_files(paths, start=None, end=None, zones=None, zone_column='PULocationID'):
+    """
+    把文件/目录列表展开成需要读取的文件, 按分区剪枝。
+    zones 只有在过滤列就是分区依据的上车区域时才用于剪掉 borough 分区。
+    """
+    selected = []
+    for entry in _as_list(paths):
+        entry = os.fspath(entry)
+        if not os.path.isdir(entry):
+            data_file = parse_data_file(entry)
+            # 单独指定的文件只按文件名中的年月剪枝
+            if data_file.may_match(start, end):
+                selected.append(entry)
+            continue
+        boroughs = None
+        zone_borough = read_dataset_meta(entry).get('zone_borough')
+        if zones is not None and zone_column == PARTITION_ZONE_COLUMN and zone_borough:
+            boroughs = {zone_borough.get(str(z), UNKNOWN_BOROUGH) for z in zones}
+        selected.extend(f.path for f in discover_files(entry) if f.may_match(start, end, boroughs))
+    return selected
+
+
+def _column_stats(row_group, name):
+    """返回某列在 row group 中的 (min, max), 没有统计信息时返回 None"""
+    for j in range(row_group.num_columns):
+        column = row_group.column(j)
+        if column.path_in_schema == name:
+            stats = column.statistics
+            if stats is None or not stats.has_min_max:
+                return None
+            return stats.min, stats.max
+    return None
+
+
+def row_group_may_match(row_group, start=None, end=None, zones=None, zone_column='PULocationID'):
+    """根据 footer 统计信息判断 row group 是否可能包含满足条件的行"""
+    if start is not None or end is not None:
+        bounds = _column_stats(row_group, TIME_COLUMN)
+        if bounds is not None:
+            lo, hi = pd.Timestamp(bounds[0]), pd.Timestamp(bounds[1])
+            if start is not None and hi < start:
+                return False
+            if end is not None and lo >= end:
+                return False
+    if zones is not None:
+        bounds = _column_stats(row_group, zone_column)
+        if bounds is not None and not any(bounds[0] <= z <= bounds[1] for z in zones):
+            return False
+    return True
+
+
+def _filter_mask(table, start=None, end=None, zones=None, zone_column='PULocationID'):
+    mask = None
+    if start is not None:
+        mask = pc.greater_equal(table[TIME_COLUMN], pa.scalar(start, type=table.schema.field(TIME_COLUMN).type))
+    if end is not None:
+        cond = pc.less(table[TIME_COLUMN], pa.scalar(end, type=table.schema.field(TIME_COLUMN).type))
+        mask = cond if mask is None else pc.and_(mask, cond)
+    if zones is not None:
+        value_set = pa.array(list(zones), type=table.schema.field(zone_column).type)
+        cond = pc.is_in(table[zone_column], value_set=value_set)
+        mask = cond if mask is None else pc.and_(mask, cond)
+    return mask
+
+
+def scan_plan(paths, start=None, end=None, zones=None, zone_column='PULocationID'):
+    """
+    返回实际需要读取的 [(文件, row group 下标列表)], 以及剪枝统计
+    {'files_total', 'files_read', 'row_groups_total', 'row_groups_read'}。
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    zones = sorted(set(int(z) for z in zones)) if zones is not None else None
+
+    stats = {'files_total': 0, 'files_read': 0, 'row_groups_total': 0, 'row_groups_read': 0}
+    for entry in _as_list(paths):
+        entry = os.fspath(entry)
+        stats['files_total'] += len(discover_files(entry)) if os.path.isdir(entry) else 1
+    plan = []
+    for path in resolve_files(paths, start, end, zones, zone_column):
+        metadata = pq.read_metadata(path)
+        row_groups = [
+            i for i in range(metadata.num_row_groups)
+            if row_group_may_match(metadata.row_group(i), start, end, zones, zone_column)
+        ]
+        stats['row_groups_total'] += metadata.num_row_groups
+        if row_groups:
+            plan.append((path, row_groups))
+            stats['files_read'] += 1
+            stats['row_groups_read'] += len(row_groups)
+    return plan, stats
+
+
+def _iter_tables(paths, columns=None, start=None, end=None, zones=None,
+                 zone_column='PULocationID', batch_rows=DEFAULT_BATCH_ROWS, plan=None, clean=None, report=None):
+    """
+    iter_trip_batches 的 pyarrow 版本, 产出过滤后的 pyarrow.Table。
+    plan 为 scan_plan() 给出的 [(文件, row group 下标列表)] 的一部分时只读取这些 row group
+    (并行聚合时每个进程各读一份)。
+    clean 为 cleaning.CleaningRules 时先按规则丢弃异常行 (统计累加到 report), 为 None 时读取原始数据。
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    zones = sorted(set(int(z) for z in zones)) if zones is not None else None
+
+    # 过滤用到的列也必须读取, 过滤后再丢弃
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns)
+        if (start is not None or end is not None) and TIME_COLUMN not in read_columns:
+            read_columns.append(TIME_COLUMN)
+        if zones is not None and zone_column not in read_columns:
+            read_columns.append(zone_column)
+
+    if plan is None:
+        plan, _ = scan_plan(paths, start, end, zones, zone_column)
+    for path, row_groups in plan:
+        pf = pq.ParquetFile(path)
+        file_columns = read_columns
+        if clean is not None and read_columns is not None:
+            # 清洗规则用到的列也要读取, 清洗后再丢弃
+            extra = [c for c in clean.columns(pf.schema_arrow.names) if c not in read_columns]
+            file_columns = read_columns + extra
+        data_file = parse_data_file(path)
+        month = (data_file.year, data_file.month) if data_file.month is not None else None
+        for batch in pf.iter_batches(batch_size=batch_rows, row_groups=row_groups, columns=file_columns):
+            table = pa.Table.from_batches([batch])
+            if clean is not None:
+                table = clean.apply(table, month, report)
+            mask = _filter_mask(table, start, end, zones, zone_column)
+            if mask is not None:
+                table = table.filter(mask)
+            if table.num_rows == 0:
+                continue
+            if columns is not None:
+                table = table.select(list(columns))
+            yield table
+
+
+def iter_trip_batches(paths, columns=None, start=None, end=None, zones=None, zone_column='PULocationID',
+                      batch_rows=DEFAULT_BATCH_ROWS, normalize=False, clean=DEFAULT_CLEANING, report=None):
+    """
+    逐批读取一个或多个 parquet 文件 (或分区目录), 产出 pandas DataFrame。
+
+    start/end 为上车时间的左闭右开区间, zones 为 zone_column 的取值集合。
+    normalize=True 时每个批次都转换为 schema.TRIP_DTYPES 中的紧凑类型。
+    默认按 cleaning.DEFAULT_CLEANING 丢弃异常行, 各规则的命中数累加到 report (CleaningReport);
+    clean=None 读取原始数据。
+    """
+    for table in _iter_tables(paths, columns, start, end, zones, zone_column, batch_rows,
+                              clean=clean, report=report):
+        df = table.to_pandas()
+        yield normalize_trips(df) if normalize else df
+
+
+def load_trips(paths, columns=None, **filters):
+    """读取满足条件的行程并拼接为一个紧凑类型的 DataFrame"""
+    frames = list(iter_trip_batches(paths, columns=columns, normalize=True, **filters))
+    if not frames:
+        return normalize_trips(pd.DataFrame(columns=columns or []))
+    return pd.concat(frames, ignore_index=True)
+
+
+def aggregate_files(paths, aggregators, columns=None, **filters):
+    """把流式批次依次喂给若干增量聚合器 (需实现 update(df) 方法)"""
+    if not isinstance(aggregators, (list, tuple)):
+        aggregators = [aggregators]
+    if columns is None:
+        columns = sorted({c for agg in aggregators for c in agg.columns})
+    for df in iter_trip_batches(paths, columns=columns, **filters):
+        for agg in aggregators:
+            agg.update(df)
+    return aggregators
+
+
+def zone_borough_map(lookup):
+    """LocationID -> 行政区, 对照表中缺失或为 N/A 的记为 Unknown"""
+    mapping = {}
+    for zone_id, borough in zip(lookup['LocationID'], lookup['Borough']):
+        mapping[int(zone_id)] = borough if isinstance(borough, str) and borough != 'N/A' else UNKNOWN_BOROUGH
+    return mapping
+
+
+def _partition_dir(out_root, year, month, borough=None):
+    parts = [out_root, f'year={year}', f'month={month:02d}']
+    if borough is not None:
+        parts.append('borough=' + quote(borough))
+    return os.path.join(*parts)
+
+
+def repartition_trips(paths, out_root, lookup=None, by_borough=False,
+                      row_group_rows=DEFAULT_ROW_GROUP_ROWS, batch_rows=DEFAULT_BATCH_ROWS, clean=DEFAULT_CLEANING):
+    """
+    把原始文件流式重写为 year/month[/borough] 分区。分区按实际上车时间划分,
+    每个 row group 内按上车时间排序, 使统计信息尽量紧凑。
+    写入前先按 clean 清洗 (outside_month 依据源文件的月份): 时间异常的行如果先按自称的
+    上车时间写进对应月份的分区, 之后就再也无法被识别出来。各规则的命中数记录在元数据中。
+    每个分区最多缓存 row_group_rows 行, 内存上限约为 分区数 x row_group_rows。
+    by_borough=True 时需要提供区域对照表 lookup (DataFrame)。
+    """
+    if os.path.exists(os.path.join(out_root, DATASET_META_FILE)):
+        raise FileExistsError(f"目标目录已经是一个数据集: {out_root}")
+    if by_borough and lookup is None:
+        raise ValueError("按行政区分区需要提供区域对照表 lookup")
+
+    zone_borough = zone_borough_map(lookup) if lookup is not None else {}
+    borough_names = sorted(set(zone_borough.values()) | {UNKNOWN_BOROUGH})
+    borough_lut = np.full(1 << 16, borough_names.index(UNKNOWN_BOROUGH), dtype=np.int64)
+    for zone_id, borough in zone_borough.items():
+        borough_lut[zone_id] = borough_names.index(borough)
+
+    buffers, writers, counts = {}, {}, {}
+    report = CleaningReport()
+
+    def flush(key):
+        table = pa.concat_tables(buffers.pop(key))
+        table = table.take(pc.sort_indices(table, sort_keys=[(TIME_COLUMN, 'ascending')]))
+        if key not in writers:
+            year, month, b = key
+            out_dir = _partition_dir(out_root, year, month, borough_names[b] if by_borough else None)
+            os.makedirs(out_dir, exist_ok=True)
+            writers[key] = pq.ParquetWriter(os.path.join(out_dir, 'part-00000.parquet'), table.schema)
+        writers[key].write_table(table, row_group_size=row_group_rows)
+
+    try:
+        for table in _iter_tables(paths, batch_rows=batch_rows, clean=clean, report=report):
+            ts = table[TIME_COLUMN].to_numpy().astype('datetime64[M]').astype(np.int64)
+            year, month = ts // 12 + 1970, ts % 12 + 1
+            borough = borough_lut[table[PARTITION_ZONE_COLUMN].to_numpy()] if by_borough else np.zeros_like(ts)
+            packed = (year * 12 + month - 1) * len(borough_names) + borough
+            order = np.argsort(packed, kind='stable')
+            keys, first = np.unique(packed[order], return_index=True)
+            bounds = np.append(first, len(order))
+            for k, a, b in zip(keys, bounds[:-1], bounds[1:]):
+                ym, bi = divmod(int(k), len(borough_names))
+                key = (ym // 12, ym % 12 + 1, bi)
+                buffers.setdefault(key, []).append(table.take(order[a:b]))
+                counts[key] = counts.get(key, 0) + int(b - a)
+                if sum(t.num_rows for t in buffers[key]) >= row_group_rows:
+                    flush(key)
+        for key in list(buffers):
+            flush(key)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    meta = {
+        'partition_by': ['year', 'month'] + (['borough'] if by_borough else []),
+        'zone_column': PARTITION_ZONE_COLUMN,
+        'zone_borough': {str(z): b for z, b in sorted(zone_borough.items())},
+        'rows': sum(counts.values()),
+        'partitions': len(counts),
+        'cleaning': report.to_dict() if clean is not None else None,
+    }
+    # 元数据最后写入, 同时作为写入完成的标记
+    with open(os.path.join(out_root, DATASET_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
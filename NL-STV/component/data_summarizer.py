@@ -0,0 +1,507 @@
+"""
+数据总结 (Data Summarizer)
+
+为模型提示词生成数据集概况: 各列类型、空值数、最小/最大值、分位数、高频取值与时间覆盖。
+对数百万行的月度文件只做一次流式扫描, 不再用 pandas describe() 反复全表计算:
+    - 行数、空值数、min/max 优先取 parquet footer 统计信息, 缺失时才从数据计算
+    - 分位数用 t-digest 风格的质心摘要 (每批等距抽样后合并)
+    - 不同值个数用 HyperLogLog (p=14, 相对误差约 0.8%)
+    - 高频取值用 Misra-Gries 摘要, 取值个数不超过容量时为精确计数;
+      此时分位数也由精确计数给出, 只取实际出现过的值 (如只有 0 和 1.75 的附加费列)
+    - 时间列按天计数, 给出覆盖的日期范围
+所有摘要都可以合并: 每个文件的结果按 footer 指纹缓存到 <数据目录>/_profiles/,
+多文件数据集直接合并各文件的摘要, 新上传的文件只扫描一次。
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .data_loader import DEFAULT_BATCH_ROWS, resolve_files
+from .schema import CODE_LABELS
+
+PROFILE_VERSION = 2
+PROFILE_DIR_NAME = '_profiles'
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+HLL_PRECISION = 14
+DIGEST_COMPRESSION = 200
+DIGEST_SAMPLE_ROWS = 1 << 16  # 每批最多抽样这么多行进入分位数摘要
+HEAVY_HITTER_CAPACITY = 512  # 区域 ID (265 个) 也能精确计数
+US_PER_DAY = 86_400_000_000
+
+
+class HyperLogLog:
+    """基数估计, 输入为 64 位哈希; 重复值不影响结果, 因此可以只喂每批的去重取值"""
+
+    def __init__(self, p=HLL_PRECISION, registers=None):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8) if registers is None else registers
+
+    def update(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return self
+        m, width = 1 << self.p, 66 - self.p
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # rest 不超过 50 位, 转 float64 精确, floor(log2) 即最高位
+        bits = np.zeros(len(rest), dtype=np.int64)
+        nonzero = rest > 0
+        bits[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (64 - self.p) - bits + 1
+        if len(hashes) < m:
+            np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+            return self
+        # 每个寄存器本批的最大 rank: 对 (寄存器, rank) 计数后取最后一个非零位置
+        seen = np.bincount(idx * width + rank, minlength=m * width).reshape(m, width) > 0
+        batch_max = (width - 1 - np.argmax(seen[:, ::-1], axis=1)) * seen.any(axis=1)
+        np.maximum(self.registers, batch_max.astype(np.uint8), out=self.registers)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.exp2(-self.registers.astype(np.float64)).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # 小基数时改用线性计数
+        return int(round(estimate))
+
+    def to_state(self):
+        return base64.b64encode(self.registers.tobytes()).decode('ascii')
+
+    @classmethod
+    def from_state(cls, state, p=HLL_PRECISION):
+        return cls(p, np.frombuffer(base64.b64decode(state), dtype=np.uint8).copy())
+
+
+class TDigest:
+    """按 k1 尺度函数压缩的质心摘要, 两端质心更小, 尾部分位数更准"""
+
+    def __init__(self, compression=DIGEST_COMPRESSION, means=None, weights=None):
+        self.compression = compression
+        self.means = np.empty(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.empty(0) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    def update(self, values, weight=1.0):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        return self._compress(values, np.full(len(values), float(weight)))
+
+    def merge(self, other):
+        return self._compress(other.means, other.weights)
+
+    def _compress(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        if len(means) == 0:
+            return self
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        q_left = (np.cumsum(weights) - weights) / weights.sum()
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)  # 每个质心在 k 尺度上最多跨 1 个单位
+        w = np.bincount(bucket, weights=weights)
+        mw = np.bincount(bucket, weights=weights * means)
+        keep = w > 0
+        self.means, self.weights = mw[keep] / w[keep], w[keep]
+        return self
+
+    def quantile(self, qs, lo=None, hi=None):
+        if len(self.means) == 0:
+            return [None] * len(qs)
+        total = self.weights.sum()
+        positions = np.cumsum(self.weights) - self.weights / 2
+        means = self.means
+        if lo is not None and hi is not None:
+            positions = np.concatenate([[0.0], positions, [total]])
+            means = np.concatenate([[lo], means, [hi]])
+        return np.interp(np.asarray(qs) * total, positions, means).tolist()
+
+    def to_state(self):
+        return [self.means.tolist(), self.weights.tolist()]
+
+    @classmethod
+    def from_state(cls, state, compression=DIGEST_COMPRESSION):
+        return cls(compression, *state)
+
+
+class HeavyHitters:
+    """Misra-Gries 高频项摘要; exact 为 True 时计数精确, 否则为下界 (误差不超过 总数 / 容量)"""
+
+    def __init__(self, capacity=HEAVY_HITTER_CAPACITY, counts=None, exact=True):
+        self.capacity = capacity
+        self.counts = dict(counts or {})
+        self.exact = exact
+
+    @staticmethod
+    def _truncate(counts, capacity):
+        if len(counts) <= capacity:
+            return counts, False
+        cut = sorted(counts.values(), reverse=True)[capacity]
+        return {v: c - cut for v, c in counts.items() if c > cut}, True
+
+    def update(self, values, counts):
+        values, counts = np.asarray(values), np.asarray(counts, dtype=np.int64)
+        if len(values) > self.capacity:
+            # 本批先压缩成同样容量的摘要, 再合并
+            keep = np.argpartition(-counts, self.capacity)[:self.capacity + 1]
+            cut = np.sort(counts[keep])[0]
+            keep = keep[counts[keep] > cut]
+            values, counts = values[keep], counts[keep] - cut
+            self.exact = False
+        for v, c in zip(values.tolist(), counts.tolist()):
+            self.counts[v] = self.counts.get(v, 0) + c
+        self.counts, truncated = self._truncate(self.counts, self.capacity)
+        self.exact = self.exact and not truncated
+        return self
+
+    def merge(self, other):
+        for v, c in other.counts.items():
+            self.counts[v] = self.counts.get(v, 0) + c
+        self.counts, truncated = self._truncate(self.counts, self.capacity)
+        self.exact = self.exact and other.exact and not truncated
+        return self
+
+    def quantile(self, qs):
+        """按计数取分位数 (不插值, 结果都是出现过的值); 只在 exact 时有意义"""
+        if not self.counts:
+            return [None] * len(qs)
+        values = sorted(self.counts)
+        cumulative = np.cumsum([self.counts[v] for v in values])
+        index = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return [values[i] for i in np.minimum(index, len(values) - 1)]
+
+    def top(self, k):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], str(item[0])))[:k]
+
+    def to_state(self):
+        return {'exact': self.exact, 'items': [[v, c] for v, c in self.counts.items()]}
+
+    @classmethod
+    def from_state(cls, state, capacity=HEAVY_HITTER_CAPACITY):
+        return cls(capacity, {v: c for v, c in state['items']}, state['exact'])
+
+
+def _column_kind(arrow_type):
+    if pa.types.is_dictionary(arrow_type):
+        return _column_kind(arrow_type.value_type)
+    if pa.types.is_integer(arrow_type):
+        return 'int'
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return 'float'
+    if pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        return 'time'
+    if pa.types.is_boolean(arrow_type) or pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return 'category'
+    return 'other'
+
+
+def _json_value(value):
+    """footer 统计值 / 标量转成可写入 JSON 的值"""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if hasattr(value, 'isoformat'):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    return value
+
+
+class ColumnProfiler:
+    """单列的流式摘要, 按 kind 选择需要的统计量"""
+
+    def __init__(self, name, arrow_type):
+        self.name = name
+        self.type = str(arrow_type)
+        self.kind = _column_kind(arrow_type)
+        self.rows = 0
+        self.nulls = 0
+        self.min = self.max = None
+        self.negative = 0
+        self.hll = HyperLogLog() if self.kind in ('int', 'float', 'category') else None
+        self.digest = TDigest() if self.kind in ('int', 'float') else None
+        # 浮点列也记录取值计数, 不同值超过容量后不再更新, 只用于低基数列的精确分位数
+        self.heavy = HeavyHitters() if self.kind in ('int', 'float', 'category') else None
+        self.days = {} if self.kind == 'time' else None
+
+    def _extend(self, lo, hi):
+        if lo is not None and (self.min is None or lo < self.min):
+            self.min = lo
+        if hi is not None and (self.max is None or hi > self.max):
+            self.max = hi
+
+    def update(self, array, with_min_max=True):
+        """array 为一批 pyarrow 数据; 已由 footer 得到 min/max 时 with_min_max=False"""
+        self.rows += len(array)
+        self.nulls += array.null_count
+        if self.kind == 'other':
+            return self
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        if pa.types.is_dictionary(array.type):
+            array = array.dictionary_decode()
+        valid = array.drop_null() if array.null_count else array
+        if len(valid) == 0:
+            return self
+        if with_min_max and self.kind != 'time':
+            bounds = pc.min_max(valid)
+            self._extend(_json_value(bounds['min'].as_py()), _json_value(bounds['max'].as_py()))
+
+        if self.kind in ('int', 'category'):
+            counts = pc.value_counts(valid)
+            values = counts.field('values').to_numpy(zero_copy_only=False)
+            self.heavy.update(values, counts.field('counts').to_numpy())
+            self.hll.update(pd.util.hash_array(values))
+        if self.kind == 'float' and self.heavy.exact:
+            counts = pc.value_counts(valid)
+            values = counts.field('values').to_numpy(zero_copy_only=False)
+            finite = np.isfinite(values)
+            self.heavy.update(values[finite], counts.field('counts').to_numpy()[finite])
+        if self.kind in ('int', 'float'):
+            values = valid.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+            if self.kind == 'float':
+                self.hll.update(pd.util.hash_array(values))
+            self.negative += int((values < 0).sum())
+            step = max(1, len(values) // DIGEST_SAMPLE_ROWS)
+            self.digest.update(values[::step], weight=len(values) / len(values[::step]))
+        if self.kind == 'time':
+            us = valid.cast(pa.timestamp('us')).cast(pa.int64()).to_numpy()
+            if with_min_max:
+                self._extend(pd.Timestamp(int(us.min()), unit='us').isoformat(),
+                             pd.Timestamp(int(us.max()), unit='us').isoformat())
+            days, counts = np.unique(us // US_PER_DAY, return_counts=True)
+            for day, count in zip(days.tolist(), counts.tolist()):
+                self.days[day] = self.days.get(day, 0) + count
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.negative += other.negative
+        self._extend(other.min, other.max)
+        for mine, theirs in ((self.hll, other.hll), (self.digest, other.digest), (self.heavy, other.heavy)):
+            if mine is not None:
+                mine.merge(theirs)
+        if self.days is not None:
+            for day, count in other.days.items():
+                self.days[day] = self.days.get(day, 0) + count
+        return self
+
+    def to_state(self):
+        return {
+            'name': self.name, 'type': self.type, 'kind': self.kind, 'rows': self.rows, 'nulls': self.nulls,
+            'min': self.min, 'max': self.max, 'negative': self.negative,
+            'hll': self.hll.to_state() if self.hll else None,
+            'digest': self.digest.to_state() if self.digest else None,
+            'heavy': self.heavy.to_state() if self.heavy else None,
+            'days': [[d, c] for d, c in self.days.items()] if self.days is not None else None,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        profiler = cls.__new__(cls)
+        for key in ('name', 'type', 'kind', 'rows', 'nulls', 'min', 'max', 'negative'):
+            setattr(profiler, key, state[key])
+        profiler.hll = HyperLogLog.from_state(state['hll']) if state['hll'] else None
+        profiler.digest = TDigest.from_state(state['digest']) if state['digest'] else None
+        profiler.heavy = HeavyHitters.from_state(state['heavy']) if state['heavy'] else None
+        profiler.days = {d: c for d, c in state['days']} if state['days'] is not None else None
+        return profiler
+
+    def summary(self, top_k=10):
+        out = {'type': self.type, 'kind': self.kind, 'rows': self.rows, 'nulls': self.nulls,
+               'min': self.min, 'max': self.max}
+        if self.hll is not None:
+            out['distinct'] = self.hll.count()
+        if self.digest is not None:
+            if self.heavy is not None and self.heavy.exact:
+                quantiles = self.heavy.quantile(QUANTILES)
+            else:
+                lo, hi = (self.min, self.max) if isinstance(self.min, (int, float)) else (None, None)
+                quantiles = self.digest.quantile(QUANTILES, lo, hi)
+            out['quantiles'] = {f"p{round(q * 100)}": v for q, v in zip(QUANTILES, quantiles)}
+            out['negative'] = self.negative
+        if self.heavy is not None and (self.kind != 'float' or self.heavy.exact):
+            out['top'] = self.heavy.top(top_k)
+            out['top_exact'] = self.heavy.exact
+            if self.heavy.exact:
+                out['distinct'] = len(self.heavy.counts)
+        if self.days:
+            days = sorted(self.days)
+            out['days'] = len(days)
+            out['first_day'] = str(np.datetime64(days[0], 'D'))
+            out['last_day'] = str(np.datetime64(days[-1], 'D'))
+            months = np.array(days, dtype='datetime64[D]').astype('datetime64[M]').astype(str)
+            out['rows_by_month'] = pd.Series([self.days[d] for d in days]).groupby(months).sum().astype(int).to_dict()
+        return out
+
+
+def file_fingerprint(path):
+    """文件指纹: 大小 + parquet footer 的哈希 (footer 含每个 row group 的统计信息), 无需读完整个文件"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(size - 8)
+        footer_len = int.from_bytes(f.read(4), 'little')
+        f.seek(max(0, size - 8 - footer_len))
+        footer = f.read(footer_len + 8)
+    digest = hashlib.sha256(str(size).encode() + footer).hexdigest()[:24]
+    return f"v{PROFILE_VERSION}-{digest}"
+
+
+def _footer_stats(metadata, index):
+    """某列在所有 row group 上的 (空值数, min, max); 任一 row group 缺少统计信息时返回 None"""
+    nulls, lo, hi = 0, None, None
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(index).statistics
+        if stats is None or not stats.has_min_max or not stats.has_null_count:
+            return None
+        nulls += stats.null_count
+        lo = stats.min if lo is None or stats.min < lo else lo
+        hi = stats.max if hi is None or stats.max > hi else hi
+    return nulls, _json_value(lo), _json_value(hi)
+
+
+def _profile_file(path, batch_rows=DEFAULT_BATCH_ROWS):
+    """对单个文件流式扫描一遍, 返回可合并的摘要状态"""
+    start = time.perf_counter()
+    pf = pq.ParquetFile(path)
+    metadata = pf.metadata
+    schema = pf.schema_arrow
+    profilers, footer = {}, {}
+    for index, field in enumerate(schema):
+        profilers[field.name] = ColumnProfiler(field.name, field.type)
+        stats = _footer_stats(metadata, index) if metadata.num_row_groups else None
+        if stats is not None:
+            footer[field.name] = stats
+
+    for batch in pf.iter_batches(batch_size=batch_rows):
+        for name, column in zip(batch.schema.names, batch.columns):
+            profilers[name].update(column, with_min_max=name not in footer)
+
+    for name, (nulls, lo, hi) in footer.items():
+        profiler = profilers[name]
+        profiler.nulls = nulls
+        profiler.min, profiler.max = lo, hi
+    return {
+        'version': PROFILE_VERSION,
+        'files': [os.path.basename(path)],
+        'rows': metadata.num_rows,
+        'row_groups': metadata.num_row_groups,
+        'footer_columns': sorted(footer),
+        'seconds': round(time.perf_counter() - start, 3),
+        'columns': [p.to_state() for p in profilers.values()],
+    }
+
+
+def profile_path(path, fingerprint=None):
+    fingerprint = fingerprint or file_fingerprint(path)
+    return os.path.join(os.path.dirname(os.path.abspath(path)), PROFILE_DIR_NAME, fingerprint + '.json')
+
+
+@lru_cache(maxsize=64)
+def _cached_profile(path, fingerprint):
+    cache_path = profile_path(path, fingerprint)
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    state = _profile_file(path)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        pass  # 数据目录只读时只保留进程内缓存
+    return state
+
+
+def profile_file_state(path):
+    """单个文件的摘要状态, 按指纹缓存 (进程内 + 磁盘), 同一文件只扫描一次"""
+    return _cached_profile(os.path.abspath(path), file_fingerprint(path))
+
+
+def summarize(paths, top_k=10, **filters):
+    """
+    数据集概况: paths 可以是文件、文件列表或数据集目录 (start/end 等条件只用于按分区挑选文件)。
+    返回 {'rows', 'files', 'columns': {列名: 概况}}。
+    """
+    files = resolve_files(paths, filters.get('start'), filters.get('end'))
+    if not files:
+        raise FileNotFoundError(f"没有找到数据文件: {paths}")
+    merged, names, rows, seconds = {}, [], 0, 0.0
+    for path in files:
+        state = profile_file_state(path)
+        names.extend(state['files'])
+        rows += state['rows']
+        seconds += state['seconds']
+        for column in state['columns']:
+            profiler = ColumnProfiler.from_state(column)
+            if column['name'] in merged:
+                merged[column['name']].merge(profiler)
+            else:
+                merged[column['name']] = profiler
+    return {
+        'rows': rows,
+        'files': names,
+        'scan_seconds': round(seconds, 3),
+        'columns': {name: p.summary(top_k) for name, p in merged.items()},
+    }
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:,.2f}" if abs(value) < 1e6 else f"{value:,.0f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def format_summary(summary, max_top=5):
+    """把概况整理成适合放进提示词的紧凑文本"""
+    lines = [f"数据概况: {summary['rows']:,} 行, {len(summary['columns'])} 列, {len(summary['files'])} 个文件"]
+    for name, col in summary['columns'].items():
+        parts = [f"- {name} ({col['type']})"]
+        if col['min'] is not None:
+            parts.append(f"范围 {_fmt(col['min'])} ~ {_fmt(col['max'])}")
+        if col['nulls']:
+            parts.append(f"空值 {col['nulls']:,} ({col['nulls'] / max(col['rows'], 1):.1%})")
+        if 'first_day' in col:
+            parts.append(f"覆盖 {col['days']} 天 ({col['first_day']} ~ {col['last_day']})")
+            months = col['rows_by_month']
+            if len(months) > 1:
+                # 零星的越界日期 (不足 0.1%) 合并显示, 提示数据中存在脏数据
+                major = {m: c for m, c in months.items() if c >= 0.001 * col['rows']}
+                minor = sum(months.values()) - sum(major.values())
+                parts.append("按月: " + ", ".join(f"{m} {c:,}" for m, c in major.items())
+                             + (f", 其他 {len(months) - len(major)} 个月共 {minor:,}" if minor else ""))
+        if 'distinct' in col:
+            parts.append(f"{'' if col.get('top_exact') else '约 '}{col['distinct']:,} 个不同值")
+        if col['kind'] == 'float':
+            q = col['quantiles']
+            parts.append(f"p5={_fmt(q['p5'])} p50={_fmt(q['p50'])} p95={_fmt(q['p95'])}")
+            if col['negative']:
+                parts.append(f"负值 {col['negative']:,}")
+        if col.get('top') and (col['kind'] == 'category' or col.get('distinct', 0) <= 20):
+            labels = CODE_LABELS.get(name, {})
+            total = max(col['rows'] - col['nulls'], 1)
+            top = [f"{v}{'=' + labels[v] if v in labels else ''} ({c / total:.1%})" for v, c in col['top'][:max_top]]
+            parts.append("常见取值: " + ", ".join(top))
+        elif col.get('top'):
+            parts.append("最多: " + ", ".join(f"{v} ({c:,})" for v, c in col['top'][:max_top]))
+        lines.append(", ".join(parts))
+    return "\n".join(lines)
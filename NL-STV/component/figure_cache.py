@@ -0,0 +1,230 @@
+"""
+图表缓存 (Figure Cache)
+
+NL2Vis 流程里相似的问题会反复生成同一张图, 而构建并序列化一张带完整 GeoJSON 的
+choropleth_map 很慢。这里缓存序列化后的图表 JSON:
+    - key = (规范化查询计划, 图表类型, 样式参数, 数据版本) 的哈希
+    - 区域几何按引用保存: 图中的 geojson 替换为 "geojson-ref:<摘要>", 几何本身只存一份,
+      读取时再用字符串替换内联回去, 或替换成静态资源的 URL
+    - 内存 LRU (条目数 + 字节数上限) + 可选的磁盘持久化 (gzip, 按最近访问时间淘汰)
+    - 问题文本 -> key 的索引, 重复提问可以连模型调用一起跳过
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+GEOMETRY_REF_PREFIX = 'geojson-ref:'
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+DEFAULT_MAX_DISK_BYTES = 2 * 2 ** 30
+QUESTION_INDEX_FILE = 'questions.json'
+_REF_PATTERN = re.compile(r'"' + re.escape(GEOMETRY_REF_PREFIX) + r'([0-9a-f]+)"')
+
+
+def _canonical(value):
+    if hasattr(value, 'to_dict'):
+        value = value.to_dict()
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def figure_key(plan, chart_type, style=None, data_version=None):
+    """plan 可以是 QueryPlan (取其规范化 dict) 或普通 dict"""
+    payload = _canonical({'plan': plan.to_dict() if hasattr(plan, 'to_dict') else plan,
+                          'chart': chart_type, 'style': style or {}, 'data': data_version})
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def geometry_digest(text):
+    """几何 JSON 文本的摘要, 用作引用名 (web.geo_assets 的静态文件也按它命名)"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def question_key(question):
+    """问题文本的规范化: 去首尾空白、合并空白、统一小写"""
+    return ' '.join(str(question).split()).lower()
+
+
+def split_geometry(fig):
+    """
+    序列化图表, 把各 trace 中内联的 geojson 换成引用。
+    返回 (不含几何的图表 JSON, {摘要: 几何 JSON})。
+    """
+    fig_dict = fig.to_dict() if hasattr(fig, 'to_dict') else dict(fig)
+    geometries = {}
+    for trace in fig_dict.get('data', []):
+        geo = trace.get('geojson')
+        if isinstance(geo, dict):
+            text = json.dumps(geo, separators=(',', ':'))
+            digest = geometry_digest(text)
+            geometries[digest] = text
+            trace['geojson'] = GEOMETRY_REF_PREFIX + digest
+    return pio.to_json(fig_dict, validate=False), geometries
+
+
+def resolve_geometry(figure_json, geometry_for):
+    """
+    把引用替换回去。geometry_for(摘要) 返回几何 JSON 文本 (内联),
+    或返回 {'url': ...} 表示改为引用静态资源的 URL。
+    """
+    def replace(match):
+        value = geometry_for(match.group(1))
+        if isinstance(value, dict) and 'url' in value:
+            return json.dumps(value['url'])
+        return value
+
+    return _REF_PATTERN.sub(replace, figure_json)
+
+
+class FigureCache:
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._bytes = 0
+        self._geometry = {}
+        self._questions = {}
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(os.path.join(cache_dir, 'figures'), exist_ok=True)
+            os.makedirs(os.path.join(cache_dir, 'geometry'), exist_ok=True)
+            index_path = os.path.join(cache_dir, QUESTION_INDEX_FILE)
+            if os.path.exists(index_path):
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    self._questions = json.load(f)
+
+    # --- 几何 ---
+
+    def _geometry_path(self, digest):
+        return os.path.join(self.cache_dir, 'geometry', digest + '.json')
+
+    def _put_geometry(self, geometries):
+        for digest, text in geometries.items():
+            if digest in self._geometry:
+                continue
+            self._geometry[digest] = text
+            if self.cache_dir and not os.path.exists(self._geometry_path(digest)):
+                with open(self._geometry_path(digest), 'w', encoding='utf-8') as f:
+                    f.write(text)
+
+    def geometry(self, digest):
+        """按摘要取几何 JSON 文本"""
+        if digest not in self._geometry and self.cache_dir and os.path.exists(self._geometry_path(digest)):
+            with open(self._geometry_path(digest), 'r', encoding='utf-8') as f:
+                self._geometry[digest] = f.read()
+        return self._geometry[digest]
+
+    # --- 图表 ---
+
+    def _figure_path(self, key):
+        return os.path.join(self.cache_dir, 'figures', key + '.json.gz')
+
+    def _remember(self, key, figure_json):
+        if key in self._memory:
+            self._bytes -= len(self._memory.pop(key))
+        self._memory[key] = figure_json
+        self._bytes += len(figure_json)
+        while self._memory and (len(self._memory) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def get_raw(self, key):
+        """取不含几何的图表 JSON, 未命中返回 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            if self.cache_dir and os.path.exists(self._figure_path(key)):
+                with gzip.open(self._figure_path(key), 'rt', encoding='utf-8') as f:
+                    figure_json = f.read()
+                os.utime(self._figure_path(key))  # 记录访问时间, 供磁盘淘汰使用
+                self._remember(key, figure_json)
+                self.hits += 1
+                return figure_json
+            self.misses += 1
+            return None
+
+    def get(self, key, geometry_url=None):
+        """
+        取完整的图表 JSON。geometry_url(摘要) 给出时几何以 URL 引用,
+        否则内联回图表中。
+        """
+        figure_json = self.get_raw(key)
+        if figure_json is None:
+            return None
+        return self._resolve(figure_json, geometry_url)
+
+    def _resolve(self, figure_json, geometry_url):
+        if geometry_url is not None:
+            return resolve_geometry(figure_json, lambda d: {'url': geometry_url(d)})
+        return resolve_geometry(figure_json, self.geometry)
+
+    def put(self, key, fig):
+        """缓存一张图 (go.Figure 或 dict), 返回不含几何的 JSON"""
+        figure_json, geometries = split_geometry(fig)
+        with self._lock:
+            self._put_geometry(geometries)
+            self._remember(key, figure_json)
+            if self.cache_dir:
+                tmp_path = self._figure_path(key) + '.tmp'
+                with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+                    f.write(figure_json)
+                os.replace(tmp_path, self._figure_path(key))
+                self._evict_disk()
+        return figure_json
+
+    def get_or_build(self, key, build, geometry_url=None):
+        """命中直接返回, 否则调用 build() 构建图表后缓存 (每次调用只计一次命中或未命中)"""
+        cached = self.get(key, geometry_url)
+        if cached is not None:
+            return cached
+        return self._resolve(self.put(key, build()), geometry_url)
+
+    def _evict_disk(self):
+        folder = os.path.join(self.cache_dir, 'figures')
+        entries = []
+        for name in os.listdir(folder):
+            stat = os.stat(os.path.join(folder, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(folder, name))
+            total -= size
+
+    # --- 问题索引 ---
+
+    def key_for_question(self, question):
+        """之前回答过的同一问题对应的图表 key (图表仍在缓存中时才返回)"""
+        with self._lock:
+            key = self._questions.get(question_key(question))
+            if key is None:
+                return None
+            if key in self._memory or (self.cache_dir and os.path.exists(self._figure_path(key))):
+                return key
+            return None
+
+    def remember_question(self, question, key):
+        with self._lock:
+            self._questions[question_key(question)] = key
+            if self.cache_dir:
+                path = os.path.join(self.cache_dir, QUESTION_INDEX_FILE)
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(self._questions, f, ensure_ascii=False)
+                os.replace(path + '.tmp', path)
+
+    def stats(self):
+        return {'entries': len(self._memory), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses,
+                'geometries': len(self._geometry)}
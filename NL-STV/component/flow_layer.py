@@ -0,0 +1,96 @@
+"""
+流向线图层 (Flow Layer)
+
+把 "起点 → 若干终点" 的流向一次性构建成少量 Scattermap trace:
+    - 所有线段拼接在同一组坐标里, 用 NaN 断开
+    - 所有箭头 (终点三角形) 放在一个 marker trace 里, 颜色逐点给出
+Scattermap 的 line.color 不支持数组, 所以线条按颜色档位分组,
+trace 数量最多等于色板长度, 与流向条数无关。
+"""
+import numpy as np
+import plotly.colors
+import plotly.graph_objects as go
+
+
+def flow_colors(counts, colorscale=None):
+    """对数归一化后映射到离散色板, 返回每条流向的色板下标和颜色"""
+    colorscale = colorscale or plotly.colors.sequential.Reds
+    log_counts = np.log10(np.asarray(counts, dtype=np.float64) + 1)
+    log_min, log_max = log_counts.min(), log_counts.max()
+    if log_max > log_min:
+        norm = (log_counts - log_min) / (log_max - log_min)
+    else:
+        norm = np.ones_like(log_counts)  # 只有一个值时取最深色
+    idx = (norm * (len(colorscale) - 1)).astype(np.int64)
+    return idx, np.asarray(colorscale, dtype=object)[idx]
+
+
+def build_flow_traces(origin_id, dest_ids, counts, lon_by_id, lat_by_id, names_by_id,
+                      colorscale=None, line_width=2, marker_size=10, marker_end='dest', label="去往"):
+    """
+    构建流向线与箭头 trace。
+
+    origin_id / dest_ids 可以是单个 ID 或与 counts 等长的数组 (多起点、多终点)。
+    marker_end 决定三角标记画在终点还是起点一端, 悬停显示该端的区域名。
+    lon_by_id / lat_by_id / names_by_id 是以 LocationID 为下标的数组 (缺失坐标为 NaN),
+    用数组下标代替逐行查表。
+    """
+    colorscale = colorscale or plotly.colors.sequential.Reds
+    counts = np.asarray(counts)
+    if len(counts) == 0:
+        return []
+    origin_ids = np.broadcast_to(np.asarray(origin_id, dtype=np.int64), counts.shape)
+    dest_ids = np.broadcast_to(np.asarray(dest_ids, dtype=np.int64), counts.shape)
+
+    o_lon, o_lat = lon_by_id[origin_ids], lat_by_id[origin_ids]
+    d_lon, d_lat = lon_by_id[dest_ids], lat_by_id[dest_ids]
+    valid = ~np.isnan(o_lon) & ~np.isnan(d_lon)
+    if not valid.any():
+        return []
+    origin_ids, dest_ids, counts = origin_ids[valid], dest_ids[valid], counts[valid]
+    o_lon, o_lat, d_lon, d_lat = o_lon[valid], o_lat[valid], d_lon[valid], d_lat[valid]
+    color_idx, colors = flow_colors(counts, colorscale)
+
+    traces = []
+    # 1. 线条: 每个颜色档位一个 trace, 线段之间用 NaN 断开
+    for level in np.unique(color_idx):
+        sel = color_idx == level
+        n = int(sel.sum())
+        lons = np.column_stack([o_lon[sel], d_lon[sel], np.full(n, np.nan)]).ravel()
+        lats = np.column_stack([o_lat[sel], d_lat[sel], np.full(n, np.nan)]).ravel()
+        traces.append(go.Scattermap(
+            lon=lons.astype(np.float32),
+            lat=lats.astype(np.float32),
+            mode='lines',
+            line=dict(width=line_width, color=colorscale[level]),
+            opacity=0.8,
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+
+    # 2. 箭头: 所有标记放在同一个 marker trace 中, 颜色逐点指定
+    if marker_end == 'dest':
+        m_ids, m_lon, m_lat = dest_ids, d_lon, d_lat
+    else:
+        m_ids, m_lon, m_lat = origin_ids, o_lon, o_lat
+    hover = np.char.add(np.char.add(f"{label}: ", names_by_id[m_ids].astype(str)),
+                        np.char.add("<br>数量: ", counts.astype(np.int64).astype(str)))
+    traces.append(go.Scattermap(
+        lon=m_lon.astype(np.float32),
+        lat=m_lat.astype(np.float32),
+        mode='markers',
+        marker=dict(size=marker_size, symbol='triangle', color=colors.tolist()),
+        showlegend=False,
+        text=hover,
+        hoverinfo="text"
+    ))
+    return traces
+
+
+def id_indexed(ids, values, size, fill=np.nan):
+    """把 (ID, 值) 对展开为以 ID 为下标的数组, 便于向量化查找"""
+    values = np.asarray(values)
+    dtype = object if values.dtype.kind in 'OUST' else np.float64
+    out = np.full(size, fill, dtype=dtype)
+    out[np.asarray(ids, dtype=np.int64)] = values
+    return out
@@ -0,0 +1,170 @@
+"""
+服务端栅格化密度图 (Heatmap)
+
+点级数据 (百万行以上) 不能直接交给浏览器里的 Plotly 绘制, 这里在服务端完成:
+    - DensityGrid 把经纬度投影到 Web Mercator 像素网格, 逐批 np.bincount 累加,
+      内存只与像素数有关, 可以与 iter_trip_batches 配合流式处理任意行数
+    - render_png() 用对数色阶 + 256 色查找表着色, numpy/zlib 直接编码 PNG
+    - 作为 image 图层叠加在 carto-positron 底图上, 前端渲染开销只取决于像素数
+TLC 新版数据没有经纬度, 此时用区域中心点加高斯抖动近似上车位置;
+旧版数据 (含 pickup_longitude/pickup_latitude) 直接使用真实坐标。
+"""
+import base64
+import struct
+import zlib
+
+import numpy as np
+import plotly.colors
+import plotly.graph_objects as go
+import pyarrow.parquet as pq
+
+from .animation import log_colorbar_ticks
+from .data_loader import iter_trip_batches, resolve_files
+
+NYC_BOUNDS = (-74.26, 40.49, -73.69, 40.92)  # (lon_min, lat_min, lon_max, lat_max)
+DEFAULT_WIDTH = 1024
+DEFAULT_JITTER_DEG = 0.004  # 约 400 米
+POINT_COLUMNS = ('pickup_longitude', 'pickup_latitude')
+
+
+def _mercator_y(lat):
+    lat = np.radians(np.clip(lat, -85.0, 85.0))
+    return np.log(np.tan(np.pi / 4 + lat / 2))
+
+
+class DensityGrid:
+    """Web Mercator 下等距的像素计数网格, 行 0 为北边"""
+
+    def __init__(self, bounds=NYC_BOUNDS, width=DEFAULT_WIDTH, height=None):
+        self.bounds = tuple(float(b) for b in bounds)
+        lon_min, lat_min, lon_max, lat_max = self.bounds
+        self._x0, self._x1 = np.radians(lon_min), np.radians(lon_max)
+        self._y0, self._y1 = _mercator_y(lat_min), _mercator_y(lat_max)
+        self.width = int(width)
+        # 默认按墨卡托下的长宽比确定高度, 像素为正方形
+        self.height = int(height or round(self.width * (self._y1 - self._y0) / (self._x1 - self._x0)))
+        self.counts = np.zeros(self.width * self.height, dtype=np.float64)
+        self.points = 0
+
+    def update(self, lon, lat, weights=None):
+        """累加一批点, 超出范围的点忽略"""
+        fx = (np.radians(np.asarray(lon, dtype=np.float64)) - self._x0) / (self._x1 - self._x0)
+        fy = (self._y1 - _mercator_y(np.asarray(lat, dtype=np.float64))) / (self._y1 - self._y0)
+        inside = (fx >= 0) & (fx < 1) & (fy >= 0) & (fy < 1)
+        ix = (fx[inside] * self.width).astype(np.int64)
+        iy = (fy[inside] * self.height).astype(np.int64)
+        w = None if weights is None else np.asarray(weights, dtype=np.float64)[inside]
+        self.counts += np.bincount(iy * self.width + ix, weights=w, minlength=self.counts.size)
+        self.points += int(inside.sum())
+        return self
+
+    def image(self):
+        return self.counts.reshape(self.height, self.width)
+
+    def corner_coordinates(self):
+        """image 图层需要的四个角 (左上、右上、右下、左下)"""
+        lon_min, lat_min, lon_max, lat_max = self.bounds
+        return [[lon_min, lat_max], [lon_max, lat_max], [lon_max, lat_min], [lon_min, lat_min]]
+
+
+def jitter_points(zone_ids, lon_by_id, lat_by_id, jitter_deg=DEFAULT_JITTER_DEG, rng=None):
+    """用区域中心点加高斯抖动近似点坐标; 没有中心点的区域为 NaN (会被网格忽略)"""
+    rng = rng or np.random.default_rng(0)
+    zone_ids = np.asarray(zone_ids, dtype=np.int64)
+    n = len(zone_ids)
+    lon = lon_by_id[zone_ids] + rng.normal(0, jitter_deg, n)
+    lat = lat_by_id[zone_ids] + rng.normal(0, jitter_deg * 0.76, n)  # 纬度 40.7° 附近经纬度等距
+    return lon, lat
+
+
+def density_from_trips(paths, grid, lon_by_id=None, lat_by_id=None, zone_column='PULocationID',
+                       jitter_deg=DEFAULT_JITTER_DEG, seed=0, **filters):
+    """流式读取行程并累加到网格, 有经纬度列时直接使用, 否则按区域中心点抖动"""
+    files = resolve_files(paths, filters.get('start'), filters.get('end'), filters.get('zones'), zone_column)
+    if not files:
+        return grid
+    has_points = set(POINT_COLUMNS) <= set(pq.read_schema(files[0]).names)
+    if not has_points and lon_by_id is None:
+        raise ValueError("数据没有经纬度列, 需要提供区域中心点 lon_by_id / lat_by_id")
+
+    rng = np.random.default_rng(seed)
+    columns = list(POINT_COLUMNS) if has_points else [zone_column]
+    for df in iter_trip_batches(paths, columns=columns, zone_column=zone_column, **filters):
+        if has_points:
+            grid.update(df[POINT_COLUMNS[0]].to_numpy(), df[POINT_COLUMNS[1]].to_numpy())
+        else:
+            grid.update(*jitter_points(df[zone_column].to_numpy(), lon_by_id, lat_by_id, jitter_deg, rng))
+    return grid
+
+
+def colorscale_lut(colorscale="Viridis", n=256):
+    """把 Plotly 色阶采样成 (n, 3) 的 uint8 查找表"""
+    colors = plotly.colors.sample_colorscale(colorscale, np.linspace(0, 1, n), colortype='tuple')
+    rgb = np.array(colors, dtype=np.float64)
+    if rgb.max() <= 1.0:
+        rgb = rgb * 255
+    return rgb.round().astype(np.uint8)
+
+
+def encode_png(rgba):
+    """把 (H, W, 4) 的 uint8 数组编码为 PNG (每行过滤类型 0)"""
+    height, width, _ = rgba.shape
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+def render_png(image, colorscale="Viridis", vmax=None, alpha=220):
+    """
+    对数色阶着色: log10(count + 1) / log10(vmax + 1) 映射到色阶, 计数为 0 的像素透明。
+    返回 (PNG 字节, vmax)。
+    """
+    image = np.asarray(image, dtype=np.float64)
+    vmax = float(vmax if vmax is not None else image.max())
+    scale = np.log10(vmax + 1) if vmax > 0 else 1.0
+    level = np.clip(np.log10(image + 1) / scale, 0, 1)
+    lut = colorscale_lut(colorscale)
+    rgba = np.empty(image.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = lut[(level * (len(lut) - 1)).astype(np.int64)]
+    rgba[..., 3] = np.where(image > 0, alpha, 0)
+    return encode_png(rgba), vmax
+
+
+def png_data_uri(png):
+    return 'data:image/png;base64,' + base64.b64encode(png).decode('ascii')
+
+
+def build_density_map(grid, colorscale="Viridis", opacity=0.85, zoom=10,
+                      center=None, colorbar_title="上车量", vmax=None):
+    """
+    把网格渲染成 PNG 并作为 image 图层叠加到底图上。
+    另加一个不可见的 marker trace 只用来显示色条 (对数刻度标注原始值)。
+    """
+    png, vmax = render_png(grid.image(), colorscale, vmax)
+    lon_min, lat_min, lon_max, lat_max = grid.bounds
+    center = center or {"lat": (lat_min + lat_max) / 2, "lon": (lon_min + lon_max) / 2}
+    tick_vals, tick_text = log_colorbar_ticks(vmax)
+
+    fig = go.Figure(go.Scattermap(
+        lon=[center['lon']], lat=[center['lat']], mode='markers', hoverinfo='skip',
+        marker=dict(size=0, opacity=0, color=[0.0], colorscale=colorscale,
+                    cmin=0, cmax=float(np.log10(vmax + 1)) or 1.0, showscale=True,
+                    colorbar=dict(title=colorbar_title, tickvals=tick_vals, ticktext=tick_text)),
+    ))
+    fig.update_layout(
+        map=dict(
+            style="carto-positron", zoom=zoom, center=center,
+            layers=[dict(sourcetype='image', source=png_data_uri(png),
+                         coordinates=grid.corner_coordinates(), opacity=opacity)],
+        ),
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        showlegend=False,
+    )
+    return fig
@@ -0,0 +1,191 @@
+"""
+热路径计时 (Instrumentation)
+
+用 span() 上下文管理器 / timed() 装饰器包住各阶段 (数据加载、聚合、建图、图表序列化):
+    - 记录墙钟时间与当前线程的 CPU 时间 (thread_time, 多个会话并发重跑时互不计入), 可选记录字节数
+    - 一次重跑 (RunTrace) 内的 span 按开始顺序记录, 嵌套的 span 名称以 "/" 连接
+    - 每个阶段与整次重跑的耗时进入进程内的滑动窗口 (RollingWindow), 给出 p50 / p95 / p99;
+      窗口中的名称带页面前缀, 如 "dashboard:load_data"、"dashboard:rerun"
+    - 重跑结束时可以把记录追加写成 JSON lines, 线上据此统计交互延迟的 p95 (summarize_jsonl)
+不在重跑中调用 span() 时只进入滑动窗口。开销只有两次计时调用, 可以常开。
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+
+import numpy as np
+
+DEFAULT_WINDOW = 500  # 每个名称保留最近 500 个样本
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    start_ms: float  # 相对重跑开始的时间
+    wall_ms: float = 0.0
+    cpu_ms: float = 0.0
+    bytes: int = None
+
+    def to_dict(self):
+        out = {'name': self.name, 'start_ms': round(self.start_ms, 3),
+               'wall_ms': round(self.wall_ms, 3), 'cpu_ms': round(self.cpu_ms, 3)}
+        if self.bytes is not None:
+            out['bytes'] = self.bytes
+        return out
+
+
+@dataclass
+class RunTrace:
+    """一次脚本重跑的计时记录"""
+    page: str
+    attrs: dict = field(default_factory=dict)
+    started: float = field(default_factory=time.time)
+    spans: list = field(default_factory=list)
+    wall_ms: float = None
+    cpu_ms: float = None
+    _wall0: float = field(default_factory=time.perf_counter, repr=False)
+    _cpu0: float = field(default_factory=time.thread_time, repr=False)
+    _stack: list = field(default_factory=list, repr=False)
+
+    @property
+    def figure_bytes(self):
+        return sum(s.bytes for s in self.spans if s.bytes is not None)
+
+    def finish(self):
+        self.wall_ms = (time.perf_counter() - self._wall0) * 1000
+        self.cpu_ms = (time.thread_time() - self._cpu0) * 1000
+        return self
+
+    def to_dict(self):
+        return {'ts': round(self.started, 3), 'page': self.page, **self.attrs,
+                'wall_ms': None if self.wall_ms is None else round(self.wall_ms, 3),
+                'cpu_ms': None if self.cpu_ms is None else round(self.cpu_ms, 3),
+                'figure_bytes': self.figure_bytes,
+                'spans': [s.to_dict() for s in self.spans]}
+
+
+class RollingWindow:
+    """按名称保存最近 size 个样本 (毫秒), 线程安全"""
+
+    def __init__(self, size=DEFAULT_WINDOW):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.size)).append(value)
+
+    def percentiles(self, name, qs=PERCENTILES):
+        with self._lock:
+            values = np.array(self._samples.get(name, ()), dtype=np.float64)
+        if not len(values):
+            return None
+        return dict(zip((f"p{q}" for q in qs), np.percentile(values, qs)))
+
+    def summary(self, qs=PERCENTILES):
+        """{名称: {'n', 'p50', 'p95', 'p99', 'max'}}"""
+        with self._lock:
+            snapshot = {name: np.array(v, dtype=np.float64) for name, v in self._samples.items()}
+        return {name: {'n': len(v), **dict(zip((f"p{q}" for q in qs), np.percentile(v, qs))), 'max': v.max()}
+                for name, v in sorted(snapshot.items()) if len(v)}
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+WINDOW = RollingWindow()
+RECENT_RUNS = deque(maxlen=200)  # 最近的重跑记录 (dict), 供面板下载
+_current = ContextVar('nlstv_run_trace', default=None)
+_export_lock = threading.Lock()
+
+
+def current_run():
+    return _current.get()
+
+
+def begin_run(page, **attrs):
+    """开始记录一次重跑; 同一线程上未结束的记录 (如 st.stop() 提前退出) 直接丢弃"""
+    trace = RunTrace(page, attrs)
+    _current.set(trace)
+    return trace
+
+
+def end_run(export_path=None):
+    """结束当前重跑, 计入滑动窗口, export_path 不为 None 时追加写入 JSON lines"""
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    trace.finish()
+    WINDOW.add(f"{trace.page}:rerun", trace.wall_ms)
+    record = trace.to_dict()
+    RECENT_RUNS.append(record)
+    if export_path:
+        export_jsonl(record, export_path)
+    return trace
+
+
+@contextmanager
+def span(name):
+    """
+    计时一个阶段, 产出 SpanRecord, 调用方可以设置 record.bytes (如图表 JSON 的字节数)。
+    阶段抛出异常时同样记录耗时。
+    """
+    trace = _current.get()
+    full_name = "/".join([*trace._stack, name]) if trace is not None and trace._stack else name
+    wall0, cpu0 = time.perf_counter(), time.thread_time()
+    record = SpanRecord(full_name, (wall0 - trace._wall0) * 1000 if trace is not None else 0.0)
+    if trace is not None:
+        trace.spans.append(record)
+        trace._stack.append(name)
+    try:
+        yield record
+    finally:
+        record.wall_ms = (time.perf_counter() - wall0) * 1000
+        record.cpu_ms = (time.thread_time() - cpu0) * 1000
+        if trace is not None:
+            trace._stack.pop()
+        WINDOW.add(f"{trace.page}:{full_name}" if trace is not None else full_name, record.wall_ms)
+
+
+def timed(name=None):
+    """装饰器版本的 span(), 默认以函数名命名"""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export_jsonl(record, path):
+    line = json.dumps(record, ensure_ascii=False, default=float)
+    with _export_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(line + "\n")
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize_jsonl(path, qs=PERCENTILES):
+    """从导出的记录重新计算各页面整次重跑与各阶段耗时的分位数"""
+    window = RollingWindow(size=None)
+    for record in read_jsonl(path):
+        if record.get('wall_ms') is not None:
+            window.add(f"{record['page']}:rerun", record['wall_ms'])
+        for s in record.get('spans', ()):
+            window.add(f"{record['page']}:{s['name']}", s['wall_ms'])
+    return window.summary(qs)
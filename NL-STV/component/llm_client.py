@@ -0,0 +1,227 @@
+"""
+异步大模型客户端 (LLM Client)
+
+所有后端 (Ollama / LM Studio / Gemini) 都走 OpenAI 兼容的 /chat/completions 接口:
+    - 每个后端只创建一个带连接池的 httpx.AsyncClient, 多个请求并发复用
+    - stream_chat() 以异步生成器逐个产出 token
+    - temperature 为 0 的确定性请求按内容寻址缓存 (请求体的 sha256 -> 回复)
+    - truncate_history() 限制发送的历史长度, 避免提示词无限增长
+base_url 可以指向任意兼容服务; 测试时还可以传入 transport (如 httpx.MockTransport),
+用进程内的桩服务代替真实后端 (见 test_code/test_llm_client.py)。
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import httpx
+
+BACKENDS = {
+    'ollama': {
+        'base_url': 'http://localhost:11434/v1',
+        'api_key': 'ollama',  # Ollama 不需要真实的 key，但必须是非空字符串
+        'model': 'llama3.1:latest',
+    },
+    'lmstudio': {
+        'base_url': 'http://localhost:1234/v1',
+        'api_key': 'lm-studio',
+        'model': 'deepseek/deepseek-r1-0528-qwen3-8b',
+    },
+    'gemini': {
+        'base_url': 'https://generativelanguage.googleapis.com/v1beta/openai',
+        'api_key_env': 'GEMINI_API_KEY',
+        'model': 'gemini-2.5-flash',
+    },
+}
+
+DEFAULT_PARAMS = {
+    'temperature': 0.7,
+    'top_p': 0.9,
+    'max_tokens': 5120,
+    'frequency_penalty': 0.5,
+    'presence_penalty': 0.5,
+}
+DEFAULT_HISTORY_CHARS = 12000
+MEMORY_CACHE_ENTRIES = 1024
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+def truncate_history(messages, max_chars=DEFAULT_HISTORY_CHARS):
+    """
+    保留开头的 system 提示词和最近的若干条消息, 使总字符数不超过 max_chars。
+    只有开头连续的 system 消息固定保留; 对话中间的 system 消息与其他消息一样按顺序截断,
+    保留下来的消息顺序不变。最后一条消息 (当前的用户输入) 总是保留。
+    """
+    n_leading = 0
+    while n_leading < len(messages) and messages[n_leading]['role'] == 'system':
+        n_leading += 1
+    system, dialog = list(messages[:n_leading]), messages[n_leading:]
+    budget = max_chars - sum(len(m['content']) for m in system)
+    kept = []
+    for message in reversed(dialog):
+        size = len(message['content'])
+        if kept and size > budget:
+            break
+        kept.append(message)
+        budget -= size
+    return system + kept[::-1]
+
+
+class ResponseCache:
+    """按请求内容寻址的回复缓存, 内存中按 LRU 保留最近 max_entries 条, 指定目录时同时落盘"""
+
+    def __init__(self, cache_dir=None, max_entries=MEMORY_CACHE_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(payload):
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, key + '.json')
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    response = json.load(f)['response']
+                self._remember(key, response)
+                return response
+        return None
+
+    def _remember(self, key, response):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key, response):
+        self._remember(key, response)
+        if self.cache_dir:
+            with open(os.path.join(self.cache_dir, key + '.json'), 'w', encoding='utf-8') as f:
+                json.dump({'response': response}, f, ensure_ascii=False)
+
+
+class LLMClient:
+    def __init__(self, backend='ollama', base_url=None, api_key=None, model=None, cache=None,
+                 max_connections=32, timeout=120.0, max_history_chars=DEFAULT_HISTORY_CHARS, transport=None):
+        if base_url is None and backend not in BACKENDS:
+            raise ValueError(f"未知的后端: {backend}, 可选: {list(BACKENDS)}")
+        config = BACKENDS.get(backend, {})
+        self.backend = backend
+        self.base_url = (base_url or config['base_url']).rstrip('/')
+        self.model = model or config.get('model')
+        api_key = api_key or config.get('api_key') or os.environ.get(config.get('api_key_env', ''), '')
+        self.cache = cache if cache is not None else ResponseCache()
+        self.max_history_chars = max_history_chars
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={'Authorization': f'Bearer {api_key}'},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            transport=transport,
+        )
+
+    def _payload(self, messages, stream, params):
+        merged = {**DEFAULT_PARAMS, **params}
+        return {
+            'model': self.model,
+            'messages': truncate_history(messages, self.max_history_chars),
+            'stream': stream,
+            **merged,
+        }
+
+    def _cache_key(self, payload):
+        # 只缓存确定性请求; 是否流式不影响结果
+        if payload.get('temperature') != 0:
+            return None
+        return self.cache.key({k: v for k, v in payload.items() if k != 'stream'})
+
+    async def stream_chat(self, messages, **params):
+        """流式对话, 逐个产出回复片段"""
+        payload = self._payload(messages, True, params)
+        key = self._cache_key(payload)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        pieces = []
+        try:
+            async with self._http.stream('POST', '/chat/completions', json=payload) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise LLMError(f"{self.backend} 返回 {response.status_code}: {body[:500]!r}")
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    choices = json.loads(data).get('choices') or [{}]
+                    # 兼容性处理：有些模型返回的 delta 可能为空
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        pieces.append(content)
+                        yield content
+        except httpx.HTTPError as e:
+            raise LLMError(f"{self.backend} 请求失败 ({type(e).__name__}): {e}") from e
+        if key is not None:
+            self.cache.put(key, ''.join(pieces))
+
+    async def chat(self, messages, **params):
+        """非流式对话, 返回完整回复"""
+        payload = self._payload(messages, False, params)
+        key = self._cache_key(payload)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            response = await self._http.post('/chat/completions', json=payload)
+        except httpx.HTTPError as e:
+            raise LLMError(f"{self.backend} 请求失败 ({type(e).__name__}): {e}") from e
+        if response.status_code != 200:
+            raise LLMError(f"{self.backend} 返回 {response.status_code}: {response.text[:500]}")
+        content = response.json()['choices'][0]['message']['content'] or ''
+        if key is not None:
+            self.cache.put(key, content)
+        return content
+
+    async def chat_many(self, conversations, **params):
+        """并发发送多组对话, 共享同一个连接池"""
+        return await asyncio.gather(*(self.chat(messages, **params) for messages in conversations))
+
+    async def aclose(self):
+        """关闭连接池; 由 get_client() 共享的客户端同时从共享表中移除, 之后再取会新建"""
+        for key, client in list(_clients.items()):
+            if client is self:
+                del _clients[key]
+        await self._http.aclose()
+
+
+_clients = {}
+
+
+def get_client(backend='ollama', **kwargs):
+    """
+    相同后端与参数复用同一个客户端 (及其连接池); 需在同一个事件循环中使用。
+    值为 None 的参数视为未指定, 因此 get_client(b, base_url=os.environ.get(...)) 在变量未设置时
+    与 get_client(b) 是同一个客户端; 参数不同 (如 base_url) 时各自创建客户端。
+    """
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    key = (backend, tuple(sorted(kwargs.items())))
+    if key not in _clients:
+        _clients[key] = LLMClient(backend, **kwargs)
+    return _clients[key]
@@ -0,0 +1,191 @@
+"""
+自然语言 → 查询计划 (NL Processor)
+
+模型把用户的问题翻译成一个 JSON 查询计划, 这里负责:
+    - 给模型的提示词 (PLAN_PROMPT)
+    - 从模型输出中提取并校验 JSON, 转换为 QueryPlan
+    - 规范化: 去重排序、统一大小写、丢弃默认值, 使措辞不同但含义相同的问题得到同一个 key
+查询计划由 query_engine.QueryEngine 执行。
+"""
+import datetime
+import hashlib
+import json
+import math
+import re
+from dataclasses import dataclass, asdict, fields
+
+import pandas as pd
+
+GROUP_DIMS = ('hour', 'weekday', 'day', 'PULocationID', 'DOLocationID', 'payment_type',
+              'pu_borough', 'do_borough')
+METRICS = ('count', 'fare_sum', 'fare_mean', 'total_sum', 'total_mean', 'tip_mean', 'tip_rate',
+           'distance_mean')
+BOROUGHS = ('Bronx', 'Brooklyn', 'EWR', 'Manhattan', 'Queens', 'Staten Island', 'Unknown')
+
+PLAN_PROMPT = """你是 NYC 出租车数据的查询规划器。请把用户的问题转换为一个 JSON 对象, 只输出 JSON, 不要解释。
+可用字段 (都可省略):
+  "start", "end":            上车时间范围, ISO 日期, 左闭右开, 如 "2025-01-01"
+  "hours":                   上车小时列表 (0-23)
+  "weekdays":                星期列表 (0=周一 ... 6=周日)
+  "pu_zones", "do_zones":    上车/下车区域 LocationID 列表
+  "pu_boroughs", "do_boroughs": 上车/下车行政区列表, 取值: %s
+  "payment_types":           支付方式代码列表 (1=信用卡, 2=现金, 3=免费, 4=争议, 5=未知, 6=作废)
+  "fare_min", "fare_max":    fare_amount 范围 (美元)
+  "distance_min", "distance_max": trip_distance 范围 (英里)
+  "group_by":                分组维度列表, 取值: %s
+  "metrics":                 指标列表, 取值: %s (默认 ["count"])
+  "top_k":                   只保留按第一个指标降序的前 k 组
+""" % (', '.join(BOROUGHS), ', '.join(GROUP_DIMS), ', '.join(METRICS))
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    start: str = None
+    end: str = None
+    hours: tuple = None
+    weekdays: tuple = None
+    pu_zones: tuple = None
+    do_zones: tuple = None
+    pu_boroughs: tuple = None
+    do_boroughs: tuple = None
+    payment_types: tuple = None
+    fare_min: float = None
+    fare_max: float = None
+    distance_min: float = None
+    distance_max: float = None
+    group_by: tuple = ()
+    metrics: tuple = ('count',)
+    top_k: int = None
+
+    def to_dict(self):
+        """只保留非默认字段, 作为规范化表示"""
+        defaults = QueryPlan()
+        return {k: (list(v) if isinstance(v, tuple) else v)
+                for k, v in asdict(self).items() if v != getattr(defaults, k)}
+
+    def key(self):
+        """规范化计划的哈希, 用作结果缓存的 key"""
+        payload = json.dumps(self.to_dict(), sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _int_set(values, lo, hi, name):
+    if values is None:
+        return None
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    bad = [v for v in values if not _is_int(v)]
+    if bad:
+        raise ValueError(f"{name} 只能是整数列表: {bad}")
+    out = sorted(set(values))
+    if any(v < lo or v > hi for v in out):
+        raise ValueError(f"{name} 超出范围 [{lo}, {hi}]: {out}")
+    return tuple(out) or None
+
+
+def _name_set(values, allowed, name):
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    canonical = {a.lower(): a for a in allowed}
+    out = set()
+    for v in values:
+        key = str(v).strip().lower()
+        if key not in canonical:
+            raise ValueError(f"未知的 {name}: {v}, 可选: {list(allowed)}")
+        out.add(canonical[key])
+    return tuple(sorted(out)) or None
+
+
+def _ordered_names(values, allowed, name):
+    """group_by / metrics 的顺序决定输出列顺序, 只去重不排序"""
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    canonical = {a.lower(): a for a in allowed}
+    out = []
+    for v in values:
+        key = str(v).strip().lower()
+        if key not in canonical:
+            raise ValueError(f"未知的 {name}: {v}, 可选: {list(allowed)}")
+        if canonical[key] not in out:
+            out.append(canonical[key])
+    return tuple(out)
+
+
+def _number(value, name):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{name} 应为数值: {value!r}")
+    return float(value)
+
+
+def _date(value, name):
+    if value is None:
+        return None
+    if not isinstance(value, (str, datetime.date)):
+        raise ValueError(f"{name} 应为 ISO 日期字符串: {value!r}")
+    timestamp = pd.Timestamp(value)
+    if pd.isna(timestamp):
+        raise ValueError(f"{name} 应为 ISO 日期字符串: {value!r}")
+    return timestamp.isoformat()
+
+
+def _top_k(value):
+    if value is None:
+        return None
+    if not _is_int(value) or value < 1:
+        raise ValueError(f"top_k 应为正整数: {value!r}")
+    return value
+
+
+def parse_plan(spec):
+    """把模型给出的 dict 校验并规范化为 QueryPlan, 非法字段 (包括类型不对的取值) 一律抛出 ValueError"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"查询计划应为 JSON 对象: {spec!r}")
+    unknown = set(spec) - {f.name for f in fields(QueryPlan)}
+    if unknown:
+        raise ValueError(f"未知的查询字段: {sorted(unknown)}")
+    return QueryPlan(
+        start=_date(spec.get('start'), 'start'),
+        end=_date(spec.get('end'), 'end'),
+        hours=_int_set(spec.get('hours'), 0, 23, 'hours'),
+        weekdays=_int_set(spec.get('weekdays'), 0, 6, 'weekdays'),
+        pu_zones=_int_set(spec.get('pu_zones'), 1, 265, 'pu_zones'),
+        do_zones=_int_set(spec.get('do_zones'), 1, 265, 'do_zones'),
+        pu_boroughs=_name_set(spec.get('pu_boroughs'), BOROUGHS, 'pu_boroughs'),
+        do_boroughs=_name_set(spec.get('do_boroughs'), BOROUGHS, 'do_boroughs'),
+        payment_types=_int_set(spec.get('payment_types'), 0, 6, 'payment_types'),
+        fare_min=_number(spec.get('fare_min'), 'fare_min'),
+        fare_max=_number(spec.get('fare_max'), 'fare_max'),
+        distance_min=_number(spec.get('distance_min'), 'distance_min'),
+        distance_max=_number(spec.get('distance_max'), 'distance_max'),
+        group_by=_ordered_names(spec.get('group_by'), GROUP_DIMS, 'group_by') or (),
+        metrics=_ordered_names(spec.get('metrics'), METRICS, 'metrics') or ('count',),
+        top_k=_top_k(spec.get('top_k')),
+    )
+
+
+def build_plan_messages(question, data_summary=None):
+    """组装发送给模型的对话消息; data_summary 为 data_summarizer.format_summary() 的数据概况文本"""
+    system = PLAN_PROMPT if not data_summary else PLAN_PROMPT + "\n" + data_summary
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": question},
+    ]
+
+
+def plan_from_llm_output(text):
+    """从模型输出中提取第一个 JSON 对象 (兼容 ```json 代码块与 <think> 段落) 并解析"""
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.S)
+    match = re.search(r'\{.*\}', text, flags=re.S)
+    if not match:
+        raise ValueError("模型输出中没有找到 JSON 查询计划")
+    return parse_plan(json.loads(match.group(0)))
@@ -0,0 +1,226 @@
+"""
+起终点流向索引 (OD Index)
+
+由预聚合的 od_count 立方体 (小时, PU, DO) 一次性构建, 之后流向图的每次交互都不再扫描数据:
+    - 每个时段 (hour band) 一份 CSR 稀疏矩阵, 每行内的终点已按流量降序排列,
+      单个起点的 Top-K 去向就是行切片的前 K 项
+    - 同时保存转置 (CSC 视角), 用于"某终点的主要来源"这类反向查询
+    - 多个区域或整个行政区的选择: 合并对应的行, 代价只与区域数有关
+    - 构建结果可保存为 od_index.npz, 与立方体放在一起; cached_od_index() 优先读取它,
+      新进程的首次加载不必重新排序
+"""
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from .aggregate_store import FORMAT_VERSION, N_ZONES, artifact_dir
+
+N_REAL_ZONES = 263
+OD_INDEX_FILE = 'od_index.npz'
+CSR_FIELDS = ('indptr', 'indices', 'counts', 'totals')
+
+# 时段 -> 小时列表
+HOUR_BANDS = {
+    'all': tuple(range(24)),
+    'night': (0, 1, 2, 3, 4, 5),
+    'am_peak': (6, 7, 8, 9),
+    'midday': (10, 11, 12, 13, 14, 15),
+    'pm_peak': (16, 17, 18, 19),
+    'evening': (20, 21, 22, 23),
+}
+HOUR_BAND_LABELS = {
+    'all': '全天',
+    'night': '深夜 (0-5 点)',
+    'am_peak': '早高峰 (6-9 点)',
+    'midday': '日间 (10-15 点)',
+    'pm_peak': '晚高峰 (16-19 点)',
+    'evening': '夜间 (20-23 点)',
+}
+
+
+@dataclass(frozen=True)
+class RankedCSR:
+    """每行内按计数降序排列的 CSR 矩阵, totals 为各行合计"""
+    indptr: np.ndarray
+    indices: np.ndarray
+    counts: np.ndarray
+    totals: np.ndarray
+
+    @classmethod
+    def from_dense(cls, matrix):
+        rows, cols = np.nonzero(matrix)
+        counts = matrix[rows, cols]
+        order = np.lexsort((cols, -counts, rows))  # 行内按计数降序, 同计数按 ID 升序
+        indptr = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=matrix.shape[0]), out=indptr[1:])
+        return cls(indptr=indptr, indices=cols[order].astype(np.int64), counts=counts[order].astype(np.int64),
+                   totals=matrix.sum(axis=1, dtype=np.int64))
+
+    def row(self, i, k=None):
+        """第 i 行的前 k 项 (列号, 计数), 返回视图"""
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        if k is not None:
+            stop = min(stop, start + k)
+        return self.indices[start:stop], self.counts[start:stop]
+
+    def dense_row_sum(self, rows):
+        """若干行相加后的稠密向量"""
+        out = np.zeros(len(self.totals), dtype=np.int64)
+        for i in rows:
+            cols, counts = self.row(i)
+            out[cols] += counts
+        return out
+
+
+def _top_k(values, k):
+    """稠密向量中最大的 k 个非零项, 按值降序 (同值按下标升序)"""
+    nonzero = np.flatnonzero(values)
+    if len(nonzero) > k:
+        nonzero = nonzero[np.argpartition(-values[nonzero], k - 1)[:k]]
+    order = np.lexsort((nonzero, -values[nonzero]))
+    return nonzero[order], values[nonzero[order]]
+
+
+class ODIndex:
+    """
+    各时段的正向 (起点 -> 终点) 与反向 (终点 <- 起点) 排名索引。
+    zones 为参与排名的区域, 默认 1-263 (排除未知区域 264/265)。
+    """
+
+    def __init__(self, od_cube, zones=None, bands=None, lookup=None):
+        self.bands = dict(bands or HOUR_BANDS)
+        valid = np.zeros(N_ZONES, dtype=bool)
+        valid[list(zones) if zones is not None else range(1, N_REAL_ZONES + 1)] = True
+        self.valid = valid
+
+        self._forward, self._reverse = {}, {}
+        for band, hours in self.bands.items():
+            matrix = np.asarray(od_cube[list(hours)]).sum(axis=0, dtype=np.int64)
+            matrix[~valid, :] = 0
+            matrix[:, ~valid] = 0
+            self._forward[band] = RankedCSR.from_dense(matrix)
+            self._reverse[band] = RankedCSR.from_dense(matrix.T)
+
+        self._set_lookup(lookup)
+
+    def _set_lookup(self, lookup):
+        # LocationID -> 行政区, 用于按行政区选择
+        self.zone_borough = np.full(N_ZONES, 'Unknown', dtype=object)
+        if lookup is not None:
+            self.zone_borough[lookup['LocationID'].to_numpy()] = lookup['Borough'].to_numpy()
+
+    @classmethod
+    def from_store(cls, store, lookup=None, **kwargs):
+        return cls(store.od_count, lookup=lookup, **kwargs)
+
+    def save(self, path, fingerprint=''):
+        """保存为 npz (不压缩, 读取时无需解压); 先写临时文件再替换"""
+        arrays = {'fingerprint': np.array(fingerprint), 'bands': np.array(json.dumps(self.bands)),
+                  'valid': self.valid}
+        for direction, csrs in (('forward', self._forward), ('reverse', self._reverse)):
+            for band, csr in csrs.items():
+                for name in CSR_FIELDS:
+                    arrays[f'{direction}.{band}.{name}'] = getattr(csr, name)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint='', lookup=None):
+        """读取 save() 的结果; 文件不存在或指纹不一致时返回 None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != fingerprint:
+                return None
+            index = cls.__new__(cls)  # 跳过 __init__ 中的构建
+            index.bands = {band: tuple(hours) for band, hours in json.loads(str(data['bands'])).items()}
+            index.valid = data['valid']
+            index._forward, index._reverse = {}, {}
+            for direction, csrs in (('forward', index._forward), ('reverse', index._reverse)):
+                for band in index.bands:
+                    csrs[band] = RankedCSR(**{name: data[f'{direction}.{band}.{name}'] for name in CSR_FIELDS})
+        index._set_lookup(lookup)
+        return index
+
+    def _csr(self, band, reverse):
+        if band not in self.bands:
+            raise ValueError(f"未知的时段: {band}, 可选: {list(self.bands)}")
+        return (self._reverse if reverse else self._forward)[band]
+
+    def zones_in_boroughs(self, boroughs):
+        if isinstance(boroughs, str):
+            boroughs = [boroughs]
+        return np.flatnonzero(np.isin(self.zone_borough, list(boroughs)) & self.valid)
+
+    def _ranked(self, zones, k, band, reverse):
+        csr = self._csr(band, reverse)
+        zones = np.atleast_1d(np.asarray(zones, dtype=np.int64))
+        if len(zones) == 1:
+            ids, counts = csr.row(zones[0], k)
+            return ids.copy(), counts.copy()
+        return _top_k(csr.dense_row_sum(zones), k)
+
+    def top_destinations(self, origins, k=30, band='all'):
+        """一个或多个起点合计后的前 k 个终点: (终点 ID, 计数)"""
+        return self._ranked(origins, k, band, reverse=False)
+
+    def top_origins(self, destinations, k=30, band='all'):
+        """一个或多个终点合计后的前 k 个来源: (起点 ID, 计数)"""
+        return self._ranked(destinations, k, band, reverse=True)
+
+    def top_flows(self, zones, k=30, band='all', reverse=False):
+        """
+        所选区域涉及的前 k 条 (起点, 终点) 流向, 用于画流向线。
+        每个区域只需看自己排好序的前 k 项, 代价为 O(区域数 x k)。
+        """
+        csr = self._csr(band, reverse)
+        zones = np.atleast_1d(np.asarray(zones, dtype=np.int64))
+        heads = [csr.row(z, k) for z in zones]
+        sel = np.repeat(zones, [len(ids) for ids, _ in heads])
+        other = np.concatenate([ids for ids, _ in heads]) if heads else np.empty(0, dtype=np.int64)
+        counts = np.concatenate([c for _, c in heads]) if heads else np.empty(0, dtype=np.int64)
+        if len(counts) > k:
+            keep = np.argpartition(-counts, k - 1)[:k]
+            sel, other, counts = sel[keep], other[keep], counts[keep]
+        order = np.argsort(-counts, kind='stable')
+        sel, other, counts = sel[order], other[order], counts[order]
+        return (other, sel, counts) if reverse else (sel, other, counts)
+
+    def outflow(self, origins, band='all'):
+        """所选起点去往每个区域的计数, 形状 (N_ZONES,)"""
+        return self._csr(band, False).dense_row_sum(np.atleast_1d(origins))
+
+    def inflow(self, destinations, band='all'):
+        """每个区域去往所选终点的计数, 形状 (N_ZONES,)"""
+        return self._csr(band, True).dense_row_sum(np.atleast_1d(destinations))
+
+    def total(self, zones, band='all', reverse=False):
+        return int(self._csr(band, reverse).totals[np.atleast_1d(zones)].sum())
+
+
+def store_fingerprint(store):
+    """立方体的来源标识: 单个文件为源文件哈希, 数据集为版本号与月份"""
+    meta = store.meta
+    key = {'format_version': FORMAT_VERSION, 'bands': HOUR_BANDS,
+           'source': meta.get('source_sha256') or [meta.get('version'), meta.get('months')]}
+    return json.dumps(key, sort_keys=True)
+
+
+def cached_od_index(path, store, lookup=None):
+    """
+    读取与立方体放在一起的 OD 索引, 不存在或已过期时构建并保存。
+    path 为 parquet 文件或数据集目录 (与 load_aggregates 相同), 目录不可写时只构建不保存。
+    """
+    index_path = os.path.join(artifact_dir(path, store.meta), OD_INDEX_FILE)
+    fingerprint = store_fingerprint(store)
+    index = ODIndex.load(index_path, fingerprint, lookup=lookup)
+    if index is None:
+        index = ODIndex.from_store(store, lookup=lookup)
+        try:
+            index.save(index_path, fingerprint)
+        except OSError:
+            pass
+    return index
@@ -0,0 +1,179 @@
+"""
+多核并行聚合 (Parallel Aggregation)
+
+pandas 的 groupby / value_counts 只用一个核。这里把扫描计划 (文件, row group) 切成若干任务,
+交给进程池:
+    - 每个进程只读取分到的 row group, 用聚合器的 update(df) 得到部分计数/加和数组
+      (打包 key 后 np.bincount, 与 TripAggregator 相同)
+    - 主进程用 merge() 把各部分结果相加; 计数与加和可交换, 结果与顺序无关
+任务按行数均衡分配 (大任务优先分给最空闲的一组), 数量为进程数的若干倍, 用来吸收快慢差异;
+每个任务只返回一份部分结果, 进程间传输量与任务数成正比, 而不是与行数成正比。
+
+聚合器需要可 pickle, 并实现 columns 属性以及 update(df) / merge(other) 方法。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .aggregate_store import N_ZONES
+from .cleaning import DEFAULT_CLEANING, CleaningReport
+from .data_loader import TIME_COLUMN, _iter_tables, scan_plan
+
+TASKS_PER_WORKER = 2
+US_PER_HOUR = 3_600_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+
+
+def _time_us(df):
+    return df[TIME_COLUMN].to_numpy(dtype='datetime64[us]').view(np.int64)
+
+
+# 分组维度: 名称 -> (取值个数, 依赖的列, 从批次计算取值的函数)
+DIMENSIONS = {
+    'hour': (24, TIME_COLUMN, lambda df: (_time_us(df) // US_PER_HOUR) % 24),
+    'slot': (96, TIME_COLUMN, lambda df: (_time_us(df) // (US_PER_HOUR // 4)) % 96),
+    'weekday': (7, TIME_COLUMN, lambda df: (_time_us(df) // US_PER_DAY + 3) % 7),  # 1970-01-01 为周四, 0=周一
+    'day': (32, TIME_COLUMN, lambda df: df[TIME_COLUMN].dt.day.to_numpy()),
+    'PULocationID': (N_ZONES, 'PULocationID', lambda df: df['PULocationID'].to_numpy(dtype=np.int64, na_value=-1)),
+    'DOLocationID': (N_ZONES, 'DOLocationID', lambda df: df['DOLocationID'].to_numpy(dtype=np.int64, na_value=-1)),
+    'payment_type': (256, 'payment_type', lambda df: df['payment_type'].to_numpy(dtype=np.int64, na_value=-1)),
+    'VendorID': (256, 'VendorID', lambda df: df['VendorID'].to_numpy(dtype=np.int64, na_value=-1)),
+}
+
+
+class BincountAggregator:
+    """
+    按若干维度分组的计数与加和 (相当于 groupby(dims).size() / .sum()),
+    维度打包成一维 key, 如 hour * N_ZONES + PULocationID、PULocationID * N_ZONES + DOLocationID。
+    超出取值范围或缺失的行计入 rows_dropped。
+    """
+
+    def __init__(self, dims, sums=()):
+        unknown = [d for d in dims if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"未知的分组维度: {unknown}, 可选: {list(DIMENSIONS)}")
+        self.dims = tuple(dims)
+        self.sums = tuple(sums)
+        self.shape = tuple(DIMENSIONS[d][0] for d in self.dims)
+        self.size = int(np.prod(self.shape))
+        self.count = np.zeros(self.size, dtype=np.int64)
+        self.totals = {c: np.zeros(self.size, dtype=np.float64) for c in self.sums}
+        self.rows_seen = 0
+        self.rows_dropped = 0
+
+    @property
+    def columns(self):
+        return sorted({DIMENSIONS[d][1] for d in self.dims} | set(self.sums))
+
+    def update(self, df):
+        if df.empty:
+            return
+        key = np.zeros(len(df), dtype=np.int64)
+        valid = np.ones(len(df), dtype=bool)
+        for dim, size in zip(self.dims, self.shape):
+            values = np.asarray(DIMENSIONS[dim][2](df), dtype=np.int64)
+            valid &= (values >= 0) & (values < size)
+            key = key * size + values
+        self.rows_seen += len(df)
+        self.rows_dropped += int(len(df) - valid.sum())
+        key = key[valid]
+        self.count += np.bincount(key, minlength=self.size)
+        for column in self.sums:
+            weights = df[column].to_numpy(dtype=np.float64, na_value=0.0)[valid]
+            self.totals[column] += np.bincount(key, weights=weights, minlength=self.size)
+
+    def merge(self, other):
+        self.count += other.count
+        for column in self.sums:
+            self.totals[column] += other.totals[column]
+        self.rows_seen += other.rows_seen
+        self.rows_dropped += other.rows_dropped
+        return self
+
+    def result(self):
+        """{'count': 稠密数组, <加和列>: 稠密数组}, 形状为各维度取值个数"""
+        out = {'count': self.count.reshape(self.shape)}
+        out.update({c: v.reshape(self.shape) for c, v in self.totals.items()})
+        return out
+
+    def to_frame(self):
+        """非空分组的长表, 与 groupby(dims).agg(...) 的结果对应"""
+        nonzero = np.flatnonzero(self.count)
+        df = pd.DataFrame(dict(zip(self.dims, np.unravel_index(nonzero, self.shape))))
+        df['count'] = self.count[nonzero]
+        for column in self.sums:
+            df[column] = self.totals[column][nonzero]
+        return df
+
+
+def split_tasks(plan, n_tasks):
+    """把 [(文件, row group 列表)] 按行数均衡地分成至多 n_tasks 个子计划"""
+    units = []
+    for path, row_groups in plan:
+        metadata = pq.read_metadata(path)
+        units.extend((metadata.row_group(i).num_rows, path, i) for i in row_groups)
+    n_tasks = max(1, min(n_tasks, len(units)))
+    loads = np.zeros(n_tasks, dtype=np.int64)
+    tasks = [{} for _ in range(n_tasks)]
+    for rows, path, i in sorted(units, key=lambda u: (-u[0], u[1], u[2])):
+        slot = int(np.argmin(loads))
+        loads[slot] += rows
+        tasks[slot].setdefault(path, []).append(i)
+    return [[(path, sorted(rgs)) for path, rgs in task.items()] for task in tasks if task]
+
+
+def _aggregate_task(task, make_aggregator, columns, filters, batch_rows, clean):
+    """子进程中执行: 只读取分到的 row group, 返回部分结果与清洗统计"""
+    aggregators = make_aggregator()
+    if not isinstance(aggregators, (list, tuple)):
+        aggregators = [aggregators]
+    report = CleaningReport()
+    for table in _iter_tables(None, columns, plan=task, batch_rows=batch_rows, clean=clean, report=report,
+                              **filters):
+        df = table.to_pandas()
+        for agg in aggregators:
+            agg.update(df)
+    return aggregators, report
+
+
+def parallel_aggregate(paths, make_aggregator, workers=None, columns=None, batch_rows=1 << 18,
+                       clean=DEFAULT_CLEANING, report=None, **filters):
+    """
+    在进程池中并行运行聚合器并合并结果。make_aggregator() 返回一个或一组新的聚合器,
+    必须可 pickle (类或 functools.partial)。返回值与 make_aggregator() 的形式相同。
+    workers=1 时在当前进程内顺序执行 (不启动进程池)。
+    与顺序读取相同, 默认先按 clean 规则清洗, 各进程的清洗统计合并到 report。
+    """
+    workers = workers or os.cpu_count() or 1
+    template = make_aggregator()
+    single = not isinstance(template, (list, tuple))
+    if columns is None:
+        templates = [template] if single else template
+        columns = sorted({c for agg in templates for c in agg.columns})
+    start, end, zones = filters.get('start'), filters.get('end'), filters.get('zones')
+    plan, _ = scan_plan(paths, start, end, zones, filters.get('zone_column', 'PULocationID'))
+
+    merged = [template] if single else list(template)
+
+    def merge(result):
+        partial, part_report = result
+        for target, part in zip(merged, partial):
+            target.merge(part)
+        if report is not None:
+            report.merge(part_report)
+
+    if workers == 1 or not plan:
+        if plan:
+            merge(_aggregate_task(plan, make_aggregator, columns, filters, batch_rows, clean))
+    else:
+        tasks = split_tasks(plan, workers * TASKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = [executor.submit(_aggregate_task, task, make_aggregator, columns, filters, batch_rows, clean)
+                       for task in tasks]
+            # 先完成的先合并, 主进程同一时刻只多持有一份部分结果
+            for future in as_completed(futures):
+                merge(future.result())
+    return merged[0] if single else merged
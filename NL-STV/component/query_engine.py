@@ -0,0 +1,255 @@
+"""
+列式查询引擎 (Query Engine)
+
+执行 nl_processor.QueryPlan:
+    - 行程按 (PULocationID, 上车时间) 预排序, 每个区域对应一段连续的行 (zone_offsets),
+      上车区域/行政区过滤直接取切片, 区域内的时间范围用二分查找
+    - 其余条件在候选行上融合成一个布尔掩码, 取值集合类条件用查找表代替 isin
+    - 分组维度打包成一维 key, 用 np.bincount 一次算出计数与各项加和
+    - 结果按规范化计划的 key 做 LRU 缓存
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .aggregate_store import N_ZONES
+from .data_loader import load_trips
+from .nl_processor import BOROUGHS
+
+ENGINE_COLUMNS = ['tpep_pickup_datetime', 'PULocationID', 'DOLocationID', 'payment_type',
+                  'fare_amount', 'tip_amount', 'trip_distance', 'total_amount']
+
+# 各分组维度的取值个数
+DIM_SIZES = {
+    'hour': 24,
+    'weekday': 7,
+    'day': 32,
+    'PULocationID': N_ZONES,
+    'DOLocationID': N_ZONES,
+    'payment_type': 256,
+    'pu_borough': len(BOROUGHS),
+    'do_borough': len(BOROUGHS),
+}
+DENSE_KEY_LIMIT = 1 << 24  # 分组 key 空间小于此值时直接 bincount, 否则先 np.unique 压缩
+
+
+def _to_us(value):
+    return np.datetime64(pd.Timestamp(value), 'us').astype(np.int64)
+
+
+def _lut(size, values):
+    table = np.zeros(size, dtype=bool)
+    table[list(values)] = True
+    return table
+
+
+def plan_scan_filters(plan, lookup):
+    """
+    把计划中的上车时间范围与上车区域/行政区转换成 data_loader 的读取条件,
+    读取分区数据集时可据此跳过无关的分区和 row group。
+    """
+    filters = {'start': plan.start, 'end': plan.end}
+    zones = set(plan.pu_zones) if plan.pu_zones is not None else None
+    if plan.pu_boroughs is not None:
+        in_borough = {int(z) for z, b in zip(lookup['LocationID'], lookup['Borough'])
+                      if (b if b in BOROUGHS else 'Unknown') in plan.pu_boroughs}
+        zones = in_borough if zones is None else zones & in_borough
+    if zones is not None:
+        filters['zones'] = sorted(zones)
+    return filters
+
+
+class TripColumns:
+    """按 (PULocationID, 上车时间) 排序的紧凑列, 附带每个区域的行偏移"""
+
+    def __init__(self, df):
+        ts = df['tpep_pickup_datetime'].to_numpy(dtype='datetime64[us]').view(np.int64)
+        pu = df['PULocationID'].to_numpy(dtype=np.uint16)
+        order = np.lexsort((ts, pu))
+
+        self.ts = ts[order]
+        self.pu = pu[order]
+        self.do = df['DOLocationID'].to_numpy(dtype=np.uint16)[order]
+        self.payment_type = df['payment_type'].to_numpy(dtype=np.uint8)[order]
+        self.fare = df['fare_amount'].to_numpy(dtype=np.float32)[order]
+        self.tip = df['tip_amount'].to_numpy(dtype=np.float32)[order]
+        self.distance = df['trip_distance'].to_numpy(dtype=np.float32)[order]
+        self.total = df['total_amount'].to_numpy(dtype=np.float32)[order]
+
+        pickup = pd.DatetimeIndex(self.ts.view('datetime64[us]'))
+        self.hour = pickup.hour.to_numpy(dtype=np.uint8)
+        self.weekday = pickup.weekday.to_numpy(dtype=np.uint8)
+        self.day = pickup.day.to_numpy(dtype=np.uint8)
+
+        # 区域 z 的行位于 [zone_offsets[z], zone_offsets[z + 1])
+        self.zone_offsets = np.zeros(N_ZONES + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.pu, minlength=N_ZONES), out=self.zone_offsets[1:])
+
+    @classmethod
+    def from_parquet(cls, paths, **filters):
+        """paths 可以是文件或分区目录; filters 同 data_loader.iter_trip_batches (可用 plan_scan_filters 生成)"""
+        return cls(load_trips(paths, columns=ENGINE_COLUMNS, **filters))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def zone_rows(self, zones, start=None, end=None):
+        """若干上车区域 (可附带时间范围) 对应的行号, 只做切片与二分查找"""
+        lo = None if start is None else _to_us(start)
+        hi = None if end is None else _to_us(end)
+        ranges = []
+        for z in zones:
+            first, last = self.zone_offsets[z], self.zone_offsets[z + 1]
+            zone_ts = self.ts[first:last]
+            a = first if lo is None else first + np.searchsorted(zone_ts, lo, side='left')
+            b = last if hi is None else first + np.searchsorted(zone_ts, hi, side='left')
+            if b > a:
+                ranges.append(np.arange(a, b))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+
+class QueryEngine:
+    def __init__(self, columns, lookup, cache_size=128):
+        self.columns = columns
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        # LocationID -> 行政区编码
+        borough_code = {name: i for i, name in enumerate(BOROUGHS)}
+        self.zone_borough = np.full(N_ZONES, borough_code['Unknown'], dtype=np.uint8)
+        for zone_id, borough in zip(lookup['LocationID'], lookup['Borough']):
+            self.zone_borough[int(zone_id)] = borough_code.get(borough, borough_code['Unknown'])
+
+    def _zones_in(self, zones, boroughs):
+        """区域列表与行政区列表取交集, 得到 LocationID 集合 (都为空时返回 None)"""
+        selected = None
+        if zones is not None:
+            selected = set(zones)
+        if boroughs is not None:
+            codes = [BOROUGHS.index(b) for b in boroughs]
+            in_borough = set(np.flatnonzero(np.isin(self.zone_borough, codes)).tolist())
+            selected = in_borough if selected is None else selected & in_borough
+        return None if selected is None else sorted(selected)
+
+    def _select(self, plan):
+        """返回满足计划中所有过滤条件的行号"""
+        cols = self.columns
+        pu_zones = self._zones_in(plan.pu_zones, plan.pu_boroughs)
+        time_done = False
+        if pu_zones is not None:
+            rows = cols.zone_rows(pu_zones, plan.start, plan.end)
+            time_done = True
+        else:
+            rows = None
+
+        def take(array):
+            return array if rows is None else array[rows]
+
+        n = len(cols) if rows is None else len(rows)
+        mask = np.ones(n, dtype=bool)
+        if not time_done and plan.start is not None:
+            mask &= take(cols.ts) >= _to_us(plan.start)
+        if not time_done and plan.end is not None:
+            mask &= take(cols.ts) < _to_us(plan.end)
+        if plan.hours is not None:
+            mask &= _lut(24, plan.hours)[take(cols.hour)]
+        if plan.weekdays is not None:
+            mask &= _lut(7, plan.weekdays)[take(cols.weekday)]
+        do_zones = self._zones_in(plan.do_zones, plan.do_boroughs)
+        if do_zones is not None:
+            mask &= _lut(N_ZONES, do_zones)[take(cols.do)]
+        if plan.payment_types is not None:
+            mask &= _lut(256, plan.payment_types)[take(cols.payment_type)]
+        if plan.fare_min is not None:
+            mask &= take(cols.fare) >= plan.fare_min
+        if plan.fare_max is not None:
+            mask &= take(cols.fare) <= plan.fare_max
+        if plan.distance_min is not None:
+            mask &= take(cols.distance) >= plan.distance_min
+        if plan.distance_max is not None:
+            mask &= take(cols.distance) <= plan.distance_max
+
+        rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        return rows
+
+    def _dim_values(self, dim, rows):
+        cols = self.columns
+        if dim == 'pu_borough':
+            return self.zone_borough[cols.pu[rows]]
+        if dim == 'do_borough':
+            return self.zone_borough[cols.do[rows]]
+        source = {'hour': cols.hour, 'weekday': cols.weekday, 'day': cols.day,
+                  'PULocationID': cols.pu, 'DOLocationID': cols.do, 'payment_type': cols.payment_type}
+        return source[dim][rows]
+
+    def _run(self, plan):
+        cols = self.columns
+        rows = self._select(plan)
+
+        # 分组维度打包为一维 key
+        key = np.zeros(len(rows), dtype=np.int64)
+        n_keys = 1
+        for dim in plan.group_by:
+            key = key * DIM_SIZES[dim] + self._dim_values(dim, rows)
+            n_keys *= DIM_SIZES[dim]
+        if n_keys <= DENSE_KEY_LIMIT:
+            group_keys = None
+            dense = key
+        else:
+            group_keys, dense = np.unique(key, return_inverse=True)
+            n_keys = len(group_keys)
+
+        def bsum(values):
+            return np.bincount(dense, weights=values[rows], minlength=n_keys)
+
+        count = np.bincount(dense, minlength=n_keys)
+        present = np.flatnonzero(count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sums = {}
+            out = {}
+            for metric in plan.metrics:
+                if metric == 'count':
+                    out[metric] = count[present]
+                    continue
+                name = metric.split('_')[0]  # fare / total / tip / distance
+                if name not in sums:
+                    sums[name] = bsum(getattr(cols, name))[present]
+                if metric == 'tip_rate':
+                    if 'fare' not in sums:
+                        sums['fare'] = bsum(cols.fare)[present]
+                    out[metric] = sums['tip'] / sums['fare']
+                elif metric.endswith('_sum'):
+                    out[metric] = sums[name]
+                else:
+                    out[metric] = sums[name] / count[present]
+
+        # 还原各分组维度的取值
+        result = {}
+        packed = present if group_keys is None else group_keys[present]
+        for dim in reversed(plan.group_by):
+            values = packed % DIM_SIZES[dim]
+            packed = packed // DIM_SIZES[dim]
+            result[dim] = np.asarray(BOROUGHS)[values] if dim.endswith('_borough') else values
+        frame = pd.DataFrame({dim: result[dim] for dim in plan.group_by})
+        for metric, values in out.items():
+            frame[metric] = values
+        if plan.top_k is not None:
+            frame = frame.sort_values(plan.metrics[0], ascending=False).head(plan.top_k)
+        return frame.reset_index(drop=True)
+
+    def execute(self, plan):
+        """执行查询计划, 相同的规范化计划直接返回缓存结果"""
+        key = plan.key()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key].copy()
+        self.misses += 1
+        result = self._run(plan)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result.copy()
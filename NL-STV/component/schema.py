@@ -0,0 +1,94 @@
+"""
+行程数据的紧凑类型定义 (Schema)
+
+把 TLC 文档中的 20 列映射到能安全容纳取值的最窄 dtype:
+    - VendorID / RatecodeID / payment_type / passenger_count 用 uint8 编码 (缺失记为 0)
+    - store_and_fwd_flag 用 bool ('Y' = True)
+    - 区域 ID 用 uint16
+    - 距离和金额用 float32
+另外预先计算 uint8 的上车小时 hour。
+"""
+import numpy as np
+import pandas as pd
+
+TRIP_DTYPES = {
+    'VendorID': 'uint8',
+    'tpep_pickup_datetime': 'datetime64[us]',
+    'tpep_dropoff_datetime': 'datetime64[us]',
+    'passenger_count': 'uint8',
+    'trip_distance': 'float32',
+    'RatecodeID': 'uint8',
+    'store_and_fwd_flag': 'bool',
+    'PULocationID': 'uint16',
+    'DOLocationID': 'uint16',
+    'payment_type': 'uint8',
+    'fare_amount': 'float32',
+    'extra': 'float32',
+    'mta_tax': 'float32',
+    'tip_amount': 'float32',
+    'tolls_amount': 'float32',
+    'improvement_surcharge': 'float32',
+    'total_amount': 'float32',
+    'congestion_surcharge': 'float32',
+    'Airport_fee': 'float32',
+    'cbd_congestion_fee': 'float32',
+}
+
+# 编码列的含义 (见 README), 0 表示缺失
+CODE_LABELS = {
+    'VendorID': {1: 'Creative Mobile Technologies', 2: 'VeriFone'},
+    'RatecodeID': {1: 'Standard rate', 2: 'JFK', 3: 'Newark', 4: 'Nassau/Westchester',
+                   5: 'Negotiated fare', 6: 'Group ride', 99: 'Unknown'},
+    'payment_type': {1: 'Credit card', 2: 'Cash', 3: 'No charge', 4: 'Dispute',
+                     5: 'Unknown', 6: 'Voided trip'},
+}
+
+
+def _narrow_int(series, dtype):
+    """缺失值记为 0 后转换成目标整数类型; 取值越界时退回 pandas 自动选择的最窄类型"""
+    values = series.fillna(0)
+    info = np.iinfo(dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        return pd.to_numeric(values, downcast='integer')
+    return values.astype(dtype)
+
+
+def normalize_trips(df, add_hour=True):
+    """把行程 DataFrame 中已知的列转换为紧凑类型, 未知列保持不变"""
+    out = {}
+    for name in df.columns:
+        dtype = TRIP_DTYPES.get(name)
+        col = df[name]
+        if dtype is None:
+            out[name] = col
+        elif dtype == 'bool':
+            out[name] = col.eq('Y') if col.dtype != bool else col
+        elif dtype.startswith('uint'):
+            out[name] = _narrow_int(col, dtype)
+        elif dtype == 'float32':
+            out[name] = col.astype('float32')
+        else:
+            out[name] = pd.to_datetime(col).astype(dtype)
+    result = pd.DataFrame(out, index=df.index)
+    if add_hour and 'tpep_pickup_datetime' in result and 'hour' not in result:
+        result['hour'] = result['tpep_pickup_datetime'].dt.hour.astype('uint8')
+    return result
+
+
+def memory_report(before, after):
+    """逐列对比转换前后的内存占用 (字节)"""
+    old = before.memory_usage(deep=True, index=False)
+    new = after.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.reindex(before.columns).astype(str),
+        'bytes_before': old,
+        'bytes_after': new.reindex(before.columns),
+    })
+    # 新增的派生列 (如 hour) 也单独列出
+    for name in after.columns.difference(before.columns):
+        report.loc[name] = ['-', str(after[name].dtype), 0, new[name]]
+    report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+    report.loc['TOTAL'] = ['', '', report['bytes_before'].sum(), report['bytes_after'].sum(),
+                           report['bytes_saved'].sum()]
+    return report
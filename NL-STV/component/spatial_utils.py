@@ -0,0 +1,121 @@
+"""
+区域几何缓存 (Spatial Utils)
+
+一次性把 taxi_zones.shp 处理成可直接复用的产物, 写入数据目录下的 zone_cache/:
+    taxi_zones_<level>.geojson   按 LocationID 合并、保持拓扑简化后的 WGS84 边界 (多个精度)
+    taxi_zone_centroids.csv      每个区域在 EPSG:2263 下计算的中心点 (经纬度)
+之后的读取只需要 json/pandas, 不再导入 geopandas/shapely, 也不再做投影转换。
+"""
+import json
+import os
+
+import pandas as pd
+
+# 简化容差, 单位为 EPSG:2263 的英尺
+SIMPLIFY_LEVELS = {
+    'full': 0,
+    'high': 20,
+    'medium': 100,
+    'low': 400,
+}
+DEFAULT_LEVEL = 'medium'
+COORD_DECIMALS = 5  # 约 1 米精度
+CACHE_DIR_NAME = 'zone_cache'
+CENTROIDS_FILE = 'taxi_zone_centroids.csv'
+META_FILE = 'meta.json'
+
+
+def cache_dir(shp_path):
+    return os.path.join(os.path.dirname(os.path.abspath(shp_path)), CACHE_DIR_NAME)
+
+
+def geojson_path(shp_path, level=DEFAULT_LEVEL):
+    return os.path.join(cache_dir(shp_path), f'taxi_zones_{level}.geojson')
+
+
+def _source_mtime(shp_path):
+    # .shp 与 .dbf 任一变化都需要重建
+    root, _ = os.path.splitext(shp_path)
+    return max(os.path.getmtime(p) for p in (shp_path, root + '.dbf') if os.path.exists(p))
+
+
+def is_cache_fresh(shp_path):
+    meta_path = os.path.join(cache_dir(shp_path), META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return meta.get('source_mtime') == _source_mtime(shp_path) and meta.get('levels') == SIMPLIFY_LEVELS
+
+
+def _write_atomic(path, write):
+    """
+    先写到同目录下的临时文件再 os.replace, 读取方 (或并发重建的另一个进程)
+    只会看到完整的旧文件或新文件, 不会读到写了一半的内容
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'  # 按进程区分, 并发重建时互不覆盖
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_zone_artifacts(shp_path):
+    """读取 shapefile, 写出各精度的 GeoJSON 与中心点表 (只有这里需要 geopandas)"""
+    import geopandas as gpd
+
+    out_dir = cache_dir(shp_path)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 合并重复 ID, 在纽约州平面坐标系 (英尺) 下计算中心点与简化
+    gdf = gpd.read_file(shp_path).dissolve(by='LocationID').reset_index()
+    gdf = gdf[['LocationID', 'zone', 'borough', 'geometry']]
+    gdf['LocationID'] = gdf['LocationID'].astype(int)
+    projected = gdf.to_crs(epsg=2263)
+
+    centroids = projected.geometry.centroid.to_crs(epsg=4326)
+    centroid_df = pd.DataFrame({
+        'LocationID': gdf['LocationID'],
+        'zone': gdf['zone'],
+        'borough': gdf['borough'],
+        'lon': centroids.x.round(COORD_DECIMALS),
+        'lat': centroids.y.round(COORD_DECIMALS),
+    })
+    _write_atomic(os.path.join(out_dir, CENTROIDS_FILE), lambda f: centroid_df.to_csv(f, index=False))
+
+    for level, tolerance in SIMPLIFY_LEVELS.items():
+        simplified = projected.copy()
+        if tolerance:
+            simplified['geometry'] = simplified.geometry.simplify(tolerance, preserve_topology=True)
+        simplified = simplified.to_crs(epsg=4326)
+        geojson = json.loads(simplified.to_json(drop_id=True),
+                             parse_float=lambda x: round(float(x), COORD_DECIMALS))
+        _write_atomic(geojson_path(shp_path, level), lambda f: json.dump(geojson, f, separators=(',', ':')))
+
+    # meta 最后写入: 只有全部产物都就位后缓存才会被视为有效
+    meta = {'source_mtime': _source_mtime(shp_path), 'levels': SIMPLIFY_LEVELS}
+    _write_atomic(os.path.join(out_dir, META_FILE), lambda f: json.dump(meta, f, indent=2))
+
+
+def ensure_zone_artifacts(shp_path):
+    if not is_cache_fresh(shp_path):
+        build_zone_artifacts(shp_path)
+
+
+def load_zone_geojson(shp_path, level=DEFAULT_LEVEL):
+    """读取缓存的区域 GeoJSON, 缓存缺失或过期时自动重建"""
+    if level not in SIMPLIFY_LEVELS:
+        raise ValueError(f"未知的简化级别: {level}, 可选: {list(SIMPLIFY_LEVELS)}")
+    ensure_zone_artifacts(shp_path)
+    with open(geojson_path(shp_path, level), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_zone_centroids(shp_path):
+    """读取区域中心点表: LocationID, zone, borough, lon, lat"""
+    ensure_zone_artifacts(shp_path)
+    return pd.read_csv(os.path.join(cache_dir(shp_path), CENTROIDS_FILE))
@@ -0,0 +1,322 @@
+"""
+合成 NYC 出租车数据 (Synthetic Data)
+
+真实的 yellow_tripdata 与 taxi_zones 不在仓库中, 这里生成与 TLC 字段一致的合成数据,
+用于离线测试、基准测试和压力测试:
+    - 263 个区域排成网格 (WGS84), 同时输出对照表、GeoJSON 和 shapefile
+    - 区域热度: 以"中城"为中心随距离衰减, 再乘对数正态噪声, 机场单独加权
+    - 时间分布: 按小时曲线 x 星期系数采样, 同一块内按上车时间有序
+    - OD 相关: 下车区域 ~ 目的地热度 x exp(-距离/尺度), 同区短途占一定比例
+    - 少量脏数据 (负车费、零距离、跨月时间、未知区域), 与真实数据的问题一致
+按块生成、按文件并行写出, 每个块由 (seed, 年, 月, 文件号, 块号) 决定,
+与进程数无关, 结果可复现; 内存只与块大小有关。
+"""
+import calendar
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+N_REAL_ZONES = 263  # 1-263 为真实区域, 264/265 为未知
+DEFAULT_CHUNK_ROWS = 1_000_000
+DEFAULT_ROWS_PER_FILE = 20_000_000
+
+ZONE_SEED = 2025  # 区域几何与热度固定, 不随数据 seed 变化
+GRID_COLS = 19
+GRID_CELL = 0.02  # 度
+GRID_ORIGIN = (-74.20, 40.55)
+CENTER = (-74.00, 40.70)  # 热度中心 (约为曼哈顿下城)
+AIRPORT_ZONES = (132, 138)  # 与真实数据一致: JFK / LaGuardia
+MILES_PER_DEGREE = 69.0
+
+# 每小时相对需求量 (0 点到 23 点), 参考 TLC 黄车的日内曲线
+HOUR_PROFILE = np.array([
+    2.6, 1.8, 1.2, 0.8, 0.6, 0.8, 1.8, 3.2, 4.2, 4.5, 4.5, 4.7,
+    5.0, 5.1, 5.4, 5.7, 5.8, 6.2, 6.6, 6.2, 5.5, 5.2, 4.8, 3.8,
+])
+# 星期一到星期日
+DOW_FACTOR = np.array([0.88, 0.95, 1.02, 1.05, 1.08, 1.05, 0.90])
+# 各小时平均车速 (英里/小时)
+HOUR_SPEED = np.array([
+    17, 18, 19, 20, 20, 18, 14, 11, 10, 10, 10, 10,
+    10, 10, 10, 9, 9, 9, 10, 11, 13, 14, 15, 16,
+], dtype=np.float64)
+
+LOCAL_TRIP_SHARE = 0.08  # 同区短途比例
+OD_DISTANCE_SCALE = 0.04  # 度, OD 距离衰减尺度
+DIRTY_FRACTION = 0.005
+
+
+@dataclass(frozen=True)
+class ZoneModel:
+    """区域的位置、行政区、上车热度与 OD 概率矩阵 (下标为 LocationID - 1)"""
+    lon: np.ndarray
+    lat: np.ndarray
+    borough: np.ndarray
+    pickup_p: np.ndarray
+    od_p: np.ndarray
+    od_miles: np.ndarray
+
+
+def _grid_cell(zone_index):
+    row, col = divmod(zone_index, GRID_COLS)
+    return GRID_ORIGIN[0] + col * GRID_CELL, GRID_ORIGIN[1] + row * GRID_CELL
+
+
+def _borough_of(zone_id, lon, lat):
+    """按相对中心的方位粗略划分行政区"""
+    if zone_id == 1:
+        return 'EWR'
+    dx, dy = lon - CENTER[0], lat - CENTER[1]
+    if np.hypot(dx, dy) < 0.07:
+        return 'Manhattan'
+    if dx < -0.06 and dy < -0.04:
+        return 'Staten Island'
+    if dy > 0.05:
+        return 'Bronx'
+    if dx > 0.03:
+        return 'Queens'
+    return 'Brooklyn'
+
+
+@lru_cache(maxsize=1)
+def zone_model():
+    rng = np.random.default_rng(ZONE_SEED)
+    index = np.arange(N_REAL_ZONES)
+    x0, y0 = _grid_cell(index)
+    lon, lat = x0 + GRID_CELL / 2, y0 + GRID_CELL / 2
+    borough = np.array([_borough_of(i + 1, x, y) for i, x, y in zip(index, lon, lat)])
+
+    # 热度: 距中心衰减 + 长尾噪声, 机场单独加权
+    center_dist = np.hypot(lon - CENTER[0], lat - CENTER[1])
+    popularity = (np.exp(-center_dist / 0.05) * 30 + 0.2) * rng.lognormal(0, 0.8, N_REAL_ZONES)
+    popularity[np.array(AIRPORT_ZONES) - 1] = popularity.max() * 0.6
+    pickup_p = popularity / popularity.sum()
+
+    # OD 概率: 目的地热度 x 距离衰减, 再混入同区短途
+    dlon = (lon[:, None] - lon[None, :]) * np.cos(np.radians(40.7))
+    dlat = lat[:, None] - lat[None, :]
+    dist = np.hypot(dlon, dlat)
+    od = popularity[None, :] * np.exp(-dist / OD_DISTANCE_SCALE)
+    od /= od.sum(axis=1, keepdims=True)
+    od = od * (1 - LOCAL_TRIP_SHARE) + np.eye(N_REAL_ZONES) * LOCAL_TRIP_SHARE
+    return ZoneModel(lon=lon, lat=lat, borough=borough, pickup_p=pickup_p, od_p=od,
+                     od_miles=dist * MILES_PER_DEGREE)
+
+
+def _month_hour_weights(year, month):
+    """当月每个小时的相对需求量, 长度为 天数 x 24"""
+    n_days = calendar.monthrange(year, month)[1]
+    dow = (calendar.weekday(year, month, 1) + np.arange(n_days)) % 7
+    return (DOW_FACTOR[dow][:, None] * HOUR_PROFILE[None, :]).ravel()
+
+
+def _sample_pickup_seconds(rng, n_rows, year, month, span):
+    """按需求曲线的逆 CDF 采样当月内的秒偏移; span 为分位区间, 结果升序"""
+    weights = _month_hour_weights(year, month)
+    cdf = np.concatenate([[0.0], np.cumsum(weights) / weights.sum()])
+    u = np.sort(rng.uniform(span[0], span[1], n_rows))
+    slot = np.clip(np.searchsorted(cdf, u, side='right') - 1, 0, len(weights) - 1)
+    within = (u - cdf[slot]) / (cdf[slot + 1] - cdf[slot])
+    return slot * 3600 + (within * 3600).astype(np.int64)
+
+
+def _sample_od(rng, model, n_rows):
+    """先按热度分配各上车区域的行数, 再按 OD 概率抽下车区域"""
+    counts = rng.multinomial(n_rows, model.pickup_p)
+    pu = np.repeat(np.arange(N_REAL_ZONES), counts)
+    do = np.empty(n_rows, dtype=np.int64)
+    offset = 0
+    for origin in np.flatnonzero(counts):
+        c = counts[origin]
+        do[offset:offset + c] = rng.choice(N_REAL_ZONES, size=c, p=model.od_p[origin])
+        offset += c
+    order = rng.permutation(n_rows)
+    return pu[order], do[order]
+
+
+def make_trips(n_rows, year=2025, month=1, seed=0, span=(0.0, 1.0), dirty_fraction=DIRTY_FRACTION):
+    """
+    生成 n_rows 行、包含全部 20 列的行程 DataFrame。
+    span 为该块在当月需求分布中的分位区间, 用于把一个月切成按时间有序的多块。
+    """
+    rng = np.random.default_rng(seed)
+    model = zone_model()
+    month_start = np.datetime64(f"{year}-{month:02d}-01T00:00:00", 's')
+
+    seconds = _sample_pickup_seconds(rng, n_rows, year, month, span)
+    hour = (seconds // 3600) % 24
+    pu, do = _sample_od(rng, model, n_rows)
+
+    # 距离: 区域中心距离 x 绕路系数, 同区为短途
+    distance = model.od_miles[pu, do] * rng.uniform(1.15, 1.5, n_rows)
+    same = pu == do
+    distance[same] = rng.exponential(0.8, same.sum())
+    distance = (distance + rng.exponential(0.3, n_rows)).round(2)
+    minutes = distance / HOUR_SPEED[hour] * 60 * rng.lognormal(0, 0.2, n_rows) + 2
+    duration = (minutes * 60).astype(np.int64)
+
+    fare = (3.0 + distance * 1.75 + minutes * 0.35).round(2)
+    payment = rng.choice([1, 2, 3, 4], n_rows, p=[0.76, 0.19, 0.03, 0.02])
+    tip = np.where(payment == 1, fare * rng.uniform(0.12, 0.25, n_rows), 0.0).round(2)
+    tolls = np.where(model.od_miles[pu, do] > 8, 6.94, 0.0)
+    in_manhattan = (model.borough[pu] == 'Manhattan') | (model.borough[do] == 'Manhattan')
+    airport = np.isin(pu + 1, AIRPORT_ZONES)
+
+    pickup = month_start + seconds.astype('timedelta64[s]')
+    df = pd.DataFrame({
+        'VendorID': rng.choice([1, 2, 6, 7], n_rows, p=[0.25, 0.73, 0.01, 0.01]).astype('int32'),
+        'tpep_pickup_datetime': pickup.astype('datetime64[us]'),
+        'tpep_dropoff_datetime': (pickup + duration.astype('timedelta64[s]')).astype('datetime64[us]'),
+        'passenger_count': rng.choice([1, 2, 3, 4, 5, 6], n_rows,
+                                      p=[0.72, 0.16, 0.05, 0.03, 0.02, 0.02]).astype('float64'),
+        'trip_distance': distance,
+        'RatecodeID': np.where(airport & (model.borough[do] == 'Manhattan'), 2.0, 1.0),
+        'store_and_fwd_flag': np.where(rng.random(n_rows) < 0.005, 'Y', 'N'),
+        'PULocationID': (pu + 1).astype('int32'),
+        'DOLocationID': (do + 1).astype('int32'),
+        'payment_type': payment.astype('int64'),
+        'fare_amount': fare,
+        'extra': np.where((hour >= 20) | (hour < 6), 1.0, 0.0) + np.where((hour >= 16) & (hour < 20), 2.5, 0.0),
+        'mta_tax': np.full(n_rows, 0.5),
+        'tip_amount': tip,
+        'tolls_amount': tolls,
+        'improvement_surcharge': np.full(n_rows, 1.0),
+        'total_amount': np.zeros(n_rows),
+        'congestion_surcharge': np.where(in_manhattan, 2.5, 0.0),
+        'Airport_fee': np.where(airport, 1.75, 0.0),
+        'cbd_congestion_fee': np.where(model.borough[do] == 'Manhattan', 0.75, 0.0),
+    })
+
+    # 与真实数据类似的脏数据: 负车费 / 零距离 / 跨月时间 / 未知区域 / 乘客数缺失
+    if dirty_fraction:
+        n_dirty = rng.binomial(n_rows, dirty_fraction)
+        rows = rng.choice(n_rows, size=n_dirty, replace=False)
+        kinds = rng.integers(0, 5, n_dirty)
+        df.loc[rows[kinds == 0], ['fare_amount', 'total_amount']] *= -1
+        df.loc[rows[kinds == 1], 'trip_distance'] = 0.0
+        df.loc[rows[kinds == 2], 'tpep_pickup_datetime'] -= pd.Timedelta(days=400)
+        df.loc[rows[kinds == 3], 'PULocationID'] = rng.choice([264, 265], (kinds == 3).sum()).astype('int32')
+        df.loc[rows[kinds == 4], 'passenger_count'] = np.nan
+
+    fees = ['fare_amount', 'extra', 'mta_tax', 'tip_amount', 'tolls_amount', 'improvement_surcharge',
+            'congestion_surcharge', 'Airport_fee', 'cbd_congestion_fee']
+    df['total_amount'] = df[fees].sum(axis=1).round(2)
+    return df
+
+
+def write_trip_parquet(path, n_rows, year=2025, month=1, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS,
+                       span=(0.0, 1.0), file_index=0):
+    """分块生成并写入 parquet, 每块一个 row group, 内存只占一个块"""
+    n_chunks = max(1, -(-n_rows // chunk_rows))
+    edges = np.linspace(span[0], span[1], n_chunks + 1)
+    tmp_path = path + '.tmp'
+    writer = None
+    try:
+        for i in range(n_chunks):
+            size = min(chunk_rows, n_rows - i * chunk_rows)
+            chunk_seed = np.random.SeedSequence([seed, year, month, file_index, i])
+            df = make_trips(size, year, month, seed=chunk_seed, span=(edges[i], edges[i + 1]))
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def _write_file_task(task):
+    return write_trip_parquet(**task)
+
+
+def write_trip_dataset(out_dir, rows_per_month, months=((2025, 1),), seed=0, rows_per_file=DEFAULT_ROWS_PER_FILE,
+                       chunk_rows=DEFAULT_CHUNK_ROWS, workers=None):
+    """
+    生成多个月的数据, 每月拆成若干文件并行写出 (每个文件一个进程)。
+    单文件的月份命名为 yellow_tripdata_YYYY-MM.parquet, 否则追加 _partNNNN。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = []
+    for year, month in months:
+        n_files = max(1, -(-rows_per_month // rows_per_file))
+        edges = np.linspace(0.0, 1.0, n_files + 1)
+        for f in range(n_files):
+            suffix = '' if n_files == 1 else f'_part{f:04d}'
+            tasks.append({
+                'path': os.path.join(out_dir, f'yellow_tripdata_{year}-{month:02d}{suffix}.parquet'),
+                'n_rows': rows_per_month // n_files + (f < rows_per_month % n_files),
+                'year': year, 'month': month, 'seed': seed, 'chunk_rows': chunk_rows,
+                'span': (edges[f], edges[f + 1]), 'file_index': f,
+            })
+    if (workers or os.cpu_count() or 1) == 1 or len(tasks) == 1:
+        return [_write_file_task(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_write_file_task, tasks))
+
+
+def make_zone_lookup():
+    """与 taxi_zone_lookup.csv 结构一致的对照表"""
+    model = zone_model()
+    ids = np.arange(1, N_REAL_ZONES + 1)
+    lookup = pd.DataFrame({
+        'LocationID': ids,
+        'Borough': model.borough,
+        'Zone': [f"Zone {i}" for i in ids],
+        'service_zone': np.where(model.borough == 'Manhattan', 'Yellow Zone', 'Boro Zone'),
+    })
+    lookup.loc[np.isin(ids, AIRPORT_ZONES), 'service_zone'] = 'Airports'
+    lookup.loc[lookup['Borough'] == 'EWR', 'service_zone'] = 'EWR'
+    unknown = pd.DataFrame({'LocationID': [264, 265], 'Borough': ['Unknown', 'N/A'],
+                            'Zone': ['N/A', 'Outside of NYC'], 'service_zone': ['N/A', 'N/A']})
+    return pd.concat([lookup, unknown], ignore_index=True)
+
+
+def make_zone_geojson():
+    """把 263 个区域排成网格, 生成 WGS84 的 GeoJSON (properties.LocationID)"""
+    lookup = make_zone_lookup()
+    features = []
+    for zone_id, zone, borough in lookup[['LocationID', 'Zone', 'Borough']].head(N_REAL_ZONES).itertuples(index=False):
+        x0, y0 = _grid_cell(zone_id - 1)
+        ring = [[x0, y0], [x0 + GRID_CELL, y0], [x0 + GRID_CELL, y0 + GRID_CELL], [x0, y0 + GRID_CELL], [x0, y0]]
+        features.append({
+            'type': 'Feature',
+            'properties': {'LocationID': int(zone_id), 'zone': zone, 'borough': borough},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[round(x, 5), round(y, 5)] for x, y in ring]]},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def write_zone_files(data_dir):
+    """
+    写出 taxi_zone_lookup.csv 与 taxi_zones.geojson; 装有 geopandas 时另外写出
+    与 TLC 字段一致的 taxi_zones.shp (EPSG:2263)。返回写出的文件路径。
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {'lookup_path': os.path.join(data_dir, 'taxi_zone_lookup.csv'),
+             'geojson_path': os.path.join(data_dir, 'taxi_zones.geojson')}
+    make_zone_lookup().to_csv(paths['lookup_path'], index=False)
+    geojson = make_zone_geojson()
+    with open(paths['geojson_path'], 'w', encoding='utf-8') as f:
+        json.dump(geojson, f, separators=(',', ':'))
+
+    try:
+        import geopandas as gpd
+    except ImportError:
+        return paths
+    gdf = gpd.GeoDataFrame.from_features(geojson['features'], crs='EPSG:4326').to_crs(epsg=2263)
+    gdf.insert(0, 'OBJECTID', gdf['LocationID'])
+    gdf.insert(1, 'Shape_Leng', gdf.geometry.length)
+    gdf.insert(2, 'Shape_Area', gdf.geometry.area)
+    paths['shp_path'] = os.path.join(data_dir, 'taxi_zones.shp')
+    gdf[['OBJECTID', 'Shape_Leng', 'Shape_Area', 'zone', 'LocationID', 'borough', 'geometry']].to_file(
+        paths['shp_path'])
+    return paths
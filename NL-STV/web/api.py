@@ -0,0 +1,417 @@
+"""
+图表接口服务 (API)
+
+README 中的目标架构是 FastAPI 前后端。Streamlit 页面在每个会话的脚本线程里各自计算,
+这里把同样的计算做成 HTTP 接口, 所有用户共享一份数据与结果:
+    GET  /api/health                     数据版本、缓存统计
+    GET  /api/hotspots?hour=             区域上车热力图 (choropleth)
+    GET  /api/hourly?zone=               单个区域的 24 小时趋势
+    GET  /api/od?zones=&borough=&band=&top_n=&reverse=   流向着色图 + 流向线
+    POST /api/query                      自然语言问题 (或查询计划) → 结果表 + 图表
+    GET  /geometry/<摘要>.json            区域几何 (预压缩, 长期缓存), 图表中只写它的 URL
+- 启动时加载一次共享数据 (预聚合立方体 mmap、OD 索引、对照表、几何); 每个请求只 stat 一次数据文件,
+  数据版本变化时在后台重新加载
+- 建图、序列化、查询、压缩等 CPU 密集的工作放进线程池 (numpy 运算释放 GIL), 事件循环只负责 IO;
+  同一张图同时被多个请求需要时只构建一次
+- 图表 JSON 按 (接口, 参数, 数据版本) 缓存在 FigureCache 中, 同时缓存 gzip 后的字节;
+  ETag 即缓存 key, 客户端带 If-None-Match 时直接返回 304
+- 其余响应由 GZipMiddleware 压缩
+自然语言查询的结果表由 QueryEngine 计算, 行程列在第一次查询时才加载。
+"""
+import asyncio
+import gzip
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+
+from component.aggregate_store import (MANIFEST_FILE, N_ZONES, dataset_store_path, dataset_version,
+                                       load_aggregates)
+from component.charts import MAP_CENTER, hourly_trend, pickup_choropleth
+from component.figure_cache import FigureCache, figure_key
+from component.flow_layer import id_indexed
+from component.od_index import HOUR_BANDS, ODIndex, cached_od_index
+from component.spatial_utils import cache_dir, load_zone_centroids, load_zone_geojson
+from web.geo_assets import CACHE_CONTROL, publish_geojson
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+DATA_DIR = os.environ.get('NLSTV_DATA_DIR', os.path.join(ROOT_DIR, 'data'))
+DEFAULT_PARQUET = DATA_DIR  # 数据集目录, 与仪表盘相同
+ASSET_DIR_NAME = 'assets'
+GZIP_CACHE_ENTRIES = 256
+_GEOMETRY_NAME = re.compile(r'^[0-9a-f]+\.json$')
+
+
+_manifest_versions = {}
+
+
+def data_version(path):
+    """
+    数据集目录返回 manifest 版本号, 单个文件返回 (mtime, 大小); 与 shared_data 相同, 但不依赖 streamlit。
+    manifest 按 (inode, mtime, 大小) 缓存, 每个请求只 stat 一次, 发布新版本 (原子替换) 后才重新解析
+    """
+    if os.path.isdir(path):
+        try:
+            stat = os.stat(os.path.join(dataset_store_path(path), MANIFEST_FILE))
+        except FileNotFoundError:
+            return dataset_version(path)
+        stamp = stat.st_ino, stat.st_mtime_ns, stat.st_size
+        cached = _manifest_versions.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = _manifest_versions[path] = stamp, dataset_version(path)
+        return cached[1]
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+@dataclass
+class ZoneData:
+    """一个数据版本的共享只读数据"""
+    store: object
+    hourly: np.ndarray  # (24, N_ZONES)
+    od_index: ODIndex
+    lookup: pd.DataFrame
+    names_by_id: np.ndarray
+    lon_by_id: np.ndarray
+    lat_by_id: np.ndarray
+    geometry_url: str
+
+
+def load_zone_data(parquet_path, shp_path, lookup_path, asset_dir, geometry_base):
+    store = load_aggregates(parquet_path, mmap=True)
+    lookup = pd.read_csv(lookup_path)
+    lookup['Zone'] = lookup['Zone'].fillna("Unknown").astype(str)
+    lookup['Borough'] = lookup['Borough'].fillna("Unknown").astype(str)
+    lookup['LocationID'] = lookup['LocationID'].astype(int)
+    centroids = load_zone_centroids(shp_path)
+    names_by_id = np.full(N_ZONES, "Unknown", dtype=object)
+    names_by_id[lookup['LocationID'].to_numpy()] = lookup['Zone'].to_numpy()
+    geometry_name = publish_geojson(load_zone_geojson(shp_path), asset_dir)
+    return ZoneData(
+        store=store,
+        hourly=_readonly(store.hourly_pickups()),
+        od_index=cached_od_index(parquet_path, store, lookup=lookup),
+        lookup=lookup,
+        names_by_id=_readonly(names_by_id),
+        lon_by_id=_readonly(id_indexed(centroids['LocationID'], centroids['lon'], N_ZONES)),
+        lat_by_id=_readonly(id_indexed(centroids['LocationID'], centroids['lat'], N_ZONES)),
+        geometry_url=f"{geometry_base.rstrip('/')}/{geometry_name}",
+    )
+
+
+# --- 图表构建 (在线程池中执行) ---
+
+def hotspot_figure(data, hour=None):
+    totals = data.hourly.sum(axis=0) if hour is None else data.hourly[hour]
+    location_ids = data.lookup['LocationID'].to_numpy()
+    return pickup_choropleth(location_ids, totals[location_ids], data.lookup['Zone'].to_numpy(),
+                             data.lookup['Borough'].to_numpy(), data.geometry_url)
+
+
+def hourly_figure(data, zone):
+    return hourly_trend(data.hourly[:, zone], title=f"{data.names_by_id[zone]} 24小时趋势")
+
+
+def od_figure(data, zones, band='all', top_n=30, reverse=False):
+    import plotly.graph_objects as go
+    from component.flow_layer import build_flow_traces
+    od = data.od_index
+    per_zone = od.inflow(zones, band) if reverse else od.outflow(zones, band)
+    location_ids = data.lookup['LocationID'].to_numpy()
+    flow_count = per_zone[location_ids]
+    log_flow = np.log10(flow_count + 1)
+
+    fig = go.Figure(go.Choroplethmap(
+        geojson=data.geometry_url, locations=location_ids, z=log_flow, featureidkey="properties.LocationID",
+        colorscale="Plasma", zmin=0, zmax=max(float(log_flow.max()), 1.0), marker_opacity=0.7,
+        marker_line_width=0.5, colorbar=dict(title="订单量"),
+        text=data.lookup['Zone'] + ("<br>来自该地订单数: " if reverse else "<br>前往该地订单数: ")
+        + flow_count.astype(str),
+        hoverinfo="text",
+    ))
+    origins, dests, counts = od.top_flows(zones, top_n, band, reverse=reverse)
+    for trace in build_flow_traces(origins, dests, counts, data.lon_by_id, data.lat_by_id, data.names_by_id,
+                                   marker_end='origin' if reverse else 'dest', label="来自" if reverse else "去往"):
+        fig.add_trace(trace)
+    fig.update_layout(map=dict(style="carto-positron", center=MAP_CENTER, zoom=10),
+                      margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
+
+
+def query_figure(plan, frame):
+    """查询结果的默认图表: 按第一个分组维度画第一个指标, 没有分组时不画图"""
+    if not plan.group_by or frame.empty:
+        return None
+    import plotly.express as px
+    x, y = plan.group_by[0], plan.metrics[0]
+    color = plan.group_by[1] if len(plan.group_by) > 1 else None
+    frame = frame.sort_values(x)
+    if x in ('hour', 'day', 'weekday'):
+        return px.line(frame, x=x, y=y, color=color, markers=True, template="plotly_white")
+    return px.bar(frame, x=frame[x].astype(str), y=y, color=color, template="plotly_white", labels={'x': x})
+
+
+class ApiState:
+    """接口共享的数据、线程池与缓存"""
+
+    def __init__(self, parquet_path, shp_path, lookup_path, workers=None, geometry_base='/geometry',
+                 llm_backend=None):
+        self.parquet_path = parquet_path
+        self.shp_path = shp_path
+        self.lookup_path = lookup_path
+        self.asset_dir = os.path.join(cache_dir(shp_path), ASSET_DIR_NAME)
+        self.geometry_base = geometry_base
+        self.llm_backend = llm_backend or os.environ.get('LLM_BACKEND', 'ollama')
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4),
+                                           thread_name_prefix='nlstv-api')
+        self.figures = FigureCache()
+        self._current = None  # (ZoneData, 数据版本)
+        self._reload_lock = asyncio.Lock()
+        self._inflight = {}
+        self._gzip = OrderedDict()
+        self._gzip_lock = threading.Lock()
+        self._geometry = {}
+        # 自然语言查询: 行程列与概况在第一次查询时加载
+        self._engine = None
+        self._engine_version = None
+        self._engine_lock = threading.Lock()
+        self._summary = None
+
+    async def run(self, fn, *args, **kwargs):
+        """在线程池中执行 CPU 密集的函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def current(self):
+        """
+        当前版本的 (共享数据, 版本号); 版本变化时只有一个请求负责重新加载, 其余请求等待它。
+        二者总是一起返回, 以免并发发布新版本时一个请求混用两个版本
+        """
+        version = data_version(self.parquet_path)
+        current = self._current
+        if current is None or version != current[1]:
+            async with self._reload_lock:
+                current = self._current
+                if current is None or version != current[1]:
+                    data = await self.run(load_zone_data, self.parquet_path, self.shp_path,
+                                          self.lookup_path, self.asset_dir, self.geometry_base)
+                    current = self._current = data, version
+        return current
+
+    def _gzipped(self, key, body):
+        with self._gzip_lock:
+            if key in self._gzip:
+                self._gzip.move_to_end(key)
+                return self._gzip[key]
+        compressed = gzip.compress(body.encode('utf-8'), compresslevel=6)
+        with self._gzip_lock:
+            self._gzip[key] = compressed
+            while len(self._gzip) > GZIP_CACHE_ENTRIES:
+                self._gzip.popitem(last=False)
+        return compressed
+
+    async def _single_flight(self, key, fn):
+        """同一个 key 同时只构建一次, 并发的请求共享结果"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run(fn))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def figure_response(self, request, endpoint, params, build):
+        """按 (接口, 参数, 数据版本) 缓存的图表 JSON, 支持 ETag / 304 与预压缩"""
+        data, version = await self.current()
+        key = figure_key({'endpoint': endpoint, **params}, endpoint, data_version=version)
+        etag = f'"{key[:32]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers=headers)
+
+        body = self.figures.get_raw(key)
+        use_gzip = 'gzip' in request.headers.get('accept-encoding', '')
+        if body is None or use_gzip:
+            def encode():
+                figure_json = self.figures.get_raw(key) or self.figures.put(key, build(data))
+                return figure_json, self._gzipped(key, figure_json) if use_gzip else None
+            body, compressed = await self._single_flight((key, use_gzip), encode)
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+            return Response(compressed, media_type='application/json', headers=headers)
+        return Response(body, media_type='application/json', headers=headers)
+
+    # --- 自然语言查询 ---
+
+    def _query_engine(self, data, version):
+        with self._engine_lock:
+            if self._engine is None or self._engine_version != version:
+                from component.query_engine import QueryEngine, TripColumns
+                self._engine = QueryEngine(TripColumns.from_parquet(self.parquet_path), data.lookup)
+                self._engine_version = version
+                self._summary = None
+            return self._engine
+
+    def execute(self, plan, data, version):
+        engine = self._query_engine(data, version)
+        with self._engine_lock:  # QueryEngine 的结果缓存不是线程安全的
+            return engine.execute(plan)
+
+    def data_summary(self):
+        if self._summary is None:
+            from component.data_summarizer import format_summary, summarize
+            self._summary = format_summary(summarize(self.parquet_path))
+        return self._summary
+
+    async def plan_for(self, question):
+        from component.llm_client import LLMError, get_client
+        from component.nl_processor import build_plan_messages, plan_from_llm_output
+        messages = build_plan_messages(question, await self.run(self.data_summary))
+        try:
+            text = await get_client(self.llm_backend, base_url=os.environ.get('LLM_BASE_URL')).chat(
+                messages, temperature=0)
+        except LLMError as e:
+            raise HTTPException(502, f"模型调用失败: {e}")
+        try:
+            return plan_from_llm_output(text)
+        except ValueError as e:
+            raise HTTPException(422, f"无法解析模型给出的查询计划: {e}")
+
+    def answer(self, plan, data, version):
+        frame = self.execute(plan, data, version)
+        key = figure_key(plan, 'query', data_version=version)
+        figure_json = self.figures.get_raw(key)
+        if figure_json is None:
+            fig = query_figure(plan, frame)
+            figure_json = self.figures.put(key, fig) if fig is not None else 'null'
+        rows = frame.to_json(orient='records', force_ascii=False)
+        return ('{"plan":%s,"key":"%s","columns":%s,"rows":%s,"figure":%s}'
+                % (json.dumps(plan.to_dict(), ensure_ascii=False), plan.key(),
+                   json.dumps(list(frame.columns)), rows, figure_json))
+
+    # --- 几何 ---
+
+    def geometry_file(self, name, gzipped):
+        cache_key = (name, gzipped)
+        if cache_key not in self._geometry:
+            path = os.path.join(self.asset_dir, name + ('.gz' if gzipped else ''))
+            with open(path, 'rb') as f:
+                self._geometry[cache_key] = f.read()
+        return self._geometry[cache_key]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_zones(zones):
+    try:
+        ids = sorted({int(z) for z in zones.split(',') if z.strip()})
+    except ValueError:
+        raise HTTPException(422, f"zones 应为逗号分隔的 LocationID: {zones!r}")
+    if not ids or ids[0] < 1 or ids[-1] >= N_ZONES:
+        raise HTTPException(422, f"zones 的取值范围为 1..{N_ZONES - 1}")
+    return ids
+
+
+def create_app(parquet_path=None, shp_path=None, lookup_path=None, workers=None, geometry_base=None):
+    """
+    创建应用; 未给出的路径取环境变量: 行程数据为 NLSTV_PARQUET (默认为 NLSTV_DATA_DIR 数据集目录),
+    几何与对照表在 NLSTV_DATA_DIR 下
+    """
+    parquet_path = parquet_path or os.environ.get('NLSTV_PARQUET', DEFAULT_PARQUET)
+    shp_path = shp_path or os.path.join(DATA_DIR, 'taxi_zones.shp')
+    lookup_path = lookup_path or os.path.join(DATA_DIR, 'taxi_zone_lookup.csv')
+    geometry_base = geometry_base or os.environ.get('NLSTV_ASSET_URL', '/geometry')
+    state = ApiState(parquet_path, shp_path, lookup_path, workers=workers, geometry_base=geometry_base)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await state.current()  # 启动时加载共享数据, 第一个请求不必等待
+        yield
+        state.close()
+
+    app = FastAPI(title="NL-STV", lifespan=lifespan)
+    app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+    app.state.api = state
+
+    @app.get("/api/health")
+    async def health():
+        data, version = await state.current()
+        meta = data.store.meta
+        return {'data_version': version, 'year': data.store.year, 'month': data.store.month,
+                'rows_seen': meta.get('rows_seen'), 'rows_dropped': meta.get('rows_dropped'),
+                'figure_cache': state.figures.stats()}
+
+    @app.get("/api/hotspots")
+    async def hotspots(request: Request, hour: int = Query(None, ge=0, le=23)):
+        return await state.figure_response(request, 'hotspots', {'hour': hour},
+                                           lambda data: hotspot_figure(data, hour))
+
+    @app.get("/api/hourly")
+    async def hourly(request: Request, zone: int = Query(..., ge=1, le=N_ZONES - 1)):
+        return await state.figure_response(request, 'hourly', {'zone': zone},
+                                           lambda data: hourly_figure(data, zone))
+
+    @app.get("/api/od")
+    async def od(request: Request, zones: str = None, borough: str = None, band: str = 'all',
+                 top_n: int = Query(30, ge=1, le=500), reverse: bool = False):
+        if band not in HOUR_BANDS:
+            raise HTTPException(422, f"未知的时段: {band}, 可选: {list(HOUR_BANDS)}")
+        if zones:
+            ids = _parse_zones(zones)
+        elif borough:
+            data, _ = await state.current()
+            ids = data.od_index.zones_in_boroughs(borough).tolist()
+            if not ids:
+                raise HTTPException(404, f"没有属于 {borough} 的区域")
+        else:
+            raise HTTPException(422, "需要 zones 或 borough 参数")
+        params = {'zones': ids, 'band': band, 'top_n': top_n, 'reverse': reverse}
+        return await state.figure_response(request, 'od', params,
+                                           lambda data: od_figure(data, ids, band, top_n, reverse))
+
+    @app.post("/api/query")
+    async def query(question: str = Body(None, embed=True), plan: dict = Body(None, embed=True)):
+        from component.nl_processor import parse_plan
+        data, version = await state.current()
+        if plan is not None:
+            try:
+                parsed = parse_plan(plan)
+            except ValueError as e:
+                raise HTTPException(422, str(e))
+        elif question:
+            parsed = await state.plan_for(question)
+        else:
+            raise HTTPException(422, "需要 question 或 plan")
+        return Response(await state.run(state.answer, parsed, data, version), media_type='application/json')
+
+    @app.get("/geometry/{name}")
+    async def geometry(request: Request, name: str):
+        if not _GEOMETRY_NAME.match(name) or not os.path.exists(os.path.join(state.asset_dir, name)):
+            raise HTTPException(404)
+        etag = '"%s"' % name[:-len('.json')]
+        headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers=headers)
+        gzipped = 'gzip' in request.headers.get('accept-encoding', '')
+        if gzipped:
+            headers['Content-Encoding'] = 'gzip'
+        body = await state.run(state.geometry_file, name, gzipped)
+        return Response(body, media_type='application/geo+json', headers=headers)
+
+    return app
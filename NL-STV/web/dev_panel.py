@@ -0,0 +1,68 @@
+"""
+开发者计时面板 (Dev Panel)
+
+在 Streamlit 页面中使用 component.instrumentation:
+    start_page("dashboard")             脚本开头, 开始记录本次重跑
+    with span("load_data"): ...          包住各阶段
+    plotly_chart(fig, "map", ...)        代替 st.plotly_chart, 计时图表序列化与发送
+    render_dev_panel()                   脚本末尾, 结束记录并在侧边栏显示
+开发模式 (环境变量 NLSTV_DEV=1 或网址带 ?dev=1) 下才显示面板并统计图表 JSON 字节数
+(需要额外序列化一次); 设置 NLSTV_TRACE_FILE 时每次重跑追加一行 JSON 记录, 线上也可以打开。
+"""
+import json
+import os
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from component.instrumentation import RECENT_RUNS, WINDOW, begin_run, end_run, span
+
+
+def dev_mode():
+    if os.environ.get('NLSTV_DEV', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return st.query_params.get('dev') == '1'
+
+
+def start_page(page):
+    ctx = get_script_run_ctx()
+    return begin_run(page, session=ctx.session_id[:8] if ctx is not None else None)
+
+
+def plotly_chart(fig, name='chart', **kwargs):
+    """st.plotly_chart 加计时; 开发模式下单独计时一次 JSON 序列化并记录字节数"""
+    if dev_mode():
+        with span(f"json:{name}") as record:
+            record.bytes = len(pio.to_json(fig, validate=False).encode('utf-8'))
+    with span(f"chart:{name}"):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def _format_ms(value):
+    return f"{value:,.1f}"
+
+
+def render_dev_panel():
+    """结束本次重跑的记录; 开发模式下在侧边栏显示本次各阶段耗时与滑动窗口分位数"""
+    trace = end_run(os.environ.get('NLSTV_TRACE_FILE'))
+    if trace is None or not dev_mode():
+        return trace
+
+    with st.sidebar.expander("开发者: 阶段耗时", expanded=True):
+        st.caption(f"本次重跑: {_format_ms(trace.wall_ms)} ms (CPU {_format_ms(trace.cpu_ms)} ms), "
+                   f"图表 JSON {trace.figure_bytes / 1024:,.1f} KB")
+        spans = pd.DataFrame([s.to_dict() for s in trace.spans])
+        if not spans.empty:
+            st.dataframe(spans.drop(columns='start_ms'), hide_index=True)
+
+        summary = WINDOW.summary()
+        if summary:
+            st.caption(f"最近 {WINDOW.size} 次 (ms)")
+            table = pd.DataFrame.from_dict(summary, orient='index').round(1)
+            st.dataframe(table.astype({'n': int}))
+        st.download_button("导出最近重跑 (JSONL)",
+                           "\n".join(json.dumps(r, ensure_ascii=False) for r in list(RECENT_RUNS)) + "\n",
+                           file_name=f"nlstv_trace_{trace.page}.jsonl", mime="application/jsonl")
+    return trace
@@ -0,0 +1,126 @@
+"""
+几何静态资源 (Geo Assets)
+
+区域 GeoJSON 有数 MB, 内联在每张 choropleth 里时, Streamlit 每次重跑、每份导出的 HTML
+都要重新发送同样的多边形。这里把几何作为静态资源单独提供, 图表中的 geojson 只写 URL:
+    - publish_geojson(): 按内容摘要命名 (<摘要>.json), 同时写一份预压缩的 .json.gz
+    - AssetServer: 后台线程里的小型 HTTP 服务, 支持 gzip、ETag/304 与跨域;
+      文件名即内容摘要, 因此可以设置长期缓存 (immutable), 浏览器只下载一次
+摘要与 figure_cache 的几何引用一致, 缓存的图表可以直接把引用换成这里的 URL。
+"""
+import gzip
+import json
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from component.figure_cache import geometry_digest
+
+DEFAULT_PORT = 8765
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def publish_geojson(geojson, asset_dir):
+    """把几何写成按内容命名的静态文件 (已存在则跳过), 返回文件名"""
+    text = geojson if isinstance(geojson, str) else json.dumps(geojson, separators=(',', ':'))
+    name = geometry_digest(text) + '.json'
+    path = os.path.join(asset_dir, name)
+    if not os.path.exists(path + '.gz'):
+        os.makedirs(asset_dir, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+        with gzip.open(path + '.gz.tmp', 'wb', compresslevel=9) as f:
+            f.write(text.encode('utf-8'))
+        os.replace(path + '.gz.tmp', path + '.gz')
+    return name
+
+
+def geojson_ref(geojson, asset_dir=None, base_url=None):
+    """
+    导出 HTML 时使用: 给出 base_url 则发布到 asset_dir 并返回 URL,
+    否则原样返回 GeoJSON (单文件 HTML, 可离线打开)。
+    """
+    if not base_url:
+        return geojson
+    return base_url.rstrip('/') + '/' + publish_geojson(geojson, asset_dir)
+
+
+class _AssetHandler(SimpleHTTPRequestHandler):
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+    def do_GET(self):
+        name = os.path.basename(self.path.split('?', 1)[0])
+        path = os.path.join(self.directory, name)
+        if not name.endswith('.json') or not os.path.exists(path):
+            self.send_error(404)
+            return
+        etag = '"%s"' % name[:-len('.json')]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '') and os.path.exists(path + '.gz')
+        with open(path + '.gz' if gzipped else path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/geo+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', CACHE_CONTROL)
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_error(405)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AssetServer:
+    """
+    在后台线程中提供 asset_dir 下的几何文件。
+    base_url 为浏览器访问时使用的地址; 只监听本机时默认 http://localhost:port/,
+    监听所有网卡 (0.0.0.0) 时必须指定, 否则其他机器上的浏览器会去请求它们自己的 localhost。
+    """
+
+    def __init__(self, asset_dir, host='127.0.0.1', port=DEFAULT_PORT, base_url=None):
+        if base_url is None and host in ('0.0.0.0', '::', ''):
+            raise ValueError("监听所有网卡时必须指定 base_url (浏览器访问几何文件的地址)")
+        self.asset_dir = os.path.abspath(asset_dir)
+        os.makedirs(self.asset_dir, exist_ok=True)
+        handler = lambda *args, **kwargs: _AssetHandler(*args, directory=self.asset_dir, **kwargs)
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        port = self._server.server_address[1]
+        self.base_url = base_url or f"http://{'localhost' if host == '127.0.0.1' else host}:{port}/"
+        if not self.base_url.endswith('/'):
+            self.base_url += '/'
+        self._thread = threading.Thread(target=self._server.serve_forever, name='geo-assets', daemon=True)
+        self._thread.start()
+
+    def url(self, name):
+        return self.base_url + name
+
+    def publish(self, geojson):
+        """发布几何并返回其 URL"""
+        return self.url(publish_geojson(geojson, self.asset_dir))
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
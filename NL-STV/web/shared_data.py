@@ -0,0 +1,255 @@
+"""
+多用户共享的只读数据层 (Shared Data)
+
+st.cache_data 每次命中都会反序列化出一份新的拷贝, 20 多个会话同时在线时内存成倍增长。
+这里统一使用 st.cache_resource: 进程内所有页面、所有会话拿到的是同一个对象,
+聚合立方体以只读方式内存映射 (mmap), 多个 Streamlit 进程之间还能共享操作系统页缓存。
+
+返回的对象是共享的, 调用方不得原地修改。
+
+聚合结果按数据版本缓存 (数据集目录为 manifest 版本号, 单个文件为 mtime/大小):
+增量更新发布新版本后, 下一次重跑自动换用新版本; watch_data_version() 定时检查版本,
+让打开着的页面无需刷新浏览器即可更新。
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from component.aggregate_store import dataset_version, load_aggregates, N_ZONES
+from component.instrumentation import span
+from component.od_index import cached_od_index
+from component.spatial_utils import cache_dir, load_zone_geojson, load_zone_centroids, DEFAULT_LEVEL
+from web.geo_assets import AssetServer, DEFAULT_PORT, publish_geojson
+
+SESSION_TTL = 300  # 超过 5 分钟没有重跑的会话不再计入活跃会话
+ASSET_DIR_NAME = 'assets'
+STATIC_GEOMETRY_DIR = 'geometry'
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+def data_version(path):
+    """数据集目录返回 manifest 版本号, 单个文件返回 (mtime, 大小), 不存在时为 None; 开销只有一次 stat"""
+    if os.path.isdir(path):
+        return dataset_version(path)
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+# 旧版本的缓存只保留一份, 避免版本更新后内存持续增长
+@st.cache_resource(max_entries=2)
+def _aggregates(path, version):
+    # 只在缓存未命中时计时, 开发者面板中出现该阶段即说明发生了加载或重建
+    with span("load_aggregates"):
+        return load_aggregates(path, mmap=True)
+
+
+@st.cache_resource(max_entries=2)
+def _hourly_pickups(path, version):
+    return _readonly(_aggregates(path, version).hourly_pickups())
+
+
+@st.cache_resource(max_entries=2)
+def _od_matrix(path, version):
+    return _readonly(_aggregates(path, version).od_matrix())
+
+
+@st.cache_resource(max_entries=2)
+def _od_index(path, lookup_path, version):
+    store = _aggregates(path, version)
+    # 优先读取预先构建好的索引文件, 缺失时才构建
+    with span("load_od_index"):
+        return cached_od_index(path, store, lookup=get_lookup(lookup_path))
+
+
+def get_aggregates(parquet_path):
+    """当前版本的预聚合立方体 (只读内存映射); parquet_path 也可以是数据集目录"""
+    return _aggregates(parquet_path, data_version(parquet_path))
+
+
+def get_hourly_pickups(parquet_path):
+    """小时 × 区域 上车数矩阵 (24, N_ZONES)"""
+    return _hourly_pickups(parquet_path, data_version(parquet_path))
+
+
+def get_od_matrix(parquet_path):
+    """全天汇总的起终点矩阵 (N_ZONES, N_ZONES)"""
+    return _od_matrix(parquet_path, data_version(parquet_path))
+
+
+def get_od_index(parquet_path, lookup_path):
+    """各时段的 OD 排名索引, 流向图的交互只做切片"""
+    return _od_index(parquet_path, lookup_path, data_version(parquet_path))
+
+
+def watch_data_version(path, interval=30):
+    """每 interval 秒检查一次数据版本, 发布了新版本就整页重跑 (会话状态保留)"""
+    seen = data_version(path)
+
+    @st.fragment(run_every=interval)
+    def _poll():
+        if data_version(path) != seen:
+            st.rerun(scope='app')
+
+    if isinstance(seen, tuple):
+        label = time.strftime('%Y-%m-%d %H:%M', time.localtime(seen[0]))
+    else:
+        label = f"v{seen}" if seen is not None else "无数据"
+    with st.sidebar:
+        _poll()
+        st.caption(f"数据版本: {label}")
+    return seen
+
+
+@st.cache_resource
+def get_zone_geojson(shp_path, level=DEFAULT_LEVEL):
+    with span("load_zone_geojson"):
+        return load_zone_geojson(shp_path, level)
+
+
+@st.cache_resource
+def get_asset_server(asset_dir, base_url):
+    """
+    进程内共享的几何静态资源服务, 只在设置了 NLSTV_ASSET_URL 时使用 (由反向代理转发到本服务)。
+    NLSTV_ASSET_PORT 指定端口 (默认 8765), 端口被占用时直接报错, 不改用其他端口。
+    """
+    port = int(os.environ.get("NLSTV_ASSET_PORT", DEFAULT_PORT))
+    try:
+        return AssetServer(asset_dir, host='0.0.0.0', port=port, base_url=base_url)
+    except OSError as e:
+        raise RuntimeError(f"几何资源服务无法监听端口 {port} ({e}); "
+                           f"请修改 NLSTV_ASSET_PORT 或取消 NLSTV_ASSET_URL") from e
+
+
+def _static_geometry_dir():
+    """
+    Streamlit 开启了静态文件服务 (server.enableStaticServing) 时, 页面脚本旁 static/ 目录下的文件
+    以 app/static/<路径> 与页面同源提供; 未开启时返回 None
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None or not st.get_option("server.enableStaticServing"):
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(ctx.main_script_path)), 'static', STATIC_GEOMETRY_DIR)
+
+
+@st.cache_resource
+def get_zone_geojson_url(shp_path, level=DEFAULT_LEVEL):
+    """
+    区域几何的引用, 图表的 geojson 参数直接使用它, 几何由浏览器单独下载一次并缓存:
+        - NLSTV_ASSET_URL 已设置: 由独立的资源服务提供, 返回该地址下的 URL
+        - Streamlit 开启了静态文件服务: 写入页面的 static/ 目录, 返回与页面同源的相对 URL
+        - 其他情况 (或 NLSTV_GEOMETRY=inline): 退回到内联的 GeoJSON dict
+    不会返回指向 localhost 的地址, 其他机器上的浏览器同样能加载几何。
+    """
+    geojson = get_zone_geojson(shp_path, level)
+    if os.environ.get("NLSTV_GEOMETRY") == "inline":
+        return geojson
+    base_url = os.environ.get("NLSTV_ASSET_URL")
+    if base_url:
+        return get_asset_server(os.path.join(cache_dir(shp_path), ASSET_DIR_NAME), base_url).publish(geojson)
+    static_dir = _static_geometry_dir()
+    if static_dir is None:
+        return geojson
+    return f"app/static/{STATIC_GEOMETRY_DIR}/" + publish_geojson(geojson, static_dir)
+
+
+@st.cache_resource
+def get_zone_centroids(shp_path):
+    return load_zone_centroids(shp_path)
+
+
+@st.cache_resource
+def get_lookup(lookup_path):
+    """清理后的区域对照表"""
+    lookup = pd.read_csv(lookup_path)
+    lookup['Zone'] = lookup['Zone'].fillna("Unknown").astype(str)
+    lookup['Borough'] = lookup['Borough'].fillna("Unknown").astype(str)
+    lookup['LocationID'] = lookup['LocationID'].astype(int)
+    return lookup
+
+
+@st.cache_resource
+def get_zone_names(lookup_path):
+    """以 LocationID 为下标的区域名数组"""
+    lookup = get_lookup(lookup_path)
+    names = np.full(N_ZONES, "Unknown", dtype=object)
+    names[lookup['LocationID'].to_numpy()] = lookup['Zone'].to_numpy()
+    return _readonly(names)
+
+
+@st.cache_resource
+def get_zone_centroid_arrays(shp_path):
+    """以 LocationID 为下标的中心点经纬度数组 (缺失为 NaN)"""
+    centroids = get_zone_centroids(shp_path)
+    lon = np.full(N_ZONES, np.nan)
+    lat = np.full(N_ZONES, np.nan)
+    lon[centroids['LocationID'].to_numpy()] = centroids['lon'].to_numpy()
+    lat[centroids['LocationID'].to_numpy()] = centroids['lat'].to_numpy()
+    return _readonly(lon), _readonly(lat)
+
+
+@st.cache_resource(max_entries=2)
+def _density_grid(parquet_path, shp_path, width, version):
+    from component.heatmap import DensityGrid, density_from_trips  # 依赖 pyarrow.parquet, 只在需要时导入
+    lon, lat = get_zone_centroid_arrays(shp_path)
+    with span("density_from_trips"):
+        grid = density_from_trips(parquet_path, DensityGrid(width=width), lon, lat)
+    _readonly(grid.counts)
+    return grid
+
+
+def get_density_grid(parquet_path, shp_path, width=1024):
+    """全量上车点的像素计数网格, 每个数据版本只扫描一次原始数据"""
+    return _density_grid(parquet_path, shp_path, width, data_version(parquet_path))
+
+
+@st.cache_resource
+def _session_registry():
+    return {}
+
+
+def process_rss_bytes():
+    """当前进程常驻内存 (RSS)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@st.cache_resource
+def _baseline_rss():
+    # 第一次调用时共享数据已经加载完毕, 之后的增量近似看作各会话自身的开销
+    return process_rss_bytes()
+
+
+def report_session_stats(page_start):
+    """在侧边栏显示首屏耗时、进程内存与估算的每会话内存"""
+    ctx = get_script_run_ctx()
+    registry = _session_registry()
+    now = time.time()
+    if ctx is not None:
+        registry[ctx.session_id] = now
+    for session_id, seen in list(registry.items()):
+        if now - seen > SESSION_TTL:
+            registry.pop(session_id, None)
+
+    n_sessions = max(len(registry), 1)
+    rss = process_rss_bytes()
+    per_session = max(rss - _baseline_rss(), 0) / n_sessions
+
+    with st.sidebar.expander("性能统计", expanded=False):
+        st.caption(f"首屏耗时: {(time.perf_counter() - page_start) * 1000:,.0f} ms")
+        st.caption(f"进程内存 (RSS): {rss / 2 ** 20:,.1f} MB")
+        st.caption(f"活跃会话: {len(registry)}")
+        st.caption(f"每会话内存 (估算): {per_session / 2 ** 20:,.2f} MB")
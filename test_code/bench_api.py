@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+import httpx
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+
+BANDS = ['all', 'night', 'am_peak', 'midday', 'pm_peak', 'evening']
+
+
+def zone_weights(n_zones, skew):
+    """区域被选中的概率按 Zipf 分布 (第 k 热门的区域权重为 1 / k^skew), skew=0 为均匀分布"""
+    order = np.random.default_rng(0).permutation(n_zones) + 1
+    weights = 1.0 / np.arange(1, n_zones + 1) ** skew
+    return order.tolist(), (weights / weights.sum()).tolist()
+
+
+def random_request(rng, zones):
+    """模拟仪表盘与流向图的交互: 切换区域、小时与时段"""
+    kind = rng.random()
+    zone = rng.choices(*zones)[0]
+    if kind < 0.4:
+        return '/api/hourly', {'zone': zone}
+    if kind < 0.7:
+        return '/api/od', {'zones': zone, 'band': rng.choice(BANDS), 'top_n': rng.choice([10, 30, 100])}
+    return '/api/hotspots', {'hour': rng.choice([None] + list(range(24)))}
+
+
+class RawConnection:
+    """
+    极简的 HTTP/1.1 keep-alive 客户端 (类似 wrk): 只发 GET, 按 Content-Length 读取响应。
+    httpx 每个请求的客户端开销有数毫秒, 与服务在同一台机器上压测时会先成为瓶颈。
+    """
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def get(self, target, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"GET {target} HTTP/1.1", f"Host: {self.host}:{self.port}", "Accept-Encoding: gzip"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await self.writer.drain()
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode('latin-1').split("\r\n")
+        status = int(head[0].split()[1])
+        response_headers = dict(line.split(": ", 1) for line in head[1:] if ": " in line)
+        response_headers = {k.lower(): v for k, v in response_headers.items()}
+        body = await self.reader.readexactly(int(response_headers.get('content-length', 0)))
+        return status, response_headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def user(base_url, rng, deadline, zones, use_etag, results):
+    """一个用户: 独立的连接, 不停地发请求, 像浏览器一样记住 ETag"""
+    url = urlsplit(base_url)
+    connection = RawConnection(url.hostname, url.port or 80)
+    etags = {}
+    try:
+        while time.perf_counter() < deadline:
+            path, params = random_request(rng, zones)
+            target = path + '?' + urlencode({k: v for k, v in params.items() if v is not None})
+            headers = {'If-None-Match': etags[target]} if use_etag and target in etags else {}
+            start = time.perf_counter()
+            try:
+                status, response_headers, body = await connection.get(target, headers)
+                if 'etag' in response_headers:
+                    etags[target] = response_headers['etag']
+                size = len(body)
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                connection.close()
+                status, size = type(e).__name__, 0
+            results.append((time.perf_counter() - start, status, size))
+    finally:
+        connection.close()
+
+
+async def run_load(base_url, users, seconds, zones, use_etag, seed):
+    results = []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(user(base_url, random.Random(seed + i), deadline, zones, use_etag, results)
+                           for i in range(users)))
+    return results, time.perf_counter() - start
+
+
+def report(title, results, elapsed):
+    latencies = np.array([r[0] for r in results]) * 1000
+    statuses = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    sent = sum(r[2] for r in results)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+    print(f"{title}: {len(results):,} 个请求 / {elapsed:.1f}s = {len(results) / elapsed:,.0f} req/s, "
+          f"延迟 p50 {p50:.0f} ms / p95 {p95:.0f} ms / p99 {p99:.0f} ms, "
+          f"平均响应 {sent / max(len(results), 1) / 1024:.1f} KB, 状态 {statuses}")
+
+
+def wait_until_ready(base_url, process, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("接口服务启动失败")
+        try:
+            if httpx.get(base_url + '/api/health', timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("等待接口服务启动超时")
+
+
+# 类型不对的查询计划 (模型常给出 null 或嵌套列表) 应返回 422, 而不是 500
+MALFORMED_PLANS = [
+    {'hours': [None]},
+    {'hours': [None, 8]},
+    {'hours': [1.7]},
+    {'top_k': [5]},
+    {'fare_min': [1]},
+    {'start': 5},
+]
+
+
+def check_query_errors(base_url):
+    for plan in MALFORMED_PLANS:
+        response = httpx.post(base_url + '/api/query', json={'plan': plan}, timeout=30)
+        if response.status_code != 422:
+            raise AssertionError(f"计划 {plan} 应返回 422, 实际为 {response.status_code}: {response.text[:200]}")
+    print(f"非法查询计划: {len(MALFORMED_PLANS)} 个均返回 422")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图表接口的并发压测 (模拟多个同时在线的用户)")
+    parser.add_argument('--url', default=None, help="已运行的服务地址; 不指定则启动 serve_api.py")
+    parser.add_argument('--data', default=data_dir, help="parquet 文件或数据集目录")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--seconds', type=float, default=10.0, help="每档并发的持续时间")
+    parser.add_argument('--zones', type=int, default=263, help="随机选择的区域 ID 上限")
+    parser.add_argument('--skew', type=float, default=1.0, help="区域热度的 Zipf 指数, 0 为均匀 (缓存最不友好)")
+    parser.add_argument('--no-etag', action='store_true', help="不发送 If-None-Match (每次都取完整响应)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = subprocess.Popen([sys.executable, os.path.join(current_dir, 'serve_api.py'),
+                                    '--data', args.data, '--port', str(args.port)])
+    try:
+        t0 = time.perf_counter()
+        wait_until_ready(base_url, process)
+        print(f"服务就绪: {base_url} ({time.perf_counter() - t0:.1f}s)")
+        check_query_errors(base_url)
+        zones = zone_weights(args.zones, args.skew)
+        for users in args.users:
+            results, elapsed = asyncio.run(run_load(base_url, users, args.seconds, zones,
+                                                    not args.no_etag, args.seed))
+            report(f"{users:>4} 个并发用户", results, elapsed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
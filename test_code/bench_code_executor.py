@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.code_executor import SandboxPool
+
+# 模拟模型生成的绘图代码：用预聚合数据画一张小时趋势图
+CHART_CODE = """
+hourly = store.hourly_pickups()
+df = pd.DataFrame({'hour': range(24), 'count': hourly[:, 132]})
+fig = px.line(df, x='hour', y='count', markers=True, template='plotly_white')
+"""
+
+# 沙箱限制自检用例
+SAFETY_CASES = {
+    '写文件': "open('/tmp/sandbox_escape.txt', 'w').write('x')",
+    '联网': "import socket; socket.create_connection(('example.com', 80))",
+    '子进程': "import subprocess; subprocess.run(['ls'])",
+    '死循环': "while True: pass",
+    '关闭审计钩子': "import gc; [setattr(o, 'active', False) for o in gc.get_objects()]",
+    'os.open 写文件': "import os; os.write(os.open('/tmp/sandbox_escape.txt', os.O_WRONLY | os.O_CREAT), b'x')",
+    '没有 fig': "x = 1",
+}
+
+
+def run_benchmark(n_workers, n_requests):
+    data_paths = {
+        'parquet_path': os.path.join(data_dir, 'yellow_tripdata_2025-01.parquet'),
+        'shp_path': os.path.join(data_dir, 'taxi_zones.shp'),
+        'lookup_path': os.path.join(data_dir, 'taxi_zone_lookup.csv'),
+    }
+
+    t0 = time.perf_counter()
+    with SandboxPool(n_workers=n_workers, data_paths=data_paths, cpu_seconds=2, wall_seconds=5) as pool:
+        print(f"沙箱进程池启动 ({n_workers} 个进程): {time.perf_counter() - t0:.2f}s, "
+              f"隔离: {', '.join(pool.isolation) or '无'}")
+
+        # 1. 吞吐量与延迟
+        def timed(_):
+            start = time.perf_counter()
+            result = pool.run(CHART_CODE)
+            return time.perf_counter() - start, result['ok']
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(timed, range(n_requests)))
+        total = time.perf_counter() - t0
+
+        latencies = np.array([r[0] for r in results]) * 1000
+        print(f"请求数: {n_requests}, 成功: {sum(r[1] for r in results)}")
+        print(f"吞吐量: {n_requests / total:.1f} req/s")
+        print(f"延迟 p50: {np.percentile(latencies, 50):.1f} ms, p95: {np.percentile(latencies, 95):.1f} ms")
+
+        # 2. 限制是否生效
+        print("\n沙箱限制自检：")
+        for name, code in SAFETY_CASES.items():
+            result = pool.run(code)
+            status = "通过" if result['ok'] else result['error']['type']
+            print(f"  {name}: {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="沙箱代码执行器基准测试")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    run_benchmark(args.workers, args.requests)
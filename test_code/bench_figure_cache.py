@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+import plotly.express as px
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.figure_cache import FigureCache, figure_key
+from component.nl_processor import parse_plan
+from component.synthetic import make_zone_geojson, make_zone_lookup
+
+# 同一个问题的不同问法, 模型给出的计划规范化后相同
+QUESTIONS = {
+    "曼哈顿早高峰各区域上车量": {'pu_boroughs': ['Manhattan'], 'hours': [6, 7, 8, 9], 'group_by': ['PULocationID']},
+    "早上 6-9 点曼哈顿哪里打车最多": {'hours': [9, 8, 7, 6], 'pu_boroughs': ['manhattan'], 'group_by': ['PULocationID']},
+}
+STYLE = {'colorscale': 'Viridis', 'map_style': 'carto-positron', 'zoom': 10}
+
+
+def build_figure(geojson, lookup, seed):
+    """模拟一次 NL2Vis 的渲染: 聚合结果 -> 带完整几何的 choropleth_map"""
+    rng = np.random.default_rng(seed)
+    df = lookup[['LocationID', 'Zone']].copy()
+    df['count'] = rng.integers(0, 50_000, len(df))
+    df['log_count'] = np.log10(df['count'] + 1)
+    return px.choropleth_map(df, geojson=geojson, locations='LocationID', featureidkey="properties.LocationID",
+                             color='log_count', hover_name='Zone', color_continuous_scale=STYLE['colorscale'],
+                             map_style=STYLE['map_style'], zoom=STYLE['zoom'],
+                             center={"lat": 40.7128, "lon": -74.0060}, opacity=0.7)
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000, result
+
+
+def run_benchmark(repeat, n_plans, max_entries):
+    geojson = make_zone_geojson()
+    lookup = make_zone_lookup()
+    cache_dir = tempfile.mkdtemp(prefix='figure_cache_')
+    try:
+        cache = FigureCache(cache_dir, max_entries=max_entries)
+
+        # 1. 未命中: 构建 + 序列化; 命中: 内存 / 磁盘
+        plans = [parse_plan(spec) for spec in QUESTIONS.values()]
+        keys = {figure_key(plan, 'choropleth_map', STYLE) for plan in plans}
+        print(f"{len(QUESTIONS)} 种问法规范化后的 key 数: {len(keys)}")
+        key = keys.pop()
+
+        build_ms, full_json = timed(lambda: build_figure(geojson, lookup, 0).to_json(), repeat)
+        stored = cache.put(key, build_figure(geojson, lookup, 0))
+        memory_ms, cached_json = timed(lambda: cache.get(key), repeat)
+        disk_ms, _ = timed(lambda: FigureCache(cache_dir).get(key), repeat)
+        url_ms, url_json = timed(lambda: cache.get(key, geometry_url=lambda d: f"/app/static/{d}.json"), repeat)
+        assert len(cached_json) == len(full_json), "内联几何后应与原图等长"
+
+        print(f"构建并序列化:       {build_ms:8.2f} ms  ({len(full_json) / 2 ** 20:.2f} MB)")
+        print(f"内存命中 (内联几何): {memory_ms:8.2f} ms")
+        print(f"磁盘命中 (新进程):   {disk_ms:8.2f} ms")
+        print(f"内存命中 (几何 URL): {url_ms:8.2f} ms  ({len(url_json) / 1024:.1f} KB)")
+        print(f"单条缓存占用:       {len(stored) / 1024:.1f} KB, 几何 {cache.stats()['geometries']} 份共享")
+
+        # 2. 问题索引: 同一问题再次提问时不再调用模型
+        question = next(iter(QUESTIONS))
+        cache.remember_question(question, key)
+        print(f"重复提问命中: {cache.key_for_question('  ' + question + ' ') == key}")
+
+        # 3. LRU 淘汰
+        for i in range(n_plans):
+            plan = parse_plan({'hours': [i % 24], 'top_k': i + 1})
+            cache.put(figure_key(plan, 'choropleth_map', STYLE), build_figure(geojson, lookup, i))
+        print(f"写入 {n_plans} 张图后: {cache.stats()}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图表缓存基准测试")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--plans', type=int, default=40, help="用于检验淘汰的不同计划数")
+    parser.add_argument('--max-entries', type=int, default=16)
+    args = parser.parse_args()
+    run_benchmark(args.repeat, args.plans, args.max_entries)
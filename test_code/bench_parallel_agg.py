@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+import pandas as pd
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.data_loader import resolve_files
+from component.parallel_agg import BincountAggregator, parallel_aggregate
+from component.synthetic import write_trip_dataset
+
+COLUMNS = ['tpep_pickup_datetime', 'PULocationID', 'DOLocationID', 'payment_type', 'fare_amount']
+
+
+def pandas_path(paths):
+    """脚本里现有的写法: 整表读入后单线程 groupby / value_counts"""
+    df = pd.concat([pd.read_parquet(p, columns=COLUMNS) for p in paths], ignore_index=True)
+    df['hour'] = df['tpep_pickup_datetime'].dt.hour
+    hourly = df.groupby(['hour', 'PULocationID']).size()
+    od = df.groupby(['PULocationID', 'DOLocationID']).size()
+    payments = df['payment_type'].value_counts()
+    fares = df.groupby('PULocationID')['fare_amount'].sum()
+    return hourly, od, payments, fares
+
+
+def make_aggregators():
+    return [
+        BincountAggregator(('hour', 'PULocationID')),
+        BincountAggregator(('PULocationID', 'DOLocationID')),
+        BincountAggregator(('payment_type',)),
+        BincountAggregator(('PULocationID',), sums=('fare_amount',)),
+    ]
+
+
+def check_same(expected, aggs):
+    """并行结果与 pandas 结果逐组比较"""
+    for series, agg in zip(expected, aggs):
+        frame = agg.to_frame().set_index(list(agg.dims))
+        got = frame[agg.sums[0] if agg.sums else 'count']
+        want = series.rename_axis(list(agg.dims)).reindex(got.index)
+        if len(series) != len(got) or not np.allclose(got.to_numpy(), want.to_numpy()):
+            return False
+    return True
+
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def run_benchmark(data, workers_list, repeat):
+    paths = resolve_files(data)
+    pandas_s, expected = timed(lambda: pandas_path(paths), repeat)
+    print(f"文件数: {len(paths)}, pandas 单线程: {pandas_s:.2f}s")
+    print(f"{'进程数':>6}{'耗时(s)':>10}{'相对 pandas':>14}{'相对 1 进程':>14}{'并行效率':>10}  结果一致")
+
+    single = None
+    # pandas 对照组不做清洗, 这里也关闭默认清洗, 两边聚合的是同一批行
+    for workers in sorted(set(workers_list) | {1}):
+        seconds, aggs = timed(lambda: parallel_aggregate(data, make_aggregators, workers=workers, clean=None), repeat)
+        single = single or seconds  # 1 进程 (不启动进程池) 作为基准
+        speedup = single / seconds
+        print(f"{workers:>6}{seconds:>10.2f}{pandas_s / seconds:>13.1f}x{speedup:>13.1f}x"
+              f"{speedup / workers:>10.0%}  {check_same(expected, aggs)}")
+
+
+if __name__ == "__main__":
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="多进程 bincount 聚合与 pandas groupby 的对比")
+    parser.add_argument('--data', default=None, help="parquet 文件或数据目录, 不指定则生成合成数据")
+    parser.add_argument('--rows', type=int, default=8_000_000, help="合成数据行数")
+    parser.add_argument('--row-group-rows', type=int, default=1 << 19, help="合成数据每个 row group 的行数")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, 16, 32, cpus} & set(range(1, cpus + 1))))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = None
+    data = args.data
+    if data is None:
+        work_dir = tempfile.mkdtemp(prefix='nlstv_parallel_')
+        print(f"生成 {args.rows:,} 行合成数据...")
+        write_trip_dataset(work_dir, args.rows, rows_per_file=max(args.rows // 4, 1), chunk_rows=args.row_group_rows)
+        data = work_dir
+    try:
+        run_benchmark(data, args.workers, args.repeat)
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import plotly.express as px
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.aggregate_store import build_aggregates, load_aggregates
+from component.benchmark import (DEFAULT_TOLERANCE, SkipStage, compare_to_baseline, load_results,
+                                 run_stages, save_results)
+from component.synthetic import make_zone_geojson, make_zone_lookup, write_trip_parquet
+
+TRIP_COLUMNS = ['tpep_pickup_datetime', 'PULocationID', 'DOLocationID']
+
+
+# --- 各阶段与 test_code 中脚本的处理步骤一一对应 ---
+
+def stage_parquet_read(ctx):
+    return {'df': pd.read_parquet(ctx['parquet_path'], columns=TRIP_COLUMNS)}
+
+
+def stage_hour_extract(ctx):
+    return {'hours': ctx['df']['tpep_pickup_datetime'].dt.hour}
+
+
+def stage_groupby_hour_zone(ctx):
+    df = ctx['df']
+    grouped = df.groupby([ctx['hours'], df['PULocationID']]).size().reset_index(name='count')
+    return {'grouped': grouped}
+
+
+def stage_value_counts(ctx):
+    counts = ctx['df']['PULocationID'].value_counts().reset_index()
+    counts.columns = ['LocationID', 'pickup_count']
+    return {'counts': counts}
+
+
+def stage_od_groupby(ctx):
+    ctx['df'].groupby(['PULocationID', 'DOLocationID']).size()
+
+
+def stage_lookup_merge(ctx):
+    return {'merged': ctx['counts'].merge(ctx['lookup'], on='LocationID', how='left')}
+
+
+def stage_geojson_convert(ctx):
+    # 对应 spatial_utils 中的投影 -> 简化 -> 转回 WGS84 -> 导出
+    try:
+        import geopandas as gpd
+    except ImportError:
+        raise SkipStage("未安装 geopandas")
+    gdf = gpd.GeoDataFrame.from_features(ctx['geojson']['features'], crs='EPSG:4326')
+    gdf = gdf.to_crs(epsg=2263)
+    gdf['geometry'] = gdf.geometry.simplify(100)
+    json.loads(gdf.to_crs(epsg=4326).to_json())
+
+
+def stage_cube_build(ctx):
+    build_aggregates(ctx['parquet_path'])
+
+
+def stage_cube_load(ctx):
+    load_aggregates(ctx['parquet_path'], mmap=True).zone_totals()
+
+
+def stage_choropleth(ctx):
+    merged = ctx['merged']
+    merged = merged.assign(log_pickup_count=np.log10(merged['pickup_count'] + 1))
+    fig = px.choropleth_map(merged, geojson=ctx['geojson'], locations='LocationID',
+                            featureidkey="properties.LocationID", color='log_pickup_count',
+                            color_continuous_scale="Viridis", map_style="carto-positron",
+                            zoom=10, center={"lat": 40.7128, "lon": -74.0060}, opacity=0.7,
+                            hover_name='Zone')
+    return {'fig': fig}
+
+
+def stage_to_json(ctx):
+    ctx['fig'].to_json()
+
+
+def stage_write_html(ctx):
+    ctx['fig'].write_html(os.path.join(ctx['work_dir'], 'bench_map.html'), include_plotlyjs='cdn')
+
+
+STAGES = [
+    ('parquet_read', stage_parquet_read),
+    ('hour_extract', stage_hour_extract),
+    ('groupby_hour_zone', stage_groupby_hour_zone),
+    ('value_counts', stage_value_counts),
+    ('od_groupby', stage_od_groupby),
+    ('lookup_merge', stage_lookup_merge),
+    ('geojson_convert', stage_geojson_convert),
+    ('cube_build', stage_cube_build),
+    ('cube_load', stage_cube_load),
+    ('choropleth_map', stage_choropleth),
+    ('to_json', stage_to_json),
+    ('write_html', stage_write_html),
+]
+
+
+def prepare_data(work_dir, n_rows, seed):
+    """同一个 seed 下生成的数据完全一致, 已存在时直接复用"""
+    parquet_path = os.path.join(work_dir, f'synthetic_{n_rows}_s{seed}_2025-01.parquet')
+    if not os.path.exists(parquet_path):
+        print(f"生成合成数据: {n_rows:,} 行...")
+        write_trip_parquet(parquet_path, n_rows, seed=seed)
+    return parquet_path
+
+
+def print_results(n_rows, results):
+    print(f"\n=== {n_rows:,} 行 ===")
+    print(f"{'阶段':<20}{'wall(s)':>10}{'cpu(s)':>10}{'峰值(MB)':>12}{'Python':>10}{'Arrow':>10}")
+    for name, r in results.items():
+        if 'skipped' in r:
+            print(f"{name:<20}  跳过: {r['skipped']}")
+            continue
+        mb = [f"{r[k]:.1f}" if r.get(k) is not None else '-' for k in ('peak_mb', 'py_peak_mb', 'arrow_peak_mb')]
+        print(f"{name:<20}{r['wall_s']:>10.3f}{r['cpu_s']:>10.3f}{mb[0]:>12}{mb[1]:>10}{mb[2]:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据处理与绘图流程的分阶段基准测试")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000],
+                        help="合成数据行数, 可给多个 (如 1000000 10000000)")
+    parser.add_argument('--repeat', type=int, default=3, help="每个阶段重复次数, 取中位数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=None, help="合成数据存放目录, 默认用临时目录并在结束后删除")
+    parser.add_argument('--no-memory', action='store_true', help="跳过峰值内存统计 (tracemalloc 与 Arrow 内存池)")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', default=None, help="基线结果 JSON, 有回退时返回码为 1")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix='nlstv_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        geojson = make_zone_geojson()
+        lookup = make_zone_lookup()
+        runs = {}
+        for n_rows in args.rows:
+            parquet_path = prepare_data(work_dir, n_rows, args.seed)
+            context = {'parquet_path': parquet_path, 'work_dir': work_dir,
+                       'geojson': geojson, 'lookup': lookup}
+            results = run_stages(STAGES, context, repeat=args.repeat, profile_memory=not args.no_memory)
+            results['_data'] = {'rows': n_rows, 'file_mb': os.path.getsize(parquet_path) / 2 ** 20,
+                                'row_groups': pq.ParquetFile(parquet_path).num_row_groups}
+            runs[str(n_rows)] = results
+            print_results(n_rows, {k: v for k, v in results.items() if not k.startswith('_')})
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    save_results(args.out, runs)
+    print(f"\n结果已保存: {args.out}")
+
+    if args.baseline:
+        rows, regressions = compare_to_baseline(runs, load_results(args.baseline), tolerance=args.tolerance)
+        print(f"\n与基线对比 (容差 {args.tolerance:.0%}):")
+        for r in rows:
+            flag = "  <-- 变慢" if r['slower'] else ""
+            flag += "  <-- 内存增加" if r['bigger'] else ""
+            memory = (f", 峰值 {r['baseline_mb']:.1f} -> {r['current_mb']:.1f} MB"
+                      if r['baseline_mb'] is not None and r['current_mb'] is not None else "")
+            print(f"  [{r['rows']}] {r['stage']:<20}{r['baseline_s']:>8.3f}s -> {r['current_s']:>8.3f}s "
+                  f"({r['ratio']:.2f}x){memory}{flag}")
+        if regressions:
+            print(f"发现 {len(regressions)} 个阶段性能或内存回退")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
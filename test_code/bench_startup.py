@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+_process_start = time.perf_counter()
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+
+PAGES = {
+    'dashboard': os.path.join(current_dir, 'test_dashboard.py'),
+    'flow_map': os.path.join(current_dir, 'test_flow_map.py'),
+}
+# 只有重建产物时才需要的重量级模块, 正常启动不应出现在 sys.modules 中
+HEAVY_MODULES = ['geopandas', 'shapely', 'pyproj', 'pyarrow.parquet', 'plotly.express']
+SOURCE_SUFFIXES = ('.parquet', '.shp', '.shx', '.dbf', '.prj', '.cpg', '.csv')
+
+
+def child(page, trace_file):
+    """在全新的进程中运行一次页面 (与新启动的 Streamlit worker 相同), 输出 JSON 结果"""
+    from streamlit.testing.v1 import AppTest
+    streamlit_ms = (time.perf_counter() - _process_start) * 1000
+    before = set(sys.modules)
+
+    os.environ['NLSTV_TRACE_FILE'] = trace_file
+    run_wall0 = time.time()
+    t0 = time.perf_counter()
+    at = AppTest.from_file(PAGES[page], default_timeout=600).run()
+    script_ms = (time.perf_counter() - t0) * 1000
+    errors = [str(e.value) for e in at.exception]
+
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        record = json.loads(f.readline())
+    # 页面脚本开始到 start_page() 之间是模块导入与页面配置
+    imports_ms = (record['ts'] - run_wall0) * 1000
+    charts = [s for s in record['spans'] if s['name'].startswith('chart:')]
+    first_chart_ms = imports_ms + (charts[0]['start_ms'] + charts[0]['wall_ms'] if charts else record['wall_ms'])
+    new_packages = sorted({m.split('.')[0] for m in set(sys.modules) - before if not m.startswith('_')})
+    print(json.dumps({
+        'streamlit_ms': streamlit_ms,
+        'imports_ms': imports_ms,
+        'first_chart_ms': first_chart_ms,
+        'script_ms': script_ms,
+        'heavy_loaded': [m for m in HEAVY_MODULES if m in sys.modules],
+        'new_packages': [p for p in new_packages if p in ('pandas', 'pyarrow', 'geopandas', 'shapely', 'pyproj',
+                                                          'plotly', 'scipy', 'matplotlib')],
+        'slowest': sorted(record['spans'], key=lambda s: -s['wall_ms'])[:3],
+        'errors': errors,
+    }))
+
+
+def copy_sources(target):
+    """只复制原始数据 (不含 zone_cache / .agg 等产物), 用来测量需要重建时的启动"""
+    for name in os.listdir(data_dir):
+        if name.endswith(SOURCE_SUFFIXES) and os.path.isfile(os.path.join(data_dir, name)):
+            shutil.copy2(os.path.join(data_dir, name), target)
+
+
+def run_page(page, runs, env):
+    results = []
+    for _ in range(runs):
+        with tempfile.NamedTemporaryFile(suffix='.jsonl', delete=False) as f:
+            trace_file = f.name
+        try:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', page, '--trace', trace_file],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+        finally:
+            os.remove(trace_file)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def print_results(page, results):
+    def median(key):
+        return statistics.median(r[key] for r in results)
+    last = results[-1]
+    print(f"{page}: streamlit 导入 {median('streamlit_ms'):,.0f} ms | 页面导入 {median('imports_ms'):,.0f} ms | "
+          f"首张图表 {median('first_chart_ms'):,.0f} ms | 整页 {median('script_ms'):,.0f} ms")
+    print(f"  页面新导入的包: {', '.join(last['new_packages']) or '无'}; "
+          f"重量级模块: {', '.join(last['heavy_loaded']) or '无'}")
+    print("  最慢的阶段: " + ", ".join(f"{s['name']} {s['wall_ms']:,.0f} ms" for s in last['slowest']))
+    if last['errors']:
+        print(f"  页面异常: {last['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="测量页面冷启动: 模块导入耗时与首张图表出现的时间")
+    parser.add_argument('--pages', nargs='+', default=list(PAGES), choices=list(PAGES))
+    parser.add_argument('--runs', type=int, default=3, help="每个页面启动的次数 (每次都是新进程)")
+    parser.add_argument('--rebuild', action='store_true', help="在只有原始数据的临时目录中运行, 包含重建产物的耗时")
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--trace', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.trace)
+        sys.exit(0)
+
+    env = dict(os.environ)
+    for page in args.pages:
+        work_dir = None
+        if args.rebuild:
+            # 每次都从没有产物的目录开始
+            work_dir = tempfile.mkdtemp(prefix='nlstv_startup_')
+            copy_sources(work_dir)
+            env['NLSTV_DATA_DIR'] = work_dir
+        try:
+            print_results(page + (" (重建产物)" if args.rebuild else ""), run_page(page, 1 if args.rebuild else args.runs, env))
+        finally:
+            if work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
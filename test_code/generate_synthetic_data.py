@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.synthetic import (DEFAULT_CHUNK_ROWS, DEFAULT_ROWS_PER_FILE, write_trip_dataset,
+                                 write_zone_files)
+
+
+def parse_month(text):
+    year, month = text.split('-')
+    return int(year), int(month)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成与 TLC 字段一致的合成出租车数据 (默认写入 data/ 供各脚本使用)")
+    parser.add_argument('--out', default=data_dir)
+    parser.add_argument('--rows', type=int, default=3_500_000, help="每个月的行数")
+    parser.add_argument('--months', type=parse_month, nargs='+', default=[(2025, 1)], help="如 2025-01 2025-02")
+    parser.add_argument('--rows-per-file', type=int, default=DEFAULT_ROWS_PER_FILE,
+                        help="单个文件的最大行数, 超出时按时间拆成多个文件并行生成")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="每个 row group 的行数 (决定内存占用)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--zones-only', action='store_true', help="只生成区域对照表和边界")
+    args = parser.parse_args()
+
+    print("生成区域对照表与边界...")
+    for name, path in write_zone_files(args.out).items():
+        print(f"  {name}: {path}")
+    if args.zones_only:
+        sys.exit(0)
+
+    total = args.rows * len(args.months)
+    print(f"生成行程数据: {len(args.months)} 个月, 共 {total:,} 行, {args.workers} 个进程...")
+    t0 = time.perf_counter()
+    paths = write_trip_dataset(args.out, args.rows, months=args.months, seed=args.seed,
+                               rows_per_file=args.rows_per_file, chunk_rows=args.chunk_rows, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    size_mb = sum(os.path.getsize(p) for p in paths) / 2 ** 20
+    print(f"完成: {len(paths)} 个文件, {size_mb:.1f} MB, 耗时 {elapsed:.1f}s ({total / elapsed:,.0f} 行/秒)")
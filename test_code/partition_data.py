@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.cleaning import RULE_LABELS
+from component.data_loader import load_trips, repartition_trips, scan_plan
+from component.nl_processor import parse_plan
+from component.query_engine import plan_scan_filters
+
+JFK = 132
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 data/ 下按月的 parquet 重写为 year/month[/borough] 分区数据集")
+    parser.add_argument('--src', default=data_dir)
+    parser.add_argument('--out', default=None,
+                        help="默认为与 src 同级的 <src>_trips (不放在 src 内, 否则扫描 src 时会把同一份数据读两遍)")
+    parser.add_argument('--by-borough', action='store_true')
+    parser.add_argument('--start', default='2025-03-01', help="剪枝演示: JFK 上车的时间范围起点")
+    parser.add_argument('--end', default='2025-04-01')
+    args = parser.parse_args()
+
+    src = os.path.abspath(args.src)
+    args.out = args.out or os.path.join(os.path.dirname(src), os.path.basename(src) + '_trips')
+    lookup = pd.read_csv(os.path.join(args.src, 'taxi_zone_lookup.csv'))
+    sources = [os.path.join(args.src, f) for f in sorted(os.listdir(args.src))
+               if f.startswith('yellow_tripdata_') and f.endswith('.parquet')]
+
+    if not os.path.exists(args.out):
+        print(f"重写分区: {len(sources)} 个文件 -> {args.out}")
+        t0 = time.perf_counter()
+        meta = repartition_trips(sources, args.out, lookup=lookup, by_borough=args.by_borough)
+        print(f"完成: {meta['rows']:,} 行, {meta['partitions']} 个分区, 耗时 {time.perf_counter() - t0:.1f}s")
+        cleaning = meta['cleaning']
+        hits = ", ".join(f"{RULE_LABELS[r]} {c:,}" for r, c in cleaning['by_rule'].items() if c)
+        print(f"写入前清洗丢弃 {cleaning['dropped']:,} / {cleaning['rows_in']:,} 行" + (f" ({hits})" if hits else ""))
+
+    # 剪枝效果: "JFK 在某个月的上车行程"
+    plan = parse_plan({'start': args.start, 'end': args.end, 'pu_zones': [JFK]})
+    filters = plan_scan_filters(plan, lookup)
+    for name, paths in [('原始文件', sources), ('分区数据集', args.out)]:
+        t0 = time.perf_counter()
+        _, stats = scan_plan(paths, **filters)
+        rows = len(load_trips(paths, columns=['tpep_pickup_datetime', 'PULocationID'], **filters))
+        print(f"{name}: 读取文件 {stats['files_read']}/{stats['files_total']}, "
+              f"row group {stats['row_groups_read']}/{stats['row_groups_total']}, "
+              f"{rows:,} 行, {time.perf_counter() - t0:.3f}s")
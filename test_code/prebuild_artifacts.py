@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+import argparse
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.aggregate_store import load_aggregates
+from component.od_index import cached_od_index
+from component.spatial_utils import cache_dir, ensure_zone_artifacts, load_zone_geojson
+from web.geo_assets import publish_geojson
+
+# 与 web/shared_data.py 相同: 独立资源服务的目录, 以及页面同源静态文件的目录
+ASSET_DIR_NAME = 'assets'
+STATIC_GEOMETRY_DIR = os.path.join(current_dir, 'static', 'geometry')
+
+
+def step(label, func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{label}: {time.perf_counter() - t0:.2f}s")
+    return result
+
+
+# 部署前 (或数据更新后) 预先构建页面启动时需要的全部产物, 使页面进程只读取文件:
+#   区域几何/中心点缓存 (geopandas), 预聚合立方体 (pyarrow), OD 排名索引, 几何静态文件
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预先构建仪表盘与流向图启动所需的产物")
+    parser.add_argument('--data', default=data_dir,
+                        help="parquet 文件或数据集目录")
+    parser.add_argument('--shp', default=os.path.join(data_dir, 'taxi_zones.shp'))
+    args = parser.parse_args()
+
+    step("区域几何与中心点", ensure_zone_artifacts, args.shp)
+    store = step("预聚合立方体", load_aggregates, args.data, mmap=True)
+    step("OD 排名索引", cached_od_index, args.data, store)
+    geojson = load_zone_geojson(args.shp)
+    for asset_dir in (STATIC_GEOMETRY_DIR, os.path.join(cache_dir(args.shp), ASSET_DIR_NAME)):
+        name = step("几何静态文件", publish_geojson, geojson, asset_dir)
+        print(f"  {os.path.join(asset_dir, name)}")
@@ -0,0 +1,30 @@
+import os
+import sys
+import argparse
+
+import uvicorn
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from web.api import create_app
+
+# 启动图表接口服务:
+#   python serve_api.py --port 8000
+#   curl -H 'Accept-Encoding: gzip' 'http://localhost:8000/api/hourly?zone=237'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NL-STV 图表接口服务 (FastAPI)")
+    parser.add_argument('--data', default=data_dir,
+                        help="parquet 文件或数据集目录")
+    parser.add_argument('--shp', default=os.path.join(data_dir, 'taxi_zones.shp'))
+    parser.add_argument('--lookup', default=os.path.join(data_dir, 'taxi_zone_lookup.csv'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=None, help="建图/查询线程池大小")
+    args = parser.parse_args()
+
+    app = create_app(args.data, args.shp, args.lookup, workers=args.threads)
+    # 保活时间长于客户端的空闲间隔, 避免复用连接时恰好被服务端关闭
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning', timeout_keep_alive=75)
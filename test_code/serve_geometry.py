@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import argparse
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.spatial_utils import SIMPLIFY_LEVELS, load_zone_geojson
+from web.geo_assets import AssetServer, DEFAULT_PORT
+
+# 为导出的 HTML (test_graph.py / test_dynamic_graph.py --asset-url ...) 提供区域几何:
+#   python serve_geometry.py --port 8765
+#   python test_graph.py --asset-url http://localhost:8765
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以静态资源方式提供区域几何 (gzip + 长期缓存)")
+    parser.add_argument('--asset-dir', default='geo_assets')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--shp', default=os.path.join(data_dir, 'taxi_zones.shp'),
+                        help="同时发布该 shp 各简化精度的几何 (文件不存在时跳过)")
+    args = parser.parse_args()
+
+    with AssetServer(args.asset_dir, host=args.host, port=args.port) as server:
+        if os.path.exists(args.shp):
+            for level in SIMPLIFY_LEVELS:
+                print(f"{level:>7}: {server.publish(load_zone_geojson(args.shp, level))}")
+        print(f"正在提供 {server.asset_dir} -> {server.base_url}  (Ctrl+C 退出)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
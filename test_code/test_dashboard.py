@@ -1,138 +1,138 @@
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
-import plotly.express as px
 import os
-import json
-import numpy as np
+import sys
+import time
+
+page_start = time.perf_counter()
 
 # 设置页面宽度
 st.set_page_config(layout="wide", page_title="NYC Taxi Spatiotemporal Dashboard")
 
 # 1. 路径设置
 current_dir = os.path.dirname(os.path.abspath(__file__))
-data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
-parquet_path = os.path.join(data_dir, 'yellow_tripdata_2025-01.parquet')
+data_dir = os.environ.get('NLSTV_DATA_DIR') or os.path.abspath(os.path.join(current_dir, '..', 'data'))
+# 行程数据集目录: 按月追加原始文件的目录 (update_aggregates.py 维护其预聚合结果与版本),
+# 也可以是 partition_data.py 写出的分区目录; 新版本发布后打开着的页面会自动更新
+trips_path = os.environ.get('NLSTV_TRIPS_PATH') or data_dir
 shp_path = os.path.join(data_dir, 'taxi_zones.shp')
 lookup_path = os.path.join(data_dir, 'taxi_zone_lookup.csv')
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from web.shared_data import (get_density_grid, get_hourly_pickups, get_lookup, get_zone_geojson_url,
+                             report_session_stats, watch_data_version)
+from component.charts import MAP_CENTER, hourly_trend, pickup_choropleth
+from component.instrumentation import span
+from web.dev_panel import plotly_chart, render_dev_panel, start_page
 
+# 各阶段计时, 网址带 ?dev=1 时在侧边栏显示
+start_page("dashboard")
 
-@st.cache_data
-def load_data():
+
+@st.cache_resource(max_entries=2)
+def load_data(version):
     try:
-        # A. 加载地理数据
+        # A. 检查地理数据
         if not os.path.exists(shp_path):
             st.error(f"找不到文件: {shp_path}")
-            return None, None, None, None
+            return None, None, None
 
-        gdf = gpd.read_file(shp_path).to_crs(epsg=4326)
-        geojson = json.loads(gdf.to_json())
+        # B. 共享的只读 小时 × 区域 矩阵（不再读取原始行程，也不为每个会话拷贝）
+        hourly = get_hourly_pickups(trips_path)
 
-        # B. 加载行程数据
-        df = pd.read_parquet(parquet_path, columns=['tpep_pickup_datetime', 'PULocationID'])
-        df['hour'] = pd.to_datetime(df['tpep_pickup_datetime']).dt.hour
+        # C. 共享的名字对照表
+        lookup = get_lookup(lookup_path)
 
-        # C. 加载名字对照表并清理
-        lookup = pd.read_csv(lookup_path)
-        lookup['Zone'] = lookup['Zone'].fillna("Unknown").astype(str)
-        lookup['Borough'] = lookup['Borough'].fillna("Unknown").astype(str)
-        lookup['LocationID'] = lookup['LocationID'].astype(int)
+        # 区域名 -> ID 字典（同名取第一个），切换区域时 O(1) 查找
+        zone_to_id = lookup.drop_duplicates('Zone').set_index('Zone')['LocationID'].to_dict()
 
-        return gdf, geojson, df, lookup
+        return hourly, lookup, zone_to_id
     except Exception as e:
         st.error(f"加载数据时发生错误: {e}")
-        return None, None, None, None
+        return None, None, None
 
 
-# 执行加载
-gdf, geojson, df, lookup = load_data()
+@st.cache_resource(max_entries=2)
+def build_map_figure(version):
+    """全局热力图与所选区域无关，每个数据版本构建一次后在所有重跑与会话之间共享"""
+    hourly, lookup, _ = load_data(version)
+    # 几何只以 URL 引用，浏览器单独下载一次并缓存，图表本身只包含数值数组
+    geojson = get_zone_geojson_url(shp_path)
 
-if gdf is None:
-    st.stop()
+    # A. 全局热力图数据聚合（只保留对照表中存在的区域）
+    totals = hourly.sum(axis=0)
+    zone_ids = lookup['LocationID'].to_numpy()
+
+    # 对数着色，悬停显示带千分位的原始数值
+    return pickup_choropleth(zone_ids, totals[zone_ids], lookup['Zone'].to_numpy(),
+                             lookup['Borough'].to_numpy(), geojson, zoom=10)
+
+
+@st.cache_resource(max_entries=2)
+def build_density_figure(version):
+    """点密度栅格图：服务端把全部上车点分箱成 PNG，浏览器只需绘制一张图片"""
+    from component.heatmap import build_density_map  # 栅格渲染依赖 pyarrow.parquet，切换到该模式时才导入
+    grid = get_density_grid(trips_path, shp_path)
+    return build_density_map(grid, zoom=10, center=MAP_CENTER)
 
-# 2. 仪表盘标题
+
+# 2. 仪表盘标题（先于数据加载发出，浏览器立即有首屏内容）
 st.title("🚖 NYC 出租车时空联动仪表盘")
 
+# 执行加载（数据增量更新发布新版本后自动换用新版本）
+data_version = watch_data_version(trips_path)
+with span("load_data"):
+    hourly, lookup, zone_to_id = load_data(data_version)
+
+if hourly is None:
+    st.stop()
+
 # 3. 侧边栏交互
 st.sidebar.header("筛选器")
-all_zones = sorted(lookup['Zone'].unique())
+all_zones = sorted(zone_to_id)
 selected_zone = st.sidebar.selectbox(
     "选择要分析的区域 (Zone):",
     all_zones,
     index=all_zones.index("Upper East Side South") if "Upper East Side South" in all_zones else 0
 )
 
-selected_id = lookup[lookup['Zone'] == selected_zone]['LocationID'].values[0]
-
-# --- 数据聚合与处理 ---
-# A. 全局热力图数据聚合
-map_data = df['PULocationID'].value_counts().reset_index(name='total_pickups')
-map_data.columns = ['LocationID', 'total_pickups']
-map_data = map_data.merge(lookup, on='LocationID')
+selected_id = zone_to_id[selected_zone]
 
-# 【关键改进】计算对数列，用于颜色映射
-map_data['log_pickups'] = np.log10(map_data['total_pickups'] + 1)
+map_mode = st.sidebar.radio("地图模式:", ["区域热力", "点密度栅格"], horizontal=True)
 
-# B. 选中区域的时间趋势数据聚合
-zone_hourly_data = df[df['PULocationID'] == selected_id].groupby('hour').size().reset_index(name='count')
-full_hours = pd.DataFrame({'hour': range(24)})
-zone_hourly_data = full_hours.merge(zone_hourly_data, on='hour', how='left').fillna(0)
+# --- 数据处理 ---
+# 选中区域的时间趋势直接取 小时 × 区域 矩阵的一列
+with span("aggregate"):
+    zone_hourly_data = pd.DataFrame({'hour': range(24), 'count': hourly[:, selected_id]})
 
 # 4. 页面布局
 col1, col2 = st.columns([1.2, 0.8])  # 调整比例让地图大一点
 
 with col1:
-    st.subheader(f"📍 区域热力分布 (对数缩放)")
-
-    # 颜色轴范围
-    max_log = map_data['log_pickups'].max()
-
-    fig_map = px.choropleth_map(
-        map_data,
-        geojson=geojson,
-        locations='LocationID',
-        featureidkey="properties.LocationID",
-        color='log_pickups',  # 使用对数列着色
-        color_continuous_scale="Viridis",  # 使用 Viridis 色系 (翠绿-黄)
-        range_color=[0, max_log],  # 锁定颜色范围
-        map_style="carto-positron",
-        zoom=10,
-        center={"lat": 40.7128, "lon": -74.0060},
-        opacity=0.7,
-        hover_name='Zone',
-        hover_data={
-            'log_pickups': False,  # 隐藏对数数值，不误导用户
-            'total_pickups': ':,d',  # 显示带千分位的原始数值
-            'Borough': True,
-            'LocationID': True
-        },
-        labels={'log_pickups': '热度指数'}
-    )
-
-    fig_map.update_layout(
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-        coloraxis_showscale=True
-    )
-    st.plotly_chart(fig_map, use_container_width=True)
+    if map_mode == "区域热力":
+        st.subheader(f"📍 区域热力分布 (对数缩放)")
+        with span("figure:map"):
+            map_fig = build_map_figure(data_version)
+        plotly_chart(map_fig, "map", use_container_width=True)
+    else:
+        st.subheader("📍 上车点密度 (服务端栅格化，对数缩放)")
+        with span("figure:density"):
+            density_fig = build_density_figure(data_version)
+        plotly_chart(density_fig, "density", use_container_width=True)
+    report_session_stats(page_start)
 
 with col2:
     st.subheader(f"📈 {selected_zone} 24小时趋势")
-    fig_line = px.line(
-        zone_hourly_data,
-        x='hour',
-        y='count',
-        markers=True,
-        labels={'hour': '小时 (0-23)', 'count': '接单量'},
-        template="plotly_white"
-    )
-    fig_line.update_traces(line_color='#FF4B4B', line_width=3)
-    fig_line.update_layout(xaxis=dict(tickmode='linear', tick0=0, dtick=4))
-    st.plotly_chart(fig_line, use_container_width=True)
+    with span("figure:trend"):
+        fig_line = hourly_trend(zone_hourly_data['count'])
+    plotly_chart(fig_line, "trend", use_container_width=True)
 
     # 统计指标卡片
     st.divider()
     m1, m2 = st.columns(2)
-    m1.metric("该区域全月总单量", f"{int(zone_hourly_data['count'].sum()):,}")
+    m1.metric("该区域总单量", f"{int(zone_hourly_data['count'].sum()):,}")
     m2.metric("高峰期单量 (Max)", f"{int(zone_hourly_data['count'].max()):,}")
 
-    st.info("💡 提示：在左侧侧边栏切换区域，或缩放地图查看细节。")
\ No newline at end of file
+    st.info("💡 提示：在左侧侧边栏切换区域，或缩放地图查看细节。")
+
+render_dev_panel()
@@ -1,93 +1,83 @@
 import pandas as pd
-import geopandas as gpd
-import plotly.express as px
 import os
-import json
-import numpy as np
+import sys
+import calendar
+import argparse
 
 # 1. 路径设置
 current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.aggregate_store import load_aggregates
+from component.animation import TIME_BINS, build_frame_animation, time_bin_frames
+from component.spatial_utils import load_zone_geojson
+from web.geo_assets import geojson_ref
+
 parquet_path = os.path.join(current_dir, '..', 'data', 'yellow_tripdata_2025-01.parquet')
 shp_path = os.path.join(current_dir, '..', 'data', 'taxi_zones.shp')
 lookup_path = os.path.join(current_dir, '..', 'data', 'taxi_zone_lookup.csv')
 
+# 标题中的时间粒度
+BIN_TITLES = {'hour': 'Hourly', '15min': '15-Minute', 'dow_hour': 'Weekday × Hour', 'day': 'Daily'}
 
-def create_animated_map():
-    # --- A. 加载地理边界 ---
-    print("正在加载地理数据...")
-    gdf = gpd.read_file(shp_path).to_crs(epsg=4326)
-    geojson = json.loads(gdf.to_json())
 
-    # --- B. 加载并处理行程数据 ---
-    print("正在处理行程数据（提取小时并聚合）...")
-    # 只读取需要的列，节省内存
-    df = pd.read_parquet(parquet_path, columns=['tpep_pickup_datetime', 'PULocationID'])
+def animation_title(store, binning):
+    """标题取自数据实际所属的月份 (数据集多个月汇总时列出起止月份) 和所选的时间粒度"""
+    if store.year is not None and store.month is not None:
+        period = f"{calendar.month_abbr[store.month]} {store.year}"
+    else:
+        months = sorted(store.meta.get('months') or [])
+        period = f"{months[0]} – {months[-1]}" if len(months) > 1 else (months[0] if months else "All Data")
+    return f"NYC Taxi {BIN_TITLES.get(binning, binning)} Pulse ({period})"
 
-    # 提取小时
-    df['tpep_pickup_datetime'] = pd.to_datetime(df['tpep_pickup_datetime'])
-    df['hour'] = df['tpep_pickup_datetime'].dt.hour
 
-    # 按 小时 和 区域 聚合
-    hourly_data = df.groupby(['hour', 'PULocationID']).size().reset_index(name='pickup_count')
+def create_animated_map(binning='hour', asset_url=None, asset_dir='geo_assets', data_path=parquet_path):
+    # --- A. 加载地理边界 ---
+    print("正在加载地理数据...")
+    # 读取缓存的简化边界（首次运行自动生成，之后无需 geopandas）
+    # 指定 asset_url 时几何发布为静态文件，HTML 中只保留 URL（需用 serve_geometry.py 等方式提供该目录）
+    geojson = geojson_ref(load_zone_geojson(shp_path), asset_dir, asset_url)
 
-    # 合并区域名称
-    lookup = pd.read_csv(lookup_path)
-    hourly_data = hourly_data.merge(lookup, left_on='PULocationID', right_on='LocationID')
+    # --- B. 加载预聚合数据并按时间粒度切帧 ---
+    print(f"正在加载预聚合数据（时间粒度: {binning}）...")
+    store = load_aggregates(data_path)
+    counts, labels = time_bin_frames(store, binning)  # (帧数, 区域)
 
     # --- C. 数据平滑处理（关键） ---
-    # 1. 确保所有小时、所有区域都有记录（即便没有订单也填0），防止动画闪烁
-    all_hours = pd.DataFrame({'hour': range(24)})
-    all_zones = lookup[['LocationID', 'Zone', 'Borough']]
-    grid = all_hours.assign(key=1).merge(all_zones.assign(key=1), on='key').drop('key', axis=1)
-
-    final_df = grid.merge(hourly_data[['hour', 'LocationID', 'pickup_count']],
-                          on=['hour', 'LocationID'], how='left').fillna(0)
-
-    # 2. 对数处理：让颜色变化在全天都明显
-    final_df['log_count'] = np.log10(final_df['pickup_count'] + 1)
+    # 1. 所有帧都包含全部区域（没有订单记为 0），防止动画闪烁
+    lookup = pd.read_csv(lookup_path)
+    zone_ids = lookup['LocationID'].to_numpy()
+    hover_names = lookup['Zone'].fillna("Unknown") + " (" + lookup['Borough'].fillna("Unknown") + ")"
 
     # --- D. 生成动画地图 ---
+    # 几何只发送一次，每一帧只包含一个 float32 的 z 数组
     print("正在生成动画渲染图...")
-
-    # 计算全局颜色范围，确保动画过程中颜色刻度是统一的
-    max_log = final_df['log_count'].max()
-
-    fig = px.choropleth_map(
-        final_df,
-        geojson=geojson,
-        locations='LocationID',
-        featureidkey="properties.LocationID",
-        color='log_count',
-        animation_frame='hour',  # 动画帧：按小时切换
-        color_continuous_scale="Viridis",
-        range_color=[0, max_log],  # 锁定颜色轴范围
-        map_style="carto-positron",
-        zoom=10,
-        center={"lat": 40.7128, "lon": -74.0060},
-        opacity=0.7,
-        hover_name='Zone',
-        hover_data={
-            'hour': True,
-            'LocationID': False,
-            'log_count': False,
-            'pickup_count': ':,d',
-            'Borough': True
-        },
-        title="NYC Taxi Hourly Pulse (Jan 2025)"
+    fig = build_frame_animation(
+        geojson,
+        locations=zone_ids,
+        counts=counts[:, zone_ids],
+        labels=labels,
+        hover_names=hover_names.to_numpy(),
+        title=animation_title(store, binning),
+        frame_duration=800,  # 播放速度(毫秒)
+        transition_duration=400  # 平滑过渡时间
     )
 
-    # --- 关键修正：删除之前手动添加的 updatemenus ---
-    # 下面的代码用于调整【自带】动画按钮的速度，而不会产生重复按钮
-    fig.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = 800  # 播放速度(毫秒)
-    fig.layout.updatemenus[0].buttons[0].args[1]['transition']['duration'] = 400  # 平滑过渡时间
-
-    fig.update_layout(margin={"r": 0, "t": 40, "l": 0, "b": 0})
-
-    output_file = "taxi_animated_pulse.html"
+    output_file = "taxi_animated_pulse.html" if binning == 'hour' else f"taxi_animated_pulse_{binning}.html"
     fig.write_html(output_file)
     print(f"完成！动画地图已保存至: {output_file}")
     fig.show()
 
 
 if __name__ == "__main__":
-    create_animated_map()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="NYC 出租车时间动画地图")
+    parser.add_argument('binning', nargs='?', default='hour', choices=TIME_BINS,
+                        help="时间粒度: hour / 15min / dow_hour / day")
+    parser.add_argument('--asset-url', default=None, help="几何静态文件的访问地址前缀, 不指定则内联到 HTML")
+    parser.add_argument('--asset-dir', default='geo_assets', help="几何静态文件的发布目录")
+    parser.add_argument('--data', default=parquet_path, help="某个月的 parquet 文件 (或数据集目录, 仅 hour / 15min)")
+    args = parser.parse_args()
+    if os.path.isdir(args.data) and args.binning not in ('hour', '15min'):
+        parser.error(f"数据集目录可能包含多个月, 时间粒度 {args.binning} 只支持单月 parquet 文件; 请使用 hour 或 15min")
+    create_animated_map(args.binning, args.asset_url, args.asset_dir, args.data)
+
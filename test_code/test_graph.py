@@ -1,31 +1,39 @@
 import pandas as pd
-import geopandas as gpd
 import plotly.express as px
 import os
-import json
+import sys
+import argparse
 import numpy as np  # 导入 numpy 处理对数
 
 # 路径设置
 current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.aggregate_store import load_aggregates
+from component.spatial_utils import load_zone_geojson
+from web.geo_assets import geojson_ref
+
 parquet_path = os.path.join(current_dir, '..', 'data', 'yellow_tripdata_2025-01.parquet')
 shp_path = os.path.join(current_dir, '..', 'data', 'taxi_zones.shp')
 lookup_path = os.path.join(current_dir, '..', 'data', 'taxi_zone_lookup.csv')
 
 
-def create_optimized_map():
+def create_optimized_map(asset_url=None, asset_dir='geo_assets'):
     # 1. 加载地理数据
     print("加载地图形状...")
-    gdf = gpd.read_file(shp_path).to_crs(epsg=4326)
-    geojson = json.loads(gdf.to_json())
+    # 读取缓存的简化边界（首次运行自动生成，之后无需 geopandas）
+    # 指定 asset_url 时几何发布为静态文件，HTML 中只保留 URL（需用 serve_geometry.py 等方式提供该目录）
+    geojson = geojson_ref(load_zone_geojson(shp_path), asset_dir, asset_url)
 
     # 2. 加载行程数据
     print("处理业务数据...")
-    df = pd.read_parquet(parquet_path)
+    store = load_aggregates(parquet_path)
     lookup = pd.read_csv(lookup_path)
 
-    # 统计上车人数
-    pickup_counts = df['PULocationID'].value_counts().reset_index()
-    pickup_counts.columns = ['LocationID', 'pickup_count']
+    # 统计上车人数（直接取预聚合的区域总量）
+    totals = store.zone_totals()
+    zone_ids = np.flatnonzero(totals)
+    pickup_counts = pd.DataFrame({'LocationID': zone_ids, 'pickup_count': totals[zone_ids]})
 
     # 合并区域名称 (让悬停信息更有意义)
     pickup_counts = pickup_counts.merge(lookup, on='LocationID', how='left')
@@ -68,4 +76,8 @@ def create_optimized_map():
 
 
 if __name__ == "__main__":
-    create_optimized_map()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="NYC 出租车上车热点地图")
+    parser.add_argument('--asset-url', default=None, help="几何静态文件的访问地址前缀, 不指定则内联到 HTML")
+    parser.add_argument('--asset-dir', default='geo_assets', help="几何静态文件的发布目录")
+    args = parser.parse_args()
+    create_optimized_map(args.asset_url, args.asset_dir)
@@ -65,39 +65,33 @@
 #         # 添加助手响应到历史
 #         messages.append({"role": "assistant", "content": assistant_response})
 
-from openai import OpenAI
+import asyncio
+import os
+import sys
 
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
 
-def call_llm(messages):
-    # 初始化客户端
-    # Ollama 默认运行在 11434 端口
-    # OpenAI 兼容模式的地址通常为 http://localhost:11434/v1
-    client = OpenAI(
-        api_key="ollama",  # Ollama 不需要真实的 key，但这必须是非空字符串
-        base_url="http://localhost:11434/v1",
-    )
+from component.llm_client import get_client
 
-    try:
-        stream = client.chat.completions.create(
-            model="llama3.1:latest",  # 修改为你本地 Ollama 中的模型名称
-            messages=messages,
-            # 超参数
-            temperature=0.7,
-            top_p=0.9,
-            max_tokens=5120,
-            frequency_penalty=0.5,
-            presence_penalty=0.5,
-            stream=True
-        )
+# 后端可选 ollama / lmstudio / gemini；LLM_BASE_URL 可指向本地桩服务器做测试
+BACKEND = os.environ.get("LLM_BACKEND", "ollama")
+
+
+def llm_client():
+    # 同一个后端复用一个带连接池的客户端，历史过长时自动截断
+    return get_client(BACKEND, base_url=os.environ.get("LLM_BASE_URL"))
 
+
+async def call_llm(messages):
+    client = llm_client()
+
+    try:
         full_response = []
         print("AI助手: ", end="", flush=True)
-        for chunk in stream:
-            # 兼容性处理：有些模型返回的 delta 可能为空
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                print(content, end="", flush=True)
-                full_response.append(content)
+        async for content in client.stream_chat(messages):
+            print(content, end="", flush=True)
+            full_response.append(content)
         print("\n")
         return "".join(full_response)
 
@@ -106,17 +100,17 @@ def call_llm(messages):
         return ""
 
 
-if __name__ == "__main__":
+async def main():
     # 初始化对话历史
     messages = [
         {"role": "system", "content": "你是一个有用的助手"}
     ]
 
-    print("--- 已连接到本地 Ollama (Llama 3.1) ---")
+    print(f"--- 已连接到 {BACKEND} ---")
 
     while True:
         try:
-            user_input = input("\n用户: ")
+            user_input = await asyncio.to_thread(input, "\n用户: ")
             if not user_input:  # 处理空输入
                 continue
 
@@ -125,12 +119,18 @@ if __name__ == "__main__":
 
             messages.append({"role": "user", "content": user_input})
 
-            assistant_response = call_llm(messages)
+            assistant_response = await call_llm(messages)
 
             # 只有在成功获取响应后才添加到历史记录
             if assistant_response:
                 messages.append({"role": "assistant", "content": assistant_response})
 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n程序已退出。")
             break
+
+    await llm_client().aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
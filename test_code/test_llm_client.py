@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import asyncio
+
+import httpx
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.llm_client import LLMClient, LLMError, ResponseCache, get_client, truncate_history
+
+
+class StubLLM:
+    """
+    进程内的 OpenAI 兼容桩服务 (通过 httpx.MockTransport 接入, 不监听端口):
+    回复为 "回复: <最后一条消息>", 流式请求按 SSE 分块返回; 记录收到的每个请求体。
+    """
+
+    def __init__(self, chunk_chars=3, fail_status=None):
+        self.chunk_chars = chunk_chars
+        self.fail_status = fail_status
+        self.requests = []
+        self.transport = httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        if self.fail_status is not None:
+            return httpx.Response(self.fail_status, text="stub error")
+        reply = "回复: " + payload['messages'][-1]['content']
+        if not payload.get('stream'):
+            return httpx.Response(200, json={'choices': [{'message': {'role': 'assistant', 'content': reply}}]})
+        return httpx.Response(200, headers={'Content-Type': 'text/event-stream'}, content=self._events(reply))
+
+    async def _events(self, reply):
+        for i in range(0, len(reply), self.chunk_chars):
+            delta = {'choices': [{'delta': {'content': reply[i:i + self.chunk_chars]}}]}
+            yield f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode('utf-8')
+            await asyncio.sleep(0)
+        # 空 delta 与结束标记
+        yield b'data: {"choices": [{"delta": {}}]}\n\n'
+        yield b"data: [DONE]\n\n"
+
+
+def make_client(stub, **kwargs):
+    return LLMClient('stub', base_url='http://stub/v1', api_key='test', model='stub-model',
+                     transport=stub.transport, **kwargs)
+
+
+def test_streaming():
+    asyncio.run(_streaming())
+
+
+async def _streaming():
+    stub = StubLLM()
+    client = make_client(stub)
+    pieces = [p async for p in client.stream_chat([{'role': 'user', 'content': '你好, 世界'}])]
+    assert len(pieces) > 1, pieces
+    assert ''.join(pieces) == "回复: 你好, 世界"
+    assert stub.requests[0]['stream'] is True and stub.requests[0]['model'] == 'stub-model'
+    await client.aclose()
+    print(f"流式输出: {len(pieces)} 个片段 -> 通过")
+
+
+def test_deterministic_cache():
+    asyncio.run(_deterministic_cache())
+
+
+async def _deterministic_cache():
+    stub = StubLLM()
+    client = make_client(stub)
+    messages = [{'role': 'user', 'content': '统计一月的订单量'}]
+    # temperature=0: 第二次 (无论是否流式) 直接命中缓存, 不再请求后端
+    first = await client.chat(messages, temperature=0)
+    second = await client.chat(messages, temperature=0)
+    streamed = ''.join([p async for p in client.stream_chat(messages, temperature=0)])
+    assert first == second == streamed
+    assert len(stub.requests) == 1, len(stub.requests)
+    # 非确定性请求不缓存; 参数不同的确定性请求也不会命中
+    await client.chat(messages, temperature=0.7)
+    await client.chat(messages, temperature=0.7)
+    await client.chat(messages, temperature=0, max_tokens=16)
+    assert len(stub.requests) == 4, len(stub.requests)
+    await client.aclose()
+    print("temperature=0 缓存 -> 通过")
+
+
+def test_error():
+    asyncio.run(_error())
+
+
+async def _error():
+    client = make_client(StubLLM(fail_status=503))
+    for call in (client.chat([{'role': 'user', 'content': 'x'}]),
+                 client.stream_chat([{'role': 'user', 'content': 'x'}]).__anext__()):
+        try:
+            await call
+        except LLMError as e:
+            assert '503' in str(e)
+        else:
+            raise AssertionError("后端出错时应抛出 LLMError")
+    await client.aclose()
+
+    # 连接失败、超时等传输层错误同样包装成 LLMError
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+    client = LLMClient('stub', base_url='http://stub/v1', api_key='test', model='stub-model',
+                       transport=httpx.MockTransport(refuse))
+    for call in (client.chat([{'role': 'user', 'content': 'x'}]),
+                 client.stream_chat([{'role': 'user', 'content': 'x'}]).__anext__()):
+        try:
+            await call
+        except LLMError as e:
+            assert isinstance(e.__cause__, httpx.ConnectError), repr(e.__cause__)
+        else:
+            raise AssertionError("连接失败时应抛出 LLMError")
+    await client.aclose()
+    print("后端错误 -> 通过")
+
+
+def test_truncation():
+    asyncio.run(_truncation())
+
+
+async def _truncation():
+    messages = [{'role': 'system', 'content': '你是一个有用的助手'}]
+    for i in range(20):
+        messages.append({'role': 'user', 'content': f'问题 {i} ' + 'x' * 100})
+        messages.append({'role': 'assistant', 'content': f'回答 {i} ' + 'y' * 100})
+        if i == 15:
+            messages.append({'role': 'system', 'content': '之后的回答请使用英文'})
+    messages.append({'role': 'user', 'content': '最后的问题'})
+
+    kept = truncate_history(messages, max_chars=1000)
+    assert kept[0] == messages[0], "开头的 system 提示词必须保留"
+    assert sum(len(m['content']) for m in kept) <= 1000
+    assert kept[-1] == messages[-1], "当前的用户输入必须保留"
+    # 保留下来的是原列表去掉开头之后的一段连续后缀, 顺序不变 (中间的 system 消息不会被提到前面)
+    assert kept[1:] == messages[len(messages) - len(kept) + 1:]
+    assert kept.index(messages[33]) > 1, "对话中间的 system 消息应留在原位置"
+    # 很长的当前输入也会保留
+    huge = [messages[0], {'role': 'user', 'content': 'z' * 5000}]
+    assert truncate_history(huge, max_chars=1000) == huge
+
+    # 客户端实际发送的是截断后的历史
+    stub = StubLLM()
+    client = make_client(stub, max_history_chars=1000)
+    await client.chat(messages)
+    assert stub.requests[0]['messages'] == kept
+    await client.aclose()
+    print(f"历史截断: {len(messages)} 条 -> {len(kept)} 条 -> 通过")
+
+
+def test_get_client():
+    asyncio.run(_get_client())
+
+
+async def _get_client():
+    default = get_client('ollama')
+    assert get_client('ollama', base_url=None) is default
+    other = get_client('ollama', base_url='http://127.0.0.1:9/v1')
+    assert other is not default and other.base_url == 'http://127.0.0.1:9/v1'
+    assert get_client('ollama', base_url='http://127.0.0.1:9/v1') is other
+    await default.aclose()
+    await other.aclose()
+    # 关闭后不再复用, 下一次取到的是新客户端
+    assert get_client('ollama') is not default
+    await get_client('ollama').aclose()
+    print("get_client 按参数复用 -> 通过")
+
+
+def test_cache_bound():
+    cache = ResponseCache(max_entries=2)
+    for key in ('a', 'b'):
+        cache.put(key, key.upper())
+    assert cache.get('a') == 'A'  # a 变为最近使用
+    cache.put('c', 'C')
+    assert cache.get('b') is None and cache.get('a') == 'A' and cache.get('c') == 'C'
+    print("内存缓存 LRU 上限 -> 通过")
+
+
+def main():
+    test_streaming()
+    test_deterministic_cache()
+    test_error()
+    test_truncation()
+    test_get_client()
+    test_cache_bound()
+
+
+# 用进程内桩服务检查 LLMClient, 不需要真实的模型后端:
+#   python test_llm_client.py  (或 pytest test_llm_client.py)
+if __name__ == "__main__":
+    main()
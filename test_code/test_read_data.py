@@ -1,14 +1,33 @@
 import pandas as pd
 import os
+import sys
+import time
 
 # 获取当前脚本的绝对路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.schema import normalize_trips, memory_report
+from component.data_summarizer import format_summary, summarize
 
 # 拼接处数据文件的绝对路径
 # .. 表示返回上一级目录 (NL2Vis)，然后进入 data 目录
 file_path = os.path.join(current_dir, '..', 'data', 'yellow_tripdata_2025-01.parquet')
 
 
+def test_summary():
+    try:
+        # 一次流式扫描得到各列概况（按文件指纹缓存，第二次直接读取缓存）
+        for attempt in ("首次", "缓存"):
+            start = time.perf_counter()
+            summary = summarize(file_path)
+            print(f"数据概况（{attempt}）耗时: {time.perf_counter() - start:.2f}s")
+        print("\n提供给模型的数据概况：")
+        print(format_summary(summary))
+    except FileNotFoundError:
+        print(f"错误：找不到文件，请检查路径是否正确: {file_path}")
+
+
 def test_read():
     try:
         # 读取 Parquet 文件
@@ -22,6 +41,11 @@ def test_read():
         print("\n数据形状:", df.shape)
         print("列名:", df.columns.tolist())
 
+        # 紧凑类型转换前后的内存对比
+        compact = normalize_trips(df)
+        print("\n紧凑类型内存对比 (字节)：")
+        print(memory_report(df, compact).to_string())
+
     except FileNotFoundError:
         print(f"错误：找不到文件，请检查路径是否正确: {file_path}")
     except Exception as e:
@@ -29,4 +53,6 @@ def test_read():
 
 
 if __name__ == "__main__":
+    test_summary()
+    print()
     test_read()
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+import sys
+import argparse
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.instrumentation import PERCENTILES, summarize_jsonl
+
+# 线上统计交互延迟:
+#   NLSTV_TRACE_FILE=/var/log/nlstv/trace.jsonl streamlit run test_dashboard.py
+#   python trace_report.py /var/log/nlstv/trace.jsonl
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="汇总各页面重跑与各阶段耗时的分位数 (ms)")
+    parser.add_argument('trace_file', help="NLSTV_TRACE_FILE 导出的 JSON lines 文件")
+    parser.add_argument('--percentiles', type=int, nargs='+', default=list(PERCENTILES))
+    args = parser.parse_args()
+
+    summary = summarize_jsonl(args.trace_file, tuple(args.percentiles))
+    width = max((len(name) for name in summary), default=10) + 2
+    columns = ['n'] + [f"p{q}" for q in args.percentiles] + ['max']
+    print(f"{'阶段':<{width - 2}}" + "".join(f"{c:>10}" for c in columns))
+    for name, stats in summary.items():
+        print(f"{name:<{width}}{stats['n']:>10}" + "".join(f"{stats[c]:>10.1f}" for c in columns[1:]))
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import argparse
+
+# 路径设置
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.path.join(current_dir, '..', 'data'))
+sys.path.append(os.path.abspath(os.path.join(current_dir, '..', 'NL-STV')))
+
+from component.aggregate_store import read_manifest, update_dataset_aggregates
+from component.cleaning import RULE_LABELS
+
+
+def apply_once(root, workers=1):
+    before = read_manifest(root)
+    t0 = time.perf_counter()
+    manifest = update_dataset_aggregates(root, workers=workers)
+    if manifest['version'] == before['version']:
+        return False
+    applied = sorted(set(manifest['files']) - set(before['files']))
+    print(f"[{time.strftime('%H:%M:%S')}] 发布版本 v{manifest['version']}: 新增 {len(applied)} 个文件, "
+          f"共 {len(manifest['files'])} 个文件 / {len(manifest['months'])} 个月, "
+          f"耗时 {time.perf_counter() - t0:.2f}s")
+    for rel in applied:
+        entry = manifest['files'][rel]
+        hits = ", ".join(f"{RULE_LABELS[r]} {c:,}" for r, c in entry.get('dropped_by_rule', {}).items() if c)
+        print(f"  + {rel}  ({entry['month']}, {entry['rows_seen']:,} 行, 丢弃 {entry['rows_dropped']:,}"
+              + (f": {hits})" if hits else ")"))
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把数据目录中新增的 parquet 文件增量合并进预聚合结果")
+    parser.add_argument('root', nargs='?', default=data_dir)
+    parser.add_argument('--watch', type=float, default=None, help="每隔多少秒检查一次新文件 (持续运行)")
+    parser.add_argument('--workers', type=int, default=1, help="每个文件按 row group 并行扫描的进程数")
+    args = parser.parse_args()
+
+    if not apply_once(args.root, args.workers):
+        print(f"没有新文件, 当前版本 v{read_manifest(args.root)['version']}")
+    while args.watch:
+        time.sleep(args.watch)
+        apply_once(args.root, args.workers)